@@ -0,0 +1,48 @@
+"""Helpers for migrations that build indexes without blocking writes
+
+These use CREATE/DROP INDEX CONCURRENTLY, which can't run inside a transaction,
+so call them from within `op.get_context().autocommit_block()`.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def create_index_concurrently(name: str, table: str, columns: list):
+    drop_invalid_index(name)
+    op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def create_partitioned_index_concurrently(name: str, table: str, columns: list[str]):
+    # Partitioned tables can't be indexed concurrently, so the index is created on each
+    # partition and attached to an index on the parent (which future partitions inherit).
+    # The parent index stays invalid, and so unused, until every partition is attached.
+    column_list = ", ".join(columns)
+    op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} ({column_list})")
+
+    for partition in partitions(table):
+        partition_index = f"{partition}_{'_'.join(columns)}_idx"
+        drop_invalid_index(partition_index)
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} ({column_list})")
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+
+def partitions(table: str) -> list[str]:
+    result = op.get_bind().execute(
+        sa.text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)"),
+        {"table": table},
+    )
+    return [row[0] for row in result]
+
+
+def drop_invalid_index(name: str):
+    # A CREATE INDEX CONCURRENTLY that failed part way (e.g. on a deadlock or when
+    # the migration was interrupted) leaves an INVALID index behind, which IF NOT
+    # EXISTS would then skip, so it's dropped here to be built again
+    valid = (
+        op.get_bind()
+        .execute(sa.text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name})
+        .scalar()
+    )
+    if valid is False:
+        op.execute(f"DROP INDEX CONCURRENTLY {name}")
@@ -0,0 +1,34 @@
+"""add index for de-duplicating articles by external id
+
+Revision ID: ddff09aa7090
+Revises: a09bfb1c0f31
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "ddff09aa7090"
+down_revision: Union[str, None] = "a09bfb1c0f31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Supports `DISTINCT ON (external_id, source) ... ORDER BY external_id, source, created_at DESC`
+# in DbArticleRepository._get_deduped_articles. The external id leads so that lookups by
+# external id alone (which don't specify a source) can still seek directly into the index.
+def upgrade() -> None:
+    op.create_index(
+        "ix_articles_external_id_source_created_at",
+        "articles",
+        ["external_id", "source", sa.text("created_at DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_articles_external_id_source_created_at", table_name="articles")
@@ -0,0 +1,29 @@
+"""add content hash column to articles
+
+Revision ID: fa123839ea52
+Revises: ddff09aa7090
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "fa123839ea52"
+down_revision: Union[str, None] = "ddff09aa7090"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Existing rows start out NULL, which never matches a computed hash, so each
+# article is rewritten (and gets its hash) the first time it's re-ingested.
+def upgrade() -> None:
+    op.add_column("articles", sa.Column("content_hash", sa.String, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("articles", "content_hash")
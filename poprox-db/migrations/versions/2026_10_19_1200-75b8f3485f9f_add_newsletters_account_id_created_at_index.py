@@ -0,0 +1,34 @@
+"""add index for finding each account's latest newsletters
+
+Revision ID: 75b8f3485f9f
+Revises: fa123839ea52
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "75b8f3485f9f"
+down_revision: Union[str, None] = "fa123839ea52"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Supports `DISTINCT ON (account_id) ... ORDER BY account_id, created_at DESC` in
+# DbNewsletterRepository.fetch_most_recent_newsletters, as well as the per-account
+# lookups in fetch_most_recent_newsletter and fetch_newsletters.
+def upgrade() -> None:
+    op.create_index(
+        "ix_newsletters_account_id_created_at",
+        "newsletters",
+        ["account_id", sa.text("created_at DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_newsletters_account_id_created_at", table_name="newsletters")
@@ -0,0 +1,33 @@
+"""add a reference to newsletter HTML stored in S3
+
+Revision ID: 9c2b3550ed30
+Revises: 75b8f3485f9f
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c2b3550ed30"
+down_revision: Union[str, None] = "75b8f3485f9f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Newsletters stored with NEWSLETTER_HTML_BUCKET set keep their rendered HTML in a
+# compressed S3 object and only store its URI here, leaving `html` null. Existing
+# rows can be moved over with DbNewsletterRepository.backfill_newsletter_html.
+def upgrade() -> None:
+    op.add_column("newsletters", sa.Column("html_ref", sa.String, nullable=True))
+    op.alter_column("newsletters", "html", nullable=True)
+
+
+def downgrade() -> None:
+    # Any HTML that was moved to S3 has to be copied back before downgrading
+    op.alter_column("newsletters", "html", nullable=False)
+    op.drop_column("newsletters", "html_ref")
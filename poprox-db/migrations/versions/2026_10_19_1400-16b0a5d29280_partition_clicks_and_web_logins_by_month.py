@@ -0,0 +1,126 @@
+"""partition clicks and web_logins by month
+
+Revision ID: 16b0a5d29280
+Revises: 9c2b3550ed30
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "16b0a5d29280"
+down_revision: Union[str, None] = "9c2b3550ed30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+# Each partitioned table's id column and the foreign keys to recreate on it
+PARTITIONED_TABLES = {
+    "clicks": (
+        "click_id",
+        [
+            ("fk_click_account", "account_id", "accounts"),
+            ("fk_click_newsletter", "newsletter_id", "newsletters"),
+            ("fk_click_article", "article_id", "articles"),
+            ("fk_clicks_impression_id", "impression_id", "impressions"),
+        ],
+    ),
+    "web_logins": (
+        "web_login_id",
+        [
+            ("fk_web_logins_accounts_account_id", "account_id", "accounts"),
+            ("fk_web_logins_newsletters_newsletter_id", "newsletter_id", "newsletters"),
+        ],
+    ),
+}
+
+# Newsletters and impressions are left unpartitioned: they're referenced by foreign
+# keys, and a unique key on a partitioned table has to include the partition key,
+# so every referencing table would need to carry created_at as well.
+
+
+def upgrade() -> None:
+    # Creates any missing monthly partitions (named e.g. clicks_2026_10) of `parent`
+    # for the months from `from_month` through `to_month`, returning their names
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, from_month date, to_month date)
+        RETURNS SETOF text
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            month date := date_trunc('month', from_month);
+            partition_name text;
+        BEGIN
+            WHILE month <= to_month LOOP
+                partition_name := format('%s_%s', parent, to_char(month, 'YYYY_MM'));
+                IF to_regclass(partition_name) IS NULL THEN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, parent, month, (month + interval '1 month')::date
+                    );
+                    RETURN NEXT partition_name;
+                END IF;
+                month := month + interval '1 month';
+            END LOOP;
+        END;
+        $$;
+        """
+    )
+    # Run periodically (see poprox_storage.repositories.data_stores.partitions) so
+    # partitions always exist ahead of the rows that will land in them
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, months_ahead integer DEFAULT {MONTHS_AHEAD})
+        RETURNS SETOF text
+        LANGUAGE sql AS $$
+            SELECT create_monthly_partitions(
+                parent, current_date, (current_date + make_interval(months => months_ahead))::date
+            );
+        $$;
+        """
+    )
+
+    for table, (id_column, foreign_keys) in PARTITIONED_TABLES.items():
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned;")
+        op.execute(
+            f"CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);"
+        )
+        op.execute(
+            f"""
+            SELECT create_monthly_partitions(
+                '{table}',
+                coalesce((SELECT min(created_at) FROM {table}_unpartitioned), now())::date,
+                (now() + interval '{MONTHS_AHEAD} months')::date
+            );
+            """
+        )
+        # Catches rows outside every monthly partition, so an insert never fails
+        # because the partition maintenance job fell behind
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;")
+
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned;")
+        op.execute(f"DROP TABLE {table}_unpartitioned;")
+
+        op.create_primary_key(f"{table}_pkey", table, [id_column, "created_at"])
+        for name, column, referred_table in foreign_keys:
+            op.create_foreign_key(name, table, referred_table, [column], [column])
+
+
+def downgrade() -> None:
+    for table, (id_column, foreign_keys) in PARTITIONED_TABLES.items():
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned;")
+        op.execute(f"CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS);")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned;")
+        op.execute(f"DROP TABLE {table}_partitioned;")
+
+        op.create_primary_key(f"{table}_pkey", table, [id_column])
+        for name, column, referred_table in foreign_keys:
+            op.create_foreign_key(name, table, referred_table, [column], [column])
+
+    op.execute("DROP FUNCTION ensure_monthly_partitions(text, integer);")
+    op.execute("DROP FUNCTION create_monthly_partitions(text, date, date);")
@@ -0,0 +1,59 @@
+"""add indexes for lookups that were scanning whole tables
+
+Revision ID: 51c9f8abbec5
+Revises: 16b0a5d29280
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.concurrent_indexes import create_index_concurrently, create_partitioned_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = "51c9f8abbec5"
+down_revision: Union[str, None] = "16b0a5d29280"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Each of these predicates was only covered by a unique constraint where the
+# column isn't the leading one, so the planner fell back to sequential scans
+# (see tests/data/query_plans.toml)
+INDEXES = [
+    # Click redirects resolve articles by URL (uq_articles is (title, url))
+    ("ix_articles_url", "articles", ["url"]),
+    # Mentions are fetched by article (uq_mentions leads with entity_id)
+    ("ix_mentions_article_id", "mentions", ["article_id"]),
+    # JSON hydration of newsletters gathers each section's impressions
+    ("ix_impressions_impressed_section_id", "impressions", ["impressed_section_id"]),
+]
+
+# Built on each partition and attached to the parent (see concurrent_indexes.py)
+PARTITIONED_INDEXES = [
+    # DbClicksRepository.fetch_clicks_by_newsletter_ids
+    ("ix_clicks_newsletter_id", "clicks", ["newsletter_id"]),
+]
+
+
+def upgrade() -> None:
+    # These tables take writes all day, so the indexes are built without blocking them
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            create_index_concurrently(name, table, columns)
+
+        for name, table, columns in PARTITIONED_INDEXES:
+            create_partitioned_index_concurrently(name, table, columns)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(PARTITIONED_INDEXES):
+            # Dropping the parent index drops its partitions' indexes as well
+            op.drop_index(name, table_name=table, if_exists=True)
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,75 @@
+"""add indexes for time-windowed and per-account queries
+
+Revision ID: a9a28121f891
+Revises: 51c9f8abbec5
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.concurrent_indexes import create_index_concurrently, create_partitioned_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a9a28121f891"
+down_revision: Union[str, None] = "51c9f8abbec5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns) for each index, with the queries it supports. Each one has
+# a case in tests/data/query_plans.toml that checks it's used and measures its effect.
+INDEXES = [
+    # DbArticleRepository.fetch_articles_since/before
+    ("ix_articles_published_at", "articles", ["published_at"]),
+    # DbArticleRepository.fetch_articles_ingested_*, fetch_mentions_ingested_between
+    ("ix_articles_created_at", "articles", ["created_at"]),
+    # account_current_interest_view (DISTINCT ON account and entity, newest first) and
+    # DbAccountInterestRepository.fetch_topic_preference_history
+    (
+        "ix_account_interest_log_account_entity_created_at",
+        "account_interest_log",
+        ["account_id", "entity_id", sa.text("created_at DESC")],
+    ),
+    # DbExperimentRepository._fetch_assignments_by_group_ids
+    ("ix_expt_assignments_group_id", "expt_assignments", ["group_id"]),
+    # DbExperimentRepository.update_expt_assignment_to_opt_out and fetch_assignments_between
+    ("ix_expt_assignments_account_id", "expt_assignments", ["account_id"]),
+    # DbQualtricsSurveyRepository.fetch_sent_survey_instances and the clean response fetches
+    ("ix_qualtrics_survey_instances_account_id", "qualtrics_survey_instances", ["account_id"]),
+    # DbQualtricsSurveyRepository._fetch_survey_responses
+    ("ix_qualtrics_survey_responses_survey_instance_id", "qualtrics_survey_responses", ["survey_instance_id"]),
+]
+
+# Built on each partition and attached to the parent (see concurrent_indexes.py)
+PARTITIONED_INDEXES = [
+    # DbClicksRepository.fetch_clicks, fetch_clicks_between and fetch_clicks_on_newsletters_between
+    ("ix_clicks_account_id_created_at", "clicks", ["account_id", "created_at"]),
+    # DbAccountRepository.fetch_logins_between
+    ("ix_web_logins_account_id_created_at", "web_logins", ["account_id", "created_at"]),
+]
+
+# Not added: impressions(newsletter_id) is already the leading column of
+# uq_newsletter_position, and newsletters(account_id, created_at) was added in 75b8f3485f9f.
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            create_index_concurrently(name, table, columns)
+
+        for name, table, columns in PARTITIONED_INDEXES:
+            create_partitioned_index_concurrently(name, table, columns)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(PARTITIONED_INDEXES):
+            # Dropping the parent index drops its partitions' indexes as well
+            op.drop_index(name, table_name=table, if_exists=True)
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,68 @@
+"""track row updates for incremental exports
+
+Revision ID: 17c3a4a234f4
+Revises: a9a28121f891
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.concurrent_indexes import create_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = "17c3a4a234f4"
+down_revision: Union[str, None] = "a9a28121f891"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Tables exported incrementally whose rows change after they're created (account status,
+# subscription and consent end dates, experiment opt-outs). The append-only tables
+# (newsletters, clicks, web_logins) are exported by `created_at` instead.
+TABLES = ["accounts", "subscriptions", "account_consent_log", "expt_assignments"]
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := NOW();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+    for table in TABLES:
+        op.add_column(table, sa.Column("updated_at", sa.DateTime, nullable=False, server_default=sa.text("NOW()")))
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_set_updated_at
+            BEFORE UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION set_updated_at()
+            """
+        )
+
+    # Accounts and subscriptions are written to all day, so the indexes are built
+    # without blocking them
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            create_index_concurrently(f"ix_{table}_updated_at", table, ["updated_at"])
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.drop_index(f"ix_{table}_updated_at", table_name=table, postgresql_concurrently=True, if_exists=True)
+
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_set_updated_at ON {table}")
+        op.drop_column(table, "updated_at")
+
+    op.execute("DROP FUNCTION IF EXISTS set_updated_at()")
@@ -0,0 +1,98 @@
+"""stamp ingestion time for incremental exports
+
+Revision ID: c12f6be8dac1
+Revises: 17c3a4a234f4
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.concurrent_indexes import create_partitioned_index_concurrently, partitions
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c12f6be8dac1"
+down_revision: Union[str, None] = "17c3a4a234f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Append-only tables whose `created_at` comes from the event, not from when the row
+# was written (queued tracking events can be stored minutes or hours later), so
+# incremental exports window them on `ingested_at` instead
+INGESTED_TABLES = ["clicks", "web_logins"]
+
+# Tables whose `updated_at` is kept current by the set_updated_at() trigger
+UPDATED_TABLES = ["accounts", "subscriptions", "account_consent_log", "expt_assignments"]
+
+# Rows backfilled per transaction, to keep each UPDATE's row locks short
+BACKFILL_BATCH_SIZE = 10_000
+
+
+def upgrade() -> None:
+    # clock_timestamp() is the time of the statement itself, where NOW() is the
+    # start of its transaction, which can be arbitrarily far behind the commit
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := clock_timestamp();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in UPDATED_TABLES:
+        op.alter_column(table, "updated_at", server_default=sa.text("clock_timestamp()"))
+
+    for table in INGESTED_TABLES:
+        # Added without a default and then given one, so existing rows aren't rewritten
+        # while the table is locked, and are backfilled from `created_at` afterwards
+        op.add_column(table, sa.Column("ingested_at", sa.DateTime, nullable=True))
+        op.alter_column(table, "ingested_at", server_default=sa.text("clock_timestamp()"))
+
+    # Each backfill batch commits on its own, so the ACCESS EXCLUSIVE lock taken by
+    # ADD COLUMN is released first and writes carry on while old rows are filled in.
+    # Indexes are built on each partition and attached to the parent (see
+    # concurrent_indexes.py), after the backfill so it doesn't have to maintain them.
+    with op.get_context().autocommit_block():
+        for table in INGESTED_TABLES:
+            for partition in partitions(table):
+                _backfill_ingested_at(partition)
+            create_partitioned_index_concurrently(f"ix_{table}_ingested_at", table, ["ingested_at"])
+
+
+def downgrade() -> None:
+    for table in INGESTED_TABLES:
+        # Dropping the parent index drops its partitions' indexes as well
+        op.drop_index(f"ix_{table}_ingested_at", table_name=table, if_exists=True)
+        op.drop_column(table, "ingested_at")
+
+    for table in UPDATED_TABLES:
+        op.alter_column(table, "updated_at", server_default=sa.text("NOW()"))
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := NOW();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def _backfill_ingested_at(partition: str):
+    # Rows written since the column was added get the default, so this runs out
+    backfill = sa.text(
+        f"""
+        UPDATE {partition} SET ingested_at = created_at
+        WHERE ctid IN (SELECT ctid FROM {partition} WHERE ingested_at IS NULL LIMIT :batch_size)
+        """
+    )
+    while op.get_bind().execute(backfill, {"batch_size": BACKFILL_BATCH_SIZE}).rowcount:
+        pass
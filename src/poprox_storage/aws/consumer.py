@@ -0,0 +1,163 @@
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict
+
+from poprox_storage.aws.sqs import SQS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+@dataclass
+class ConsumerStats:
+    received: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    empty_polls: int = 0
+    visibility_extensions: int = 0
+    handler_seconds: float = 0.0
+    max_lag_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def throughput(self) -> float:
+        """Messages successfully handled per second since the consumer started"""
+        elapsed = time.perf_counter() - self.started_at
+        return self.succeeded / elapsed if elapsed else 0.0
+
+    @property
+    def mean_handler_seconds(self) -> float:
+        handled = self.succeeded + self.failed
+        return self.handler_seconds / handled if handled else 0.0
+
+
+class SQSConsumer:
+    """
+    Long-polls an SQS queue and hands each message to `handler` on a pool of threads
+
+    Messages whose handler returns without raising are deleted in batches. Messages
+    whose handler raises are left on the queue, so SQS re-delivers them after their
+    visibility timeout (and eventually moves them to the queue's dead-letter queue,
+    if it has one). While handlers are still running, the consumer keeps extending
+    the visibility timeout of their messages so slow handlers don't cause duplicates.
+
+    The thread pool is started by the first poll and shut down when `run` returns,
+    so `run` can be called again. Callers driving `poll_once` themselves should
+    call `close` when they're done, or use the consumer as a context manager.
+    """
+
+    def __init__(
+        self,
+        queue: SQS,
+        queue_url: str,
+        handler: Callable[[Dict], None],
+        *,
+        max_workers: int = 10,
+        wait_time_seconds: int = 20,
+        visibility_timeout: int = 60,
+    ):
+        self.queue = queue
+        self.queue_url = queue_url
+        self.handler = handler
+        self.max_workers = max_workers
+        self.wait_time_seconds = wait_time_seconds
+        self.visibility_timeout = visibility_timeout
+        self.stats = ConsumerStats()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def __enter__(self) -> "SQSConsumer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Wait for running handlers to finish and shut down the thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def run(self, max_polls: int | None = None, *, stop_when_empty: bool = False) -> ConsumerStats:
+        """
+        Poll and process messages until `max_polls` polls have been made, or until
+        a poll comes back empty when `stop_when_empty` is set
+        """
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                processed = self.poll_once()
+                polls += 1
+                if stop_when_empty and processed == 0:
+                    break
+        finally:
+            self.close()
+
+        logger.info(
+            f"Consumed {self.stats.received} messages from {self.queue_url}: {self.stats.succeeded} succeeded, "
+            f"{self.stats.failed} failed, {self.stats.throughput:.1f} messages/s, "
+            f"max lag {self.stats.max_lag_seconds:.1f}s"
+        )
+        return self.stats
+
+    def poll_once(self) -> int:
+        """Receive a batch of up to 10 messages, process them concurrently, and delete the successes"""
+        messages = self.queue.receive_message(
+            self.queue_url,
+            max_number_of_messages=10,
+            wait_time_seconds=self.wait_time_seconds,
+            visibility_timeout=self.visibility_timeout,
+            attribute_names=["SentTimestamp", "ApproximateReceiveCount"],
+        )
+        if not messages:
+            self.stats.empty_polls += 1
+            return 0
+
+        self.stats.received += len(messages)
+        now = time.time()
+        for message in messages:
+            sent_timestamp = message.get("Attributes", {}).get("SentTimestamp")
+            if sent_timestamp:
+                lag = now - int(sent_timestamp) / 1000
+                self.stats.max_lag_seconds = max(self.stats.max_lag_seconds, lag)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {self._executor.submit(self._handle, message): message for message in messages}
+
+        # Wake up at half the visibility timeout to keep slow messages hidden
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=self.visibility_timeout / 2)
+            if pending:
+                handles = [futures[future]["ReceiptHandle"] for future in pending]
+                self.queue.change_message_visibility_batch(self.queue_url, handles, self.visibility_timeout)
+                self.stats.visibility_extensions += len(handles)
+
+        succeeded = []
+        for future, message in futures.items():
+            ok, elapsed = future.result()
+            self.stats.handler_seconds += elapsed
+            if ok:
+                succeeded.append(message["ReceiptHandle"])
+        self.stats.succeeded += len(succeeded)
+        self.stats.failed += len(messages) - len(succeeded)
+
+        if succeeded:
+            response = self.queue.delete_message_batch(self.queue_url, succeeded)
+            if response["Failed"]:
+                logger.warning(f"Failed to delete {len(response['Failed'])} handled messages from {self.queue_url}")
+
+        return len(messages)
+
+    def _handle(self, message: Dict) -> tuple[bool, float]:
+        start = time.perf_counter()
+        try:
+            self.handler(message)
+            ok = True
+        except Exception as exc:
+            logger.error(f"Error handling message {message.get('MessageId')}: {exc}")
+            ok = False
+        return ok, time.perf_counter() - start
@@ -1,19 +1,30 @@
 import json
 import logging
 import os
-from uuid import UUID
+from datetime import datetime
+from uuid import UUID, uuid4
 
 from poprox_concepts.api.recommendations.versions import ProtocolVersions
+from poprox_concepts.api.tracking import LoginLinkData
 from poprox_concepts.domain import Account
-from poprox_storage.aws import sqs
+from poprox_storage.aws import s3, sqs
+from poprox_storage.aws.sqs import BatchSendReport
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 RECS_QUEUE_URL = os.getenv("GENERATE_RECS_QUEUE_URL")
 SEND_EMAIL_QUEUE_URL = os.getenv("SEND_EMAIL_QUEUE_URL")
+TRACKING_EVENTS_QUEUE_URL = os.getenv("TRACKING_EVENTS_QUEUE_URL")
 EMAIL_FROM = ("POPROX News", "no-reply@poprox.ai")
 
+# Email bodies larger than the threshold are stored in S3 (when a bucket is configured)
+# and the queued message carries a reference to them, to stay well under the SQS size limit
+EMAIL_BODY_BUCKET = os.getenv("EMAIL_BODY_BUCKET")
+EMAIL_BODY_PREFIX = os.getenv("EMAIL_BODY_PREFIX", "email-bodies")
+EMAIL_BODY_OFFLOAD_BYTES = int(os.getenv("EMAIL_BODY_OFFLOAD_BYTES", 64 * 1024))
+EMAIL_BODY_COMPRESSION = os.getenv("EMAIL_BODY_COMPRESSION", "gzip")
+
 DEFAULT_API_VERSION = ProtocolVersions.VERSION_2_0
 DEFAULT_ENDPOINT_URL = os.getenv("POPROX_DEFAULT_ENDPOINT_URL")
 
@@ -22,7 +33,7 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def enqueue_newsletter_request(
+def build_newsletter_request(
     account_id: UUID,
     profile_id: UUID,
     group_id: UUID,
@@ -34,8 +45,8 @@ def enqueue_newsletter_request(
     api_version: ProtocolVersions = DEFAULT_API_VERSION,
     compensation_banner: bool = False,
     template: str = None,
-):
-    message = json.dumps(
+) -> str:
+    return json.dumps(
         {
             "account_id": str(account_id),
             "profile_id": str(profile_id),
@@ -50,26 +61,83 @@ def enqueue_newsletter_request(
         }
     )
 
+
+def enqueue_newsletter_request(
+    account_id: UUID,
+    profile_id: UUID,
+    group_id: UUID,
+    recommender_url: str,
+    *,
+    treatment_id: UUID | None = None,
+    experience_id: UUID | None = None,
+    endpoint_warm: bool = False,
+    api_version: ProtocolVersions = DEFAULT_API_VERSION,
+    compensation_banner: bool = False,
+    template: str = None,
+):
+    message = build_newsletter_request(
+        account_id,
+        profile_id,
+        group_id,
+        recommender_url,
+        treatment_id=treatment_id,
+        experience_id=experience_id,
+        endpoint_warm=endpoint_warm,
+        api_version=api_version,
+        compensation_banner=compensation_banner,
+        template=template,
+    )
+
     if RECS_QUEUE_URL:
         sqs.send_message(queue_url=RECS_QUEUE_URL, message_body=message)
     else:
         logger.warning("Skipping newsletter request since queue URL isn't configured.")
 
 
+def enqueue_newsletter_requests(messages: list[str], *, max_workers: int = 8) -> BatchSendReport | None:
+    """
+    Queue many newsletter requests (built with `build_newsletter_request`) at once,
+    in concurrent batches of 10 with retries for any messages SQS fails to accept
+
+    Returns a report of how many were sent, which failed, and the send throughput.
+    """
+    if not RECS_QUEUE_URL:
+        logger.warning("Skipping newsletter requests since queue URL isn't configured.")
+        return None
+
+    report = sqs.send_messages(RECS_QUEUE_URL, messages, max_workers=max_workers)
+    if report.failed:
+        logger.error(f"Failed to queue {len(report.failed)} of {len(messages)} newsletter requests")
+    return report
+
+
 def enqueue_email(newsletter_id, account: Account, email_subject, html, unsubscribe_link):
-    message = json.dumps(
-        {
-            "newsletter_id": str(newsletter_id),
-            "account_id": str(account.account_id),
-            "email_to": account.email,
-            "email_subject": email_subject,
-            "email_body": html,
-            "unsubscribe_link": unsubscribe_link,
-        }
-    )
+    message = {
+        "newsletter_id": str(newsletter_id),
+        "account_id": str(account.account_id),
+        "email_to": account.email,
+        "email_subject": email_subject,
+        "email_body": html,
+        "unsubscribe_link": unsubscribe_link,
+    }
 
     if SEND_EMAIL_QUEUE_URL:
-        sqs.send_message(queue_url=SEND_EMAIL_QUEUE_URL, message_body=message)
+        if EMAIL_BODY_BUCKET and len(html.encode("utf-8")) >= EMAIL_BODY_OFFLOAD_BYTES:
+            stored = s3.put_content_addressed(
+                EMAIL_BODY_BUCKET,
+                EMAIL_BODY_PREFIX,
+                html.encode("utf-8"),
+                compression=EMAIL_BODY_COMPRESSION,
+                suffix=".html",
+            )
+            message["email_body"] = None
+            message["email_body_ref"] = {"bucket": stored.bucket_name, "key": stored.key}
+            logger.info(
+                f"Stored email body for newsletter {newsletter_id} at {stored.uri} "
+                f"({stored.size} bytes, {stored.stored_size} compressed, {stored.bytes_saved} bytes saved)"
+            )
+
+        sqs.send_message(queue_url=SEND_EMAIL_QUEUE_URL, message_body=json.dumps(message))
     else:
         logger.error(
             "No SEND_EMAIL_QUEUE_URL is provided. This is OK in development, "
@@ -79,3 +147,81 @@ def enqueue_email(newsletter_id, account: Account, email_subject, html, unsubscr
         logger.warning("to: " + account.email)
         logger.warning("subject: " + email_subject)
         logger.warning(html)
+
+
+def fetch_email_body(message: dict) -> str:
+    """
+    Get the HTML body of a message queued by `enqueue_email`, fetching and
+    decompressing it from S3 if it was too large to send inline
+    """
+    body_ref = message.get("email_body_ref")
+    if body_ref:
+        return s3.get_decompressed(body_ref["bucket"], body_ref["key"]).decode("utf-8")
+    return message["email_body"]
+
+
+def enqueue_click(
+    newsletter_id: UUID | None,
+    account_id: UUID,
+    article_id: UUID,
+    *,
+    impression_id: UUID | None = None,
+    headers: dict | None = None,
+    created_at: datetime | None = None,
+) -> UUID | None:
+    """
+    Queue a click to be written to the database in bulk by `TrackingEventConsumer`
+
+    Returns the event id (which becomes the click id), or None if the tracking
+    queue isn't configured and the caller should store the click directly.
+    """
+    return _enqueue_tracking_event(
+        "click",
+        {
+            "account_id": str(account_id),
+            "newsletter_id": str(newsletter_id) if newsletter_id else None,
+            "impression_id": str(impression_id) if impression_id else None,
+            "article_id": str(article_id),
+            "headers": headers,
+        },
+        created_at,
+    )
+
+
+def enqueue_login(link_data: LoginLinkData, created_at: datetime | None = None) -> UUID | None:
+    """
+    Queue a web login to be written to the database in bulk by `TrackingEventConsumer`
+
+    Returns the event id (which becomes the web login id), or None if the tracking
+    queue isn't configured and the caller should store the login directly.
+    """
+    return _enqueue_tracking_event(
+        "login",
+        {
+            "account_id": str(link_data.account_id),
+            "newsletter_id": str(link_data.newsletter_id) if link_data.newsletter_id else None,
+            "endpoint": link_data.endpoint,
+            "data": link_data.data,
+        },
+        created_at,
+    )
+
+
+def _enqueue_tracking_event(event_type: str, data: dict, created_at: datetime | None) -> UUID | None:
+    if not TRACKING_EVENTS_QUEUE_URL:
+        logger.warning(f"Skipping {event_type} event since tracking queue URL isn't configured.")
+        return None
+
+    # The event id and timestamp are assigned here, rather than by the database,
+    # so that re-delivered messages insert identical rows and can be skipped
+    event_id = uuid4()
+    message = json.dumps(
+        {
+            "event_id": str(event_id),
+            "event_type": event_type,
+            "created_at": (created_at or datetime.now()).isoformat(),
+            "data": data,
+        }
+    )
+    sqs.send_message(queue_url=TRACKING_EVENTS_QUEUE_URL, message_body=message)
+    return event_id
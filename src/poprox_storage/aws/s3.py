@@ -1,8 +1,31 @@
+import gzip
+import hashlib
+from dataclasses import dataclass
+
 import boto3
 from botocore import exceptions
 
 from poprox_storage.aws.exceptions import PoproxAwsUtilitiesException
 
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+@dataclass
+class ContentAddressedObject:
+    bucket_name: str
+    key: str
+    compression: str
+    size: int
+    stored_size: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.size - self.stored_size
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket_name}/{self.key}"
+
 
 class S3:
     def __init__(self, session: boto3.Session):
@@ -44,10 +67,68 @@ class S3:
             if next_token is None:
                 return objects
 
-    def put_object(self, bucket_name: str, key: str, body: bytes) -> dict:
-        """Put the object in the bucket"""
+    def put_object(self, bucket_name: str, key: str, body: bytes, **kwargs) -> dict:
+        """Put the object in the bucket. kwargs are passed to the underlying boto3 put_object method"""
         try:
-            return self.s3_client.put_object(Bucket=bucket_name, Key=key, Body=body)
+            return self.s3_client.put_object(Bucket=bucket_name, Key=key, Body=body, **kwargs)
         except exceptions.ClientError as e:
             msg = f"Error putting object {key} in {bucket_name}: {e}"
             raise PoproxAwsUtilitiesException(msg) from e
+
+    def put_content_addressed(
+        self, bucket_name: str, prefix: str, body: bytes, *, compression: str = "gzip", suffix: str = ""
+    ) -> ContentAddressedObject:
+        """
+        Compress and store the body under a key derived from the SHA-256 hash of its
+        uncompressed contents, so identical bodies are only ever stored once
+        """
+        _check_compression(compression)
+        digest = hashlib.sha256(body).hexdigest()
+        key = f"{prefix.rstrip('/')}/{digest}{suffix}{COMPRESSION_EXTENSIONS[compression]}"
+        compressed = compress(body, compression)
+        self.put_object(bucket_name, key, compressed)
+        return ContentAddressedObject(
+            bucket_name=bucket_name,
+            key=key,
+            compression=compression,
+            size=len(body),
+            stored_size=len(compressed),
+        )
+
+    def get_decompressed(self, bucket_name: str, key: str) -> bytes:
+        """Get an object stored by `put_content_addressed`, decompressing it based on its key's extension"""
+        body = self.get_object(bucket_name, key)["Body"].read()
+        for compression, extension in COMPRESSION_EXTENSIONS.items():
+            if key.endswith(extension):
+                return decompress(body, compression)
+        return body
+
+
+def compress(body: bytes, compression: str = "gzip") -> bytes:
+    _check_compression(compression)
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor().compress(body)
+    return gzip.compress(body)
+
+
+def decompress(body: bytes, compression: str = "gzip") -> bytes:
+    _check_compression(compression)
+    if compression == "zstd":
+        return _zstandard().ZstdDecompressor().decompress(body)
+    return gzip.decompress(body)
+
+
+def _check_compression(compression: str):
+    if compression not in COMPRESSION_EXTENSIONS:
+        msg = f"Unsupported compression: {compression!r} (expected one of {', '.join(COMPRESSION_EXTENSIONS)})"
+        raise ValueError(msg)
+
+
+def _zstandard():
+    # zstd compression is optional, so the package is only needed by those who use it
+    try:
+        import zstandard
+    except ImportError as exc:
+        msg = "zstd compression requires the zstandard package (pip install 'poprox-storage[zstd]')"
+        raise ImportError(msg) from exc
+    return zstandard
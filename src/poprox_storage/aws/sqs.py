@@ -1,11 +1,36 @@
 import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Lock
 from typing import Dict, List, Optional, Union
+from uuid import uuid4
 
 import boto3
 from botocore import exceptions
 
 from .exceptions import PoproxAwsUtilitiesException
 
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# SQS accepts at most 10 entries per batch request
+MAX_BATCH_SIZE = 10
+
+
+@dataclass
+class BatchSendReport:
+    sent: int = 0
+    failed: List[Dict] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Messages sent per second"""
+        return self.sent / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
 
 class SQS:
     __DEFAULT_REGION = "us-east-1"
@@ -15,9 +40,33 @@ class SQS:
         region_name = region_name if region_name is not None else self.__DEFAULT_REGION
         self._sqs_client = self.__session.client("sqs", region_name=region_name)
 
-    def receive_message(self, queue_url: str, max_number_of_messages: int = 1) -> List[Dict]:
+    def receive_message(
+        self,
+        queue_url: str,
+        max_number_of_messages: int = 1,
+        *,
+        wait_time_seconds: Optional[int] = None,
+        visibility_timeout: Optional[int] = None,
+        attribute_names: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """
+        Receive up to `max_number_of_messages` (at most 10) messages.
+
+        Setting `wait_time_seconds` long-polls for up to that many seconds (at most 20)
+        when the queue is empty, instead of returning immediately.
+        """
+        kwargs = {}
+        if wait_time_seconds is not None:
+            kwargs["WaitTimeSeconds"] = wait_time_seconds
+        if visibility_timeout is not None:
+            kwargs["VisibilityTimeout"] = visibility_timeout
+        if attribute_names is not None:
+            kwargs["AttributeNames"] = attribute_names
+
         try:
-            response = self._sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=max_number_of_messages)
+            response = self._sqs_client.receive_message(
+                QueueUrl=queue_url, MaxNumberOfMessages=max_number_of_messages, **kwargs
+            )
             if "Messages" in response:
                 return response["Messages"]
 
@@ -69,3 +118,243 @@ class SQS:
 
         except exceptions.ClientError as e:
             raise PoproxAwsUtilitiesException(f"Error sending message batch to SQS: {e}") from e
+
+    def send_messages(
+        self,
+        queue_url: str,
+        message_bodies: List[Union[str, dict]],
+        *,
+        max_workers: int = 8,
+        max_attempts: int = 5,
+        backoff_seconds: float = 0.1,
+    ) -> BatchSendReport:
+        """
+        Sends any number of messages, split into batches of 10 that are sent
+        concurrently from a pool of `max_workers` threads.
+
+        Entries that fail with a retryable (non-sender) error, or batches that fail
+        entirely, are retried up to `max_attempts` times with jittered exponential
+        backoff. Messages that still fail are listed in the report's `failed` entries
+        rather than raising an exception.
+        """
+        start = time.perf_counter()
+        bodies = [json.dumps(body) if isinstance(body, dict) else body for body in message_bodies]
+        chunks = [bodies[idx : idx + MAX_BATCH_SIZE] for idx in range(0, len(bodies), MAX_BATCH_SIZE)]
+
+        report = BatchSendReport()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                lambda chunk: self._send_chunk_with_retries(queue_url, chunk, max_attempts, backoff_seconds),
+                chunks,
+            )
+            for sent, failed in results:
+                report.sent += sent
+                report.failed.extend(failed)
+
+        report.elapsed_seconds = time.perf_counter() - start
+        logger.info(
+            f"Sent {report.sent} messages ({len(report.failed)} failed) "
+            f"in {report.elapsed_seconds:.2f}s ({report.throughput:.1f} messages/s)"
+        )
+        return report
+
+    def _send_chunk_with_retries(
+        self, queue_url: str, chunk: List[str], max_attempts: int, backoff_seconds: float
+    ) -> tuple[int, List[Dict]]:
+        pending = {str(idx): body for idx, body in enumerate(chunk)}
+        errors = {}
+        sent = 0
+
+        for attempt in range(max_attempts):
+            if attempt > 0:
+                time.sleep(backoff_seconds * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+            try:
+                response = self._sqs_client.send_message_batch(
+                    QueueUrl=queue_url,
+                    Entries=[{"Id": entry_id, "MessageBody": body} for entry_id, body in pending.items()],
+                )
+            except exceptions.ClientError as e:
+                logger.warning(f"Error sending message batch to SQS (attempt {attempt + 1}): {e}")
+                errors.update({entry_id: {"Id": entry_id, "Message": str(e)} for entry_id in pending})
+                continue
+
+            for entry in response.get("Successful", []):
+                pending.pop(entry["Id"], None)
+                errors.pop(entry["Id"], None)
+                sent += 1
+
+            for entry in response.get("Failed", []):
+                errors[entry["Id"]] = entry
+                # Sender faults (e.g. a malformed message) will fail again, so don't retry them
+                if entry.get("SenderFault"):
+                    pending.pop(entry["Id"], None)
+
+            if not pending:
+                break
+
+        return sent, [{**entry, "MessageBody": chunk[int(entry_id)]} for entry_id, entry in errors.items()]
+
+    def delete_message_batch(self, queue_url: str, receipt_handles: List[str]) -> Dict:
+        """
+        Deletes received messages, 10 at a time (the SQS batch limit).
+
+        Like `send_message_batch`, partial failures don't raise an exception,
+        so callers should check the `Failed` entries of the combined response.
+        """
+        combined = {"Successful": [], "Failed": []}
+        for start in range(0, len(receipt_handles), MAX_BATCH_SIZE):
+            chunk = receipt_handles[start : start + MAX_BATCH_SIZE]
+            try:
+                response = self._sqs_client.delete_message_batch(
+                    QueueUrl=queue_url,
+                    Entries=[
+                        {"Id": str(start + offset), "ReceiptHandle": handle} for offset, handle in enumerate(chunk)
+                    ],
+                )
+            except exceptions.ClientError as e:
+                raise PoproxAwsUtilitiesException(f"Error deleting message batch from SQS: {e}") from e
+
+            combined["Successful"].extend(response.get("Successful", []))
+            combined["Failed"].extend(response.get("Failed", []))
+
+        return combined
+
+    def change_message_visibility_batch(
+        self, queue_url: str, receipt_handles: List[str], visibility_timeout: int
+    ) -> Dict:
+        """
+        Extends (or shortens) how long received messages stay hidden from other
+        consumers, 10 at a time (the SQS batch limit).
+        """
+        combined = {"Successful": [], "Failed": []}
+        for start in range(0, len(receipt_handles), MAX_BATCH_SIZE):
+            chunk = receipt_handles[start : start + MAX_BATCH_SIZE]
+            try:
+                response = self._sqs_client.change_message_visibility_batch(
+                    QueueUrl=queue_url,
+                    Entries=[
+                        {"Id": str(start + offset), "ReceiptHandle": handle, "VisibilityTimeout": visibility_timeout}
+                        for offset, handle in enumerate(chunk)
+                    ],
+                )
+            except exceptions.ClientError as e:
+                raise PoproxAwsUtilitiesException(f"Error changing message visibility in SQS: {e}") from e
+
+            combined["Successful"].extend(response.get("Successful", []))
+            combined["Failed"].extend(response.get("Failed", []))
+
+        return combined
+
+
+class LocalSQS(SQS):
+    """
+    In-memory stand-in for SQS, for local development and tests.
+
+    Messages are held per queue URL in process memory. Received messages are
+    hidden for the visibility timeout and re-delivered if they aren't deleted,
+    like they would be by SQS.
+    """
+
+    def __init__(self, visibility_timeout: float = 30):
+        self._sqs_client = _LocalSQSClient(visibility_timeout)
+
+    def queued_messages(self, queue_url: str) -> List[Dict]:
+        return self._sqs_client.messages(queue_url)
+
+
+class _LocalSQSClient:
+    def __init__(self, visibility_timeout: float):
+        self.visibility_timeout = visibility_timeout
+        self._queues: Dict[str, List[Dict]] = {}
+        self._lock = Lock()
+
+    def messages(self, queue_url: str) -> List[Dict]:
+        with self._lock:
+            return list(self._queues.get(queue_url, []))
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> Dict:
+        message_id = str(uuid4())
+        with self._lock:
+            self._queues.setdefault(QueueUrl, []).append(
+                {
+                    "MessageId": message_id,
+                    "Body": MessageBody,
+                    "SentTimestamp": time.time(),
+                    "VisibleAt": 0.0,
+                    "ReceiptHandle": None,
+                    "ReceiveCount": 0,
+                }
+            )
+        return {"MessageId": message_id}
+
+    def send_message_batch(self, QueueUrl: str, Entries: List[Dict]) -> Dict:
+        successful = []
+        for entry in Entries:
+            response = self.send_message(QueueUrl=QueueUrl, MessageBody=entry["MessageBody"])
+            successful.append({"Id": entry["Id"], "MessageId": response["MessageId"]})
+        return {"Successful": successful, "Failed": []}
+
+    def receive_message(
+        self, QueueUrl: str, MaxNumberOfMessages: int = 1, VisibilityTimeout: Optional[float] = None, **kwargs
+    ) -> Dict:
+        now = time.time()
+        timeout = VisibilityTimeout if VisibilityTimeout is not None else self.visibility_timeout
+        received = []
+        with self._lock:
+            for message in self._queues.get(QueueUrl, []):
+                if len(received) >= MaxNumberOfMessages:
+                    break
+                if message["VisibleAt"] > now:
+                    continue
+                message["VisibleAt"] = now + timeout
+                message["ReceiptHandle"] = str(uuid4())
+                message["ReceiveCount"] += 1
+                received.append(
+                    {
+                        "MessageId": message["MessageId"],
+                        "ReceiptHandle": message["ReceiptHandle"],
+                        "Body": message["Body"],
+                        "Attributes": {
+                            "SentTimestamp": str(int(message["SentTimestamp"] * 1000)),
+                            "ApproximateReceiveCount": str(message["ReceiveCount"]),
+                        },
+                    }
+                )
+        return {"Messages": received} if received else {}
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str) -> Dict:
+        with self._lock:
+            messages = self._queues.get(QueueUrl, [])
+            self._queues[QueueUrl] = [m for m in messages if m["ReceiptHandle"] != ReceiptHandle]
+        return {}
+
+    def delete_message_batch(self, QueueUrl: str, Entries: List[Dict]) -> Dict:
+        successful = []
+        failed = []
+        with self._lock:
+            messages = self._queues.get(QueueUrl, [])
+            handles = {m["ReceiptHandle"] for m in messages}
+            for entry in Entries:
+                if entry["ReceiptHandle"] in handles:
+                    successful.append({"Id": entry["Id"]})
+                else:
+                    failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+            deleted = {entry["ReceiptHandle"] for entry in Entries}
+            self._queues[QueueUrl] = [m for m in messages if m["ReceiptHandle"] not in deleted]
+        return {"Successful": successful, "Failed": failed}
+
+    def change_message_visibility_batch(self, QueueUrl: str, Entries: List[Dict]) -> Dict:
+        now = time.time()
+        successful = []
+        failed = []
+        with self._lock:
+            messages = {m["ReceiptHandle"]: m for m in self._queues.get(QueueUrl, []) if m["ReceiptHandle"]}
+            for entry in Entries:
+                message = messages.get(entry["ReceiptHandle"])
+                if message is None:
+                    failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+                else:
+                    message["VisibleAt"] = now + entry["VisibilityTimeout"]
+                    successful.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": failed}
@@ -16,7 +16,7 @@ from poprox_storage.repositories.experiments import (
 )
 from poprox_storage.repositories.images import DbImageRepository, S3ImageRepository
 from poprox_storage.repositories.newsletters import DbNewsletterRepository, S3NewsletterRepository
-from poprox_storage.repositories.panel_management import S3PanelManagementRepository
+from poprox_storage.repositories.panel_management import DbPanelManagementRepository, S3PanelManagementRepository
 from poprox_storage.repositories.placements import DbPlacementRepository
 from poprox_storage.repositories.pools import DbCandidatePoolRepository
 from poprox_storage.repositories.qualtrics_survey import DbQualtricsSurveyRepository, S3QualtricsSurveyRepository
@@ -66,6 +66,7 @@ __all__ = [
     "DbExperimentRepository",
     "DbImageRepository",
     "DbNewsletterRepository",
+    "DbPanelManagementRepository",
     "DbPlacementRepository",
     "DbQualtricsSurveyRepository",
     "DbSubscriptionRepository",
@@ -6,12 +6,29 @@ from sqlalchemy import Connection, case, func, select
 
 from poprox_concepts.domain import AccountInterest
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.parquet import ExportSchema
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
+INTERESTS_SCHEMA = ExportSchema(
+    "account_interests",
+    version=1,
+    fields={
+        "account_id": "string",
+        "entity_id": "string",
+        "entity_name": "string",
+        "entity_type": "string",
+        "preference": "int64",
+        "frequency": "int64",
+        "created_at": "timestamp",
+    },
+    dictionary=("entity_id", "entity_name", "entity_type", "preference", "frequency"),
+)
+
+
 class DbAccountInterestRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
         super().__init__(connection)
@@ -271,7 +288,7 @@ class S3AccountInterestRepository(S3Repository):
         start_time: datetime = None,
     ):
         records = convert_to_records(interests)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time, schema=INTERESTS_SCHEMA)
 
 
 def convert_to_records(interests: list[AccountInterest]) -> list[dict]:
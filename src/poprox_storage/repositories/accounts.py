@@ -4,10 +4,12 @@ from uuid import UUID, uuid4
 
 import sqlalchemy
 from sqlalchemy import Connection, and_, null, or_, select
+from sqlalchemy.dialects.postgresql import insert
 
 from poprox_concepts.api.tracking import LoginLinkData
 from poprox_concepts.domain import Account, ConsentLog, WebLogin
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.hydration import hydrate
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -267,6 +269,27 @@ class DbAccountRepository(DatabaseRepository):
         )
         self.conn.execute(query)
 
+    def store_logins(self, logins: list[dict], commit: bool = True) -> int:
+        """
+        Bulk insert web logins, skipping any whose `web_login_id` has already been stored
+
+        Each login is a dict of `web_logins` columns, including a `web_login_id` and
+        `created_at` assigned by the caller, so that storing the same batch twice
+        (e.g. when queued events are re-delivered) is a no-op.
+
+        Returns the number of newly inserted logins
+        """
+        web_login_tbl = self.tables["web_logins"]
+        if not logins:
+            return 0
+
+        query = insert(web_login_tbl).values(logins).on_conflict_do_nothing().returning(web_login_tbl.c.web_login_id)
+        inserted = len(self.conn.execute(query).fetchall())
+
+        if commit:
+            self.conn.commit()
+        return inserted
+
     def end_consent_for_account(self, account_id: UUID):
         consent_tbl = self.tables["account_consent_log"]
         update_query = (
@@ -333,7 +356,8 @@ class DbAccountRepository(DatabaseRepository):
         result = self.conn.execute(account_query).fetchall()
 
         return [
-            Account(
+            hydrate(
+                Account,
                 account_id=row.account_id,
                 email=row.email,
                 status=row.status,
@@ -1,7 +1,10 @@
+import hashlib
 import json
 import logging
 from collections import defaultdict
+from collections.abc import Iterator
 from datetime import datetime, timedelta
+from typing import Literal
 from uuid import UUID
 
 import boto3
@@ -9,23 +12,117 @@ from sqlalchemy import (
     Table,
     and_,
     desc,
-    func,
+    or_,
     select,
 )
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError, InternalError
 from tqdm import tqdm
 
 from poprox_concepts.domain import Article, ArticlePackage, Entity, Mention
 from poprox_storage.aws import DEV_BUCKET_NAME, s3
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
-from poprox_storage.repositories.data_stores.s3 import S3Repository
+from poprox_storage.repositories.data_stores.hydration import hydrate
+from poprox_storage.repositories.data_stores.key_discovery import KeyCheckpoint, S3KeyDiscovery, most_recent_keys
+from poprox_storage.repositories.data_stores.lru import LRUCache
+from poprox_storage.repositories.data_stores.parquet import ExportSchema
+from poprox_storage.repositories.data_stores.s3 import FetchResult, S3Repository
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 NEWS_FILE_KEY = "mockObjects/ap_scraped_data.json"
 
+ArticleFields = Literal["full", "summary"] | list[str]
+
+# Entity ids by their `uq_entities` columns; the same few thousand entities are
+# mentioned over and over, so this saves most entity upserts during ingest
+ENTITY_ID_CACHE = LRUCache(maxsize=16384)
+
+# The columns most consumers of articles need, which leave out the (large) body and raw data
+ARTICLE_SUMMARY_COLUMNS = (
+    "article_id",
+    "headline",
+    "subhead",
+    "url",
+    "preview_image_id",
+    "source",
+    "external_id",
+    "published_at",
+    "created_at",
+)
+ARTICLE_REQUIRED_COLUMNS = ("article_id", "headline", "url")
+ARTICLE_MODEL_COLUMNS = (*ARTICLE_SUMMARY_COLUMNS, "body", "raw_data")
+
+# Fields that vary between ingests of the same article and shouldn't count as changes
+UNHASHED_ARTICLE_FIELDS = {"content_hash", "created_at"}
+# How stale an unchanged article's `created_at` can get before a re-ingest refreshes it,
+# so articles still in the feed keep showing up in `fetch_articles_ingested_*`
+# windows without every re-ingest rewriting the row
+INGEST_REFRESH_INTERVAL = timedelta(hours=1)
+
+# Statistics on the body and raw data would be large and never used to skip row groups
+ARTICLES_SCHEMA = ExportSchema(
+    "articles",
+    version=1,
+    fields={
+        "article_id": "string",
+        "headline": "string",
+        "subhead": "string",
+        "body": "string",
+        "url": "string",
+        "preview_image_id": "string",
+        "raw_data": "json",
+        "published_at": "timestamp",
+        "created_at": "timestamp",
+    },
+    statistics=(
+        "article_id",
+        "url",
+        "published_at",
+        "created_at",
+    ),
+)
+MENTIONS_SCHEMA = ExportSchema(
+    "mentions",
+    version=1,
+    fields={
+        "mention_id": "string",
+        "article_id": "string",
+        "source": "string",
+        "relevance": "float64",
+        "entity": "json",
+    },
+    dictionary=("article_id", "source", "entity"),
+)
+# One row per packaged article, so the package's values repeat across rows
+PACKAGES_SCHEMA = ExportSchema(
+    "packages",
+    version=1,
+    fields={
+        "package_id": "string",
+        "article_id": "string",
+        "title": "string",
+        "source": "string",
+        "entity_id": "string",
+        "entity_name": "string",
+        "entity_type": "string",
+        "current_as_of": "timestamp",
+        "created_at": "timestamp",
+    },
+    dictionary=(
+        "package_id",
+        "title",
+        "source",
+        "entity_id",
+        "entity_name",
+        "entity_type",
+        "current_as_of",
+        "created_at",
+    ),
+)
+
 
 class DbArticleRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
@@ -41,40 +138,42 @@ class DbArticleRepository(DatabaseRepository):
             "impressions",
             "mentions",
         )
+        self.article_write_stats = {"written": 0, "skipped": 0}
+        self.entity_write_stats = {"mentions": 0, "cache_hits": 0, "upserted": 0, "round_trips_saved": 0}
 
-    def fetch_articles_since(self, days_ago=1) -> list[Article]:
+    def fetch_articles_since(self, days_ago=1, *, fields: ArticleFields = "full") -> list[Article]:
         article_table = self.tables["articles"]
         links_table = self.tables["article_links"]
         cutoff = datetime.now() - timedelta(days=days_ago)
-        query = select(article_table).where(article_table.c.published_at > cutoff)
+        query = select(*article_columns(article_table, fields)).where(article_table.c.published_at > cutoff)
         return _fetch_articles(self.conn, query, links_table)
 
-    def fetch_articles_before(self, days_ago=1) -> list[Article]:
+    def fetch_articles_before(self, days_ago=1, *, fields: ArticleFields = "full") -> list[Article]:
         article_table = self.tables["articles"]
         links_table = self.tables["article_links"]
         cutoff = datetime.now() - timedelta(days=days_ago)
-        query = select(article_table).where(article_table.c.published_at < cutoff)
+        query = select(*article_columns(article_table, fields)).where(article_table.c.published_at < cutoff)
         return _fetch_articles(self.conn, query, links_table)
 
-    def fetch_articles_ingested_since(self, days_ago=1) -> list[Article]:
+    def fetch_articles_ingested_since(self, days_ago=1, *, fields: ArticleFields = "full") -> list[Article]:
         article_table = self.tables["articles"]
         links_table = self.tables["article_links"]
         cutoff = datetime.now() - timedelta(days=days_ago)
-        query = select(article_table).where(article_table.c.created_at > cutoff)
+        query = select(*article_columns(article_table, fields)).where(article_table.c.created_at > cutoff)
         return _fetch_articles(self.conn, query, links_table)
 
-    def fetch_articles_ingested_before(self, days_ago=1) -> list[Article]:
+    def fetch_articles_ingested_before(self, days_ago=1, *, fields: ArticleFields = "full") -> list[Article]:
         article_table = self.tables["articles"]
         links_table = self.tables["article_links"]
         cutoff = datetime.now() - timedelta(days=days_ago)
-        query = select(article_table).where(article_table.c.created_at < cutoff)
+        query = select(*article_columns(article_table, fields)).where(article_table.c.created_at < cutoff)
         return _fetch_articles(self.conn, query, links_table)
 
-    def fetch_articles_ingested_between(self, start_date, end_date) -> list[Article]:
+    def fetch_articles_ingested_between(self, start_date, end_date, *, fields: ArticleFields = "full") -> list[Article]:
         article_table = self.tables["articles"]
         links_table = self.tables["article_links"]
 
-        query = select(article_table).where(
+        query = select(*article_columns(article_table, fields)).where(
             and_(
                 article_table.c.created_at <= end_date,
                 article_table.c.created_at >= start_date,
@@ -82,12 +181,34 @@ class DbArticleRepository(DatabaseRepository):
         )
         return _fetch_articles(self.conn, query, links_table)
 
-    def fetch_articles_by_id(self, ids: list[UUID]) -> list[Article]:
+    def fetch_articles_by_id(self, ids: list[UUID], *, fields: ArticleFields = "full") -> list[Article]:
         article_table = self.tables["articles"]
         links_table = self.tables["article_links"]
-        query = select(article_table).where(article_table.c.article_id.in_(ids))
+        query = select(*article_columns(article_table, fields)).where(article_table.c.article_id.in_(ids))
         return _fetch_articles(self.conn, query, links_table)
 
+    def load_article_bodies(self, articles: list[Article], columns=("body", "raw_data")) -> list[Article]:
+        """
+        Fill in the large columns left out by a `fields="summary"` fetch, in place,
+        for just the articles that turn out to need them
+        """
+        article_table = self.tables["articles"]
+        if not articles:
+            return articles
+
+        query = select(article_table.c.article_id, *(article_table.c[column] for column in columns)).where(
+            article_table.c.article_id.in_([a.article_id for a in articles])
+        )
+        rows = {row.article_id: row for row in self.conn.execute(query)}
+
+        for article in articles:
+            row = rows.get(article.article_id)
+            if row is not None:
+                for column in columns:
+                    setattr(article, column, getattr(row, column))
+
+        return articles
+
     def fetch_article_packages_ingested_since(self, days_ago=1) -> list[ArticlePackage]:
         """Fetch article packages that were ingested within the specified number of days."""
         packages_table = self.tables["article_packages"]
@@ -152,93 +273,106 @@ class DbArticleRepository(DatabaseRepository):
 
         return list(package_lookup.values())
 
-    def fetch_article_by_external_id(self, id_: str) -> Article | None:
+    def fetch_article_by_external_id(self, id_: str, *, fields: ArticleFields = "full") -> Article | None:
         article_table = self.tables["articles"]
-        deduped = self._get_deduped_articles(article_table, article_table.c.external_id == id_)
+        deduped = self._get_deduped_articles(article_table, article_table.c.external_id == id_, fields=fields)
         return deduped[0] if deduped else None
 
+    def fetch_articles_by_external_ids(self, ids: list[str], *, fields: ArticleFields = "full") -> list[Article]:
+        article_table = self.tables["articles"]
+        if not ids:
+            return []
+        return self._get_deduped_articles(article_table, article_table.c.external_id.in_(ids), fields=fields)
+
     def fetch_article_mentions(self, articles: list[Article]) -> list[Article]:
         article_lookup = {article.article_id: article for article in articles}
-        article_ids = [article.article_id for article in articles]
-
-        entity_table = self.tables["entities"]
         mention_table = self.tables["mentions"]
 
-        query = (
-            select(
-                entity_table.c.entity_id,
-                entity_table.c.external_id,
-                entity_table.c.name,
-                entity_table.c.entity_type,
-                entity_table.c.source,
-                entity_table.c.raw_data,
-                mention_table.c.mention_id,
-                mention_table.c.article_id,
-                mention_table.c.source,
-                mention_table.c.relevance,
-            )
-            .where(mention_table.c.article_id.in_(article_ids))
-            .join(entity_table, mention_table.c.entity_id == entity_table.c.entity_id)
-        )
-        results = self.conn.execute(query).fetchall()
-
-        for row in results:
-            entity = Entity(
-                entity_id=row[0],
-                external_id=row[1],
-                name=row[2],
-                entity_type=row[3],
-                source=row[4],
-                raw_data=row[5],
-            )
-            mention = Mention(
-                mention_id=row[6],
-                article_id=row[7],
-                source=row[8],
-                relevance=row[9],
-                entity=entity,
-            )
+        for mention in self._fetch_mentions(mention_table.c.article_id.in_(list(article_lookup))):
             article_lookup[mention.article_id].mentions.append(mention)
 
         return_val = list(article_lookup.values())
         return return_val
 
     def fetch_mentions(self) -> list[Mention]:
+        return self._fetch_mentions()
+
+    def fetch_mentions_by_article_ids(self, article_ids: list[UUID]) -> list[Mention]:
+        if not article_ids:
+            return []
+        mention_table = self.tables["mentions"]
+        return self._fetch_mentions(mention_table.c.article_id.in_(article_ids))
+
+    def fetch_mentions_ingested_between(self, start_date: datetime, end_date: datetime) -> list[Mention]:
+        """Fetch the mentions in articles ingested between two dates (inclusive)"""
+        article_table = self.tables["articles"]
+        mention_table = self.tables["mentions"]
+
+        article_ids = select(article_table.c.article_id).where(
+            and_(
+                article_table.c.created_at >= start_date,
+                article_table.c.created_at <= end_date,
+            )
+        )
+        return self._fetch_mentions(mention_table.c.article_id.in_(article_ids))
+
+    def _fetch_mentions(self, where_clause=None) -> list[Mention]:
+        """
+        Fetch mentions, sharing one `Entity` object between all mentions of the same entity
+
+        Popular entities are mentioned by thousands of articles, so the entities are
+        fetched once each in a separate query instead of being joined onto every row.
+        That query looks them up by the ids from the mentions already fetched, rather
+        than scanning `mentions` again.
+        """
         entity_table = self.tables["entities"]
         mention_table = self.tables["mentions"]
 
-        query = select(
-            entity_table.c.entity_id,
-            entity_table.c.external_id,
-            entity_table.c.name,
-            entity_table.c.entity_type,
-            entity_table.c.source,
-            entity_table.c.raw_data,
+        mention_query = select(
             mention_table.c.mention_id,
             mention_table.c.article_id,
             mention_table.c.source,
             mention_table.c.relevance,
-        ).join(entity_table, mention_table.c.entity_id == entity_table.c.entity_id)
-        results = self.conn.execute(query).fetchall()
-        mentions = []
-        for row in results:
-            entity = Entity(
-                entity_id=row[0],
-                external_id=row[1],
-                name=row[2],
-                entity_type=row[3],
-                source=row[4],
-                raw_data=row[5],
-            )
-            mention = Mention(
-                mention_id=row[6],
-                article_id=row[7],
-                source=row[8],
-                relevance=row[9],
-                entity=entity,
+            mention_table.c.entity_id,
+        )
+        if where_clause is not None:
+            mention_query = mention_query.where(where_clause)
+        mention_rows = self.conn.execute(mention_query).fetchall()
+
+        entity_ids = {row.entity_id for row in mention_rows}
+        entities = {}
+        if entity_ids:
+            entity_query = select(
+                entity_table.c.entity_id,
+                entity_table.c.external_id,
+                entity_table.c.name,
+                entity_table.c.entity_type,
+                entity_table.c.source,
+                entity_table.c.raw_data,
+            ).where(entity_table.c.entity_id.in_(entity_ids))
+            for row in self.conn.execute(entity_query):
+                entities[row.entity_id] = hydrate(
+                    Entity,
+                    entity_id=row.entity_id,
+                    external_id=row.external_id,
+                    name=row.name,
+                    entity_type=row.entity_type,
+                    source=row.source,
+                    raw_data=row.raw_data,
+                )
+
+        return [
+            hydrate(
+                Mention,
+                mention_id=row.mention_id,
+                article_id=row.article_id,
+                source=row.source,
+                relevance=row.relevance,
+                entity=entities[row.entity_id],
             )
-            mentions.append(mention)
-        return mentions
+            for row in mention_rows
+            if row.entity_id in entities
+        ]
 
     def fetch_associated_image_ids(self, articles: list[Article]) -> dict[UUID, list[UUID]]:
         association_table = self.tables["article_image_associations"]
@@ -347,6 +481,15 @@ class DbArticleRepository(DatabaseRepository):
     def store_articles(self, articles: list[Article], *, mentions=False, progress=False):
         failed = 0
 
+        entity_ids = {}
+        if mentions:
+            try:
+                entity_ids = self.store_entities([m.entity for article in articles for m in article.mentions])
+            except (IntegrityError, InternalError) as exc:
+                # Fall back to storing entities one at a time along with their mentions
+                logger.error(exc)
+                self.conn.rollback()
+
         if progress:
             articles = tqdm(articles, total=len(articles), desc="Ingesting articles")
 
@@ -358,7 +501,7 @@ class DbArticleRepository(DatabaseRepository):
                     raise RuntimeError(msg)
                 if mentions:
                     for mention in article.mentions:
-                        entity_id = self.store_entity(mention.entity)
+                        entity_id = entity_ids.get(entity_key(mention.entity)) or self.store_entity(mention.entity)
                         mention.article_id = article_id
                         mention.entity.entity_id = entity_id
                         mention.mention_id = self.store_mention(mention)
@@ -373,6 +516,16 @@ class DbArticleRepository(DatabaseRepository):
                 logger.error(exc)
                 failed += 1
 
+        logger.info(
+            f"Stored {len(articles)} articles: {self.article_write_stats['skipped']} unchanged articles skipped "
+            f"so far, {failed} failed"
+        )
+        if mentions:
+            logger.info(
+                f"Entity ids for {self.entity_write_stats['mentions']} mentions so far: "
+                f"{ENTITY_ID_CACHE.hit_rate:.1%} cache hit rate, "
+                f"{self.entity_write_stats['round_trips_saved']} round-trips saved"
+            )
         return failed
 
     def store_article_package(self, package: ArticlePackage) -> UUID | None:
@@ -420,12 +573,100 @@ class DbArticleRepository(DatabaseRepository):
         self.conn.execute(insert_stmt)
 
     def store_article(self, article: Article) -> UUID | None:
-        return self._insert_model(
-            "articles",
-            article,
-            exclude={"article_id", "mentions", "images", "linked_articles"},
-            constraint="uq_articles",
-        )
+        """
+        Insert an article, or update the stored copy if its content has changed
+
+        Re-ingested articles whose content hash matches the stored row are left
+        alone (no new row version, WAL or index writes) and counted as skipped
+        in `article_write_stats`. The exception is when the stored `created_at` is
+        more than `INGEST_REFRESH_INTERVAL` older than the new one. Then the row is
+        rewritten to refresh it, so an article that's still being ingested keeps a
+        recent `created_at`, as it did when every re-ingest rewrote it.
+        """
+        article_table = self.tables["articles"]
+
+        fields = article.model_dump(exclude={"article_id", "mentions", "images", "linked_articles"})
+        fields["created_at"] = fields.get("created_at") or datetime.now()
+        fields["content_hash"] = article_content_hash(fields)
+
+        try:
+            insert_stmt = insert(article_table).values(**fields)
+            insert_stmt = insert_stmt.on_conflict_do_update(
+                constraint="uq_articles",
+                set_=fields,
+                where=or_(
+                    article_table.c.content_hash.is_distinct_from(insert_stmt.excluded.content_hash),
+                    article_table.c.created_at < insert_stmt.excluded.created_at - INGEST_REFRESH_INTERVAL,
+                ),
+            ).returning(article_table.c.article_id)
+            article_id = self.conn.execute(insert_stmt).scalar()
+
+            if article_id is None:
+                # The conflicting row is unchanged, so the update was skipped and nothing was returned
+                article_id = self.conn.execute(
+                    select(article_table.c.article_id).where(
+                        article_table.c.headline == fields["headline"], article_table.c.url == fields["url"]
+                    )
+                ).scalar()
+                self.article_write_stats["skipped"] += 1
+            else:
+                self.article_write_stats["written"] += 1
+
+            self.conn.commit()
+        except (IntegrityError, InternalError) as exc:
+            logger.error(exc)
+            self.conn.rollback()
+            article_id = None
+
+        return article_id
+
+    def store_entities(self, entities: list[Entity]) -> dict[tuple, UUID]:
+        """
+        Look up or store the ids of many entities at once, keyed by `entity_key`
+
+        Entities are de-duplicated, ids already in `ENTITY_ID_CACHE` are reused,
+        and the rest are upserted in a single statement. Since cached entities
+        aren't written, changes to their `raw_data` aren't picked up until they
+        fall out of the cache.
+        """
+        entity_table = self.tables["entities"]
+
+        entity_ids = {}
+        unseen = {}
+        for entity in entities:
+            key = entity_key(entity)
+            if key in entity_ids or key in unseen:
+                continue
+            cached_id = ENTITY_ID_CACHE.get(key)
+            if cached_id is not None:
+                entity_ids[key] = cached_id
+                self.entity_write_stats["cache_hits"] += 1
+            else:
+                unseen[key] = entity.model_dump(exclude={"entity_id"})
+
+        if unseen:
+            insert_stmt = insert(entity_table).values(list(unseen.values()))
+            insert_stmt = insert_stmt.on_conflict_do_update(
+                constraint="uq_entities",
+                set_={"raw_data": insert_stmt.excluded.raw_data},
+            ).returning(
+                entity_table.c.entity_id,
+                entity_table.c.entity_type,
+                entity_table.c.name,
+                entity_table.c.source,
+                entity_table.c.external_id,
+            )
+            for row in self.conn.execute(insert_stmt):
+                key = (row.entity_type, row.name, row.source, row.external_id)
+                entity_ids[key] = row.entity_id
+                ENTITY_ID_CACHE.put(key, row.entity_id)
+            self.conn.commit()
+
+        self.entity_write_stats["mentions"] += len(entities)
+        self.entity_write_stats["upserted"] += len(unseen)
+        self.entity_write_stats["round_trips_saved"] += len(entities) - (1 if unseen else 0)
+
+        return entity_ids
 
     def store_entity(self, entity: Entity) -> UUID | None:
         return self._insert_model("entities", entity, exclude={"entity_id"}, constraint="uq_entities")
@@ -439,29 +680,30 @@ class DbArticleRepository(DatabaseRepository):
             constraint="uq_mentions",
         )
 
-    def _get_deduped_articles(self, article_table: Table, where_clause=None) -> list[Article]:
+    def _get_deduped_articles(
+        self, article_table: Table, where_clause=None, *, fields: ArticleFields = "full"
+    ) -> list[Article]:
+        """
+        Fetch the most recent article row for each external id/source pair
+
+        The `where_clause` is applied before de-duplication so that Postgres can
+        narrow the rows using the `(external_id, source, created_at DESC)` index
+        instead of grouping the whole table, which means it should only filter on
+        columns that are shared by every version of an article (e.g. `external_id`
+        or `source`).
+        """
         links_table = self.tables["article_links"]
-        # Select only the most recent article row for each source/external id pair
-        inner_query = (
-            select(
-                article_table.c.source,
+
+        query = (
+            select(*article_columns(article_table, fields))
+            .distinct(article_table.c.external_id, article_table.c.source)
+            .where(article_table.c.external_id.is_not(None))
+            .order_by(
                 article_table.c.external_id,
-                func.max(article_table.c.created_at).label("updated_at"),
+                article_table.c.source,
+                desc(article_table.c.created_at),
             )
-            .where(article_table.c.external_id.is_not(None))
-            .group_by(article_table.c.source, article_table.c.external_id)
-            .order_by("updated_at")
-        )
-        # Select all columns for that subset of the articles
-        join_query = article_table.join(
-            inner_query,
-            and_(
-                inner_query.c.source == article_table.c.source,
-                inner_query.c.external_id == article_table.c.external_id,
-                inner_query.c.updated_at == article_table.c.created_at,
-            ),
         )
-        query = select(article_table).select_from(join_query)
 
         if where_clause is not None:
             query = query.where(where_clause)
@@ -469,24 +711,39 @@ class DbArticleRepository(DatabaseRepository):
         return _fetch_articles(self.conn, query, links_table)
 
 
+def article_columns(article_table: Table, fields: ArticleFields = "full") -> list:
+    """
+    Pick the article columns to select
+
+    `fields` is "full" (every column), "summary" (everything but `body` and
+    `raw_data`, which can be loaded later with `load_article_bodies`), or a list
+    of column names, to which the id, headline and URL are always added.
+    """
+    if fields == "full":
+        return list(article_table.columns)
+    if fields == "summary":
+        names = ARTICLE_SUMMARY_COLUMNS
+    elif isinstance(fields, str):
+        msg = f"Unknown article fields {fields!r}; expected 'full', 'summary' or a list of columns"
+        raise ValueError(msg)
+    else:
+        names = [*ARTICLE_REQUIRED_COLUMNS, *(name for name in fields if name not in ARTICLE_REQUIRED_COLUMNS)]
+
+    unknown = [name for name in names if name not in article_table.c]
+    if unknown:
+        msg = f"Unknown article columns {unknown}"
+        raise ValueError(msg)
+
+    return [article_table.c[name] for name in names]
+
+
 def _fetch_articles(conn, article_query, links_table: Table) -> list[Article]:
     result = conn.execute(article_query).fetchall()
-    articles = [
-        Article(
-            article_id=row.article_id,
-            headline=row.headline,
-            subhead=row.subhead,
-            body=row.body,
-            url=row.url,
-            preview_image_id=row.preview_image_id,
-            source=row.source,
-            external_id=row.external_id,
-            raw_data=row.raw_data,
-            published_at=row.published_at,
-            created_at=row.created_at,
-        )
-        for row in result
-    ]
+    articles = []
+    for row in result:
+        # Columns left out of a projection are left unset on the model
+        values = row._mapping
+        articles.append(hydrate(Article, **{name: values[name] for name in ARTICLE_MODEL_COLUMNS if name in values}))
 
     article_ids = [a.article_id for a in articles]
     linked_articles_query = select(links_table).where(links_table.c.source_article_id.in_(article_ids))
@@ -506,6 +763,7 @@ class S3ArticleRepository(S3Repository):
     def __init__(self, bucket_name):
         super().__init__(bucket_name)
         self.s3_client = boto3.client("s3")
+        self.key_discovery = S3KeyDiscovery(self.s3_client, DEV_BUCKET_NAME)
 
     def fetch_news_files(self, prefix, days_back=None):
         """
@@ -524,14 +782,17 @@ class S3ArticleRepository(S3Repository):
             A list of the names of each retrieved file
             in reverse chronological order
         """
-        response = self.s3_client.list_objects_v2(Bucket=DEV_BUCKET_NAME, Prefix=prefix)
-
-        files = sorted(response.get("Contents", []), key=lambda d: d["LastModified"], reverse=True)
+        return most_recent_keys(list(self.key_discovery.list_objects(prefix)), days_back)
 
-        if days_back:
-            files = files[:days_back]
+    def fetch_new_news_files(self, prefix, checkpoint_name, *, ordered_keys=False) -> tuple[list[str], KeyCheckpoint]:
+        """
+        Retrieve the names of AP news files added since the last saved checkpoint
 
-        return [f["Key"] for f in files]
+        Returns the file names (newest first) and the advanced checkpoint, which
+        should be saved with `key_discovery.save_checkpoint` once they're ingested.
+        """
+        objects, checkpoint = self.key_discovery.list_new_objects(prefix, checkpoint_name, ordered_keys=ordered_keys)
+        return most_recent_keys(objects), checkpoint
 
     def fetch_historical_articles(self) -> list[Article]:
         response = s3.get_object(bucket_name=DEV_BUCKET_NAME, key=NEWS_FILE_KEY).get("Body").read()
@@ -566,16 +827,19 @@ class S3ArticleRepository(S3Repository):
             A list of the names of each retrieved file
             in reverse chronological order
         """
-        response = self.s3_client.list_objects_v2(Bucket=DEV_BUCKET_NAME, Prefix=prefix)
-
-        files = sorted(response.get("Contents", []), key=lambda d: d["LastModified"], reverse=True)
-
-        return [f["Key"] for f in files]
+        return most_recent_keys(list(self.key_discovery.list_objects(prefix)))
 
     def fetch_nitf_file_contents(self, file_key):
         file_contents = self.fetch_file_contents(file_key)
         return file_contents
 
+    def fetch_nitf_files_contents(self, file_keys, *, max_workers=16) -> Iterator[FetchResult]:
+        """
+        Download many AP NITF XML files concurrently, yielding a `FetchResult`
+        for each file as soon as it's ready (not in the order of `file_keys`)
+        """
+        return self.fetch_many(file_keys, max_workers=max_workers)
+
     def store_as_parquet(
         self,
         articles: list[Article],
@@ -584,7 +848,7 @@ class S3ArticleRepository(S3Repository):
         start_time: datetime = None,
     ):
         records = extract_and_flatten(articles)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time, schema=ARTICLES_SCHEMA)
 
     def store_mentions_as_parquet(
         self,
@@ -594,7 +858,7 @@ class S3ArticleRepository(S3Repository):
         start_time: datetime = None,
     ):
         records = extract_and_flatten_mentions(mentions)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time, schema=MENTIONS_SCHEMA)
 
     def store_packages_as_parquet(
         self,
@@ -604,7 +868,19 @@ class S3ArticleRepository(S3Repository):
         start_time: datetime = None,
     ):
         records = extract_and_flatten_packages(packages)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time, schema=PACKAGES_SCHEMA)
+
+
+def entity_key(entity: Entity) -> tuple:
+    """The columns of the `uq_entities` constraint, which identify an entity"""
+    return (entity.entity_type, entity.name, entity.source, entity.external_id)
+
+
+def article_content_hash(fields: dict) -> str:
+    """Hash the stored fields of an article, ignoring ones that change on every ingest"""
+    content = {key: value for key, value in fields.items() if key not in UNHASHED_ARTICLE_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
 
 
 def extract_and_flatten(articles):
@@ -1,20 +1,42 @@
 import json
 import logging
 from collections import defaultdict
+from collections.abc import Sequence
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy import and_, insert, select
+from sqlalchemy import and_, cast, literal, null, select
+from sqlalchemy.dialects.postgresql import insert
 
 from poprox_concepts.domain import Account, Click
 from poprox_storage.aws import s3
 from poprox_storage.aws.exceptions import PoproxAwsUtilitiesException
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.hydration import hydrate
+from poprox_storage.repositories.data_stores.lru import LRUCache
+from poprox_storage.repositories.data_stores.parquet import ExportSchema
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Article URLs map to the same article id for the life of a warm Lambda,
+# so the click redirect can skip the articles lookup on repeat clicks
+ARTICLE_ID_BY_URL = LRUCache(maxsize=4096)
+
+
+CLICKS_SCHEMA = ExportSchema(
+    "clicks",
+    version=1,
+    fields={
+        "account_id": "string",
+        "newsletter_id": "string",
+        "impression_id": "string",
+        "article_id": "string",
+        "clicked_at": "timestamp",
+    },
+)
+
 
 class S3ClicksRepository(S3Repository):
     def __init__(self, bucket_name):
@@ -35,15 +57,24 @@ class S3ClicksRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = extract_and_flatten(clicks)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records,
+            bucket_name,
+            file_prefix,
+            start_time,
+            partition_by=partition_by,
+            date_column="clicked_at",
+            schema=CLICKS_SCHEMA,
+        )
 
 
 class DbClicksRepository(DatabaseRepository):
     def __init__(self, connection):
         super().__init__(connection)
-        self.tables = self._load_tables("clicks", "newsletters")
+        self.tables = self._load_tables("articles", "clicks", "impressions", "newsletters")
 
     def store_click(self, newsletter_id, account_id, article_id, headers=None, created_at=None, impression_id=None):
         click_table = self.tables["clicks"]
@@ -59,6 +90,98 @@ class DbClicksRepository(DatabaseRepository):
                 stmt = stmt.values(created_at=created_at)
             self.conn.execute(stmt)
 
+    def store_clicks(self, clicks: list[dict], commit: bool = True) -> int:
+        """
+        Bulk insert clicks, skipping any whose `click_id` has already been stored
+
+        Each click is a dict of `clicks` columns, including a `click_id` and
+        `created_at` assigned by the caller, so that storing the same batch twice
+        (e.g. when queued events are re-delivered) is a no-op.
+
+        Returns the number of newly inserted clicks
+        """
+        click_table = self.tables["clicks"]
+        if not clicks:
+            return 0
+
+        stmt = insert(click_table).values(clicks).on_conflict_do_nothing().returning(click_table.c.click_id)
+        inserted = len(self.conn.execute(stmt).fetchall())
+
+        if commit:
+            self.conn.commit()
+        return inserted
+
+    def store_click_by_url(
+        self, article_url: str, account_id: UUID, newsletter_id: UUID | None = None, headers=None
+    ) -> UUID | None:
+        """
+        Resolve the clicked article (and impression, when a newsletter is given) from
+        its URL and record the click, all in a single `INSERT ... SELECT ... RETURNING`
+
+        Returns the id of the clicked article, or None if no matching article (or
+        impression of that article in the newsletter) was found and nothing was stored
+        """
+        article_table = self.tables["articles"]
+        click_table = self.tables["clicks"]
+        impression_table = self.tables["impressions"]
+
+        article_id = ARTICLE_ID_BY_URL.get(article_url)
+
+        account_value = literal(account_id, click_table.c.account_id.type)
+        headers_value = literal(headers, click_table.c.headers.type)
+        no_newsletter = cast(null(), click_table.c.newsletter_id.type)
+        no_impression = cast(null(), click_table.c.impression_id.type)
+
+        if newsletter_id:
+            source_query = select(
+                account_value,
+                literal(newsletter_id, click_table.c.newsletter_id.type),
+                impression_table.c.impression_id,
+                impression_table.c.article_id,
+                headers_value,
+            ).where(impression_table.c.newsletter_id == newsletter_id)
+
+            if article_id:
+                source_query = source_query.where(impression_table.c.article_id == article_id)
+            else:
+                source_query = source_query.join(
+                    article_table, article_table.c.article_id == impression_table.c.article_id
+                ).where(article_table.c.url == article_url)
+
+            source_query = source_query.order_by(impression_table.c.position).limit(1)
+        elif article_id:
+            source_query = select(
+                account_value,
+                no_newsletter,
+                no_impression,
+                literal(article_id, click_table.c.article_id.type),
+                headers_value,
+            )
+        else:
+            source_query = (
+                select(account_value, no_newsletter, no_impression, article_table.c.article_id, headers_value)
+                .where(article_table.c.url == article_url)
+                .limit(1)
+            )
+
+        stmt = (
+            insert(click_table)
+            .from_select(
+                ["account_id", "newsletter_id", "impression_id", "article_id", "headers"],
+                source_query,
+            )
+            .returning(click_table.c.article_id)
+        )
+
+        with self.conn.begin():
+            row = self.conn.execute(stmt).first()
+
+        if row is None:
+            return None
+
+        ARTICLE_ID_BY_URL.put(article_url, row.article_id)
+        return row.article_id
+
     def fetch_clicks(self, accounts: list[Account]) -> dict[UUID, list[Click]]:
         click_table = self.tables["clicks"]
 
@@ -72,23 +195,7 @@ class DbClicksRepository(DatabaseRepository):
 
         click_result = self.conn.execute(click_query).fetchall()
 
-        clicked_articles = defaultdict(list)
-        for row in click_result:
-            clicked_articles[row.account_id].append(
-                Click(
-                    newsletter_id=row.newsletter_id,
-                    impression_id=row.impression_id,
-                    article_id=row.article_id,
-                    timestamp=row.created_at,
-                )
-            )
-
-        for account in accounts:
-            account_id = account.account_id
-            if account_id not in clicked_articles:
-                clicked_articles[account_id] = []
-
-        return clicked_articles
+        return self._organize_clicks_by_account(click_result, accounts)
 
     def fetch_clicks_between(self, start_time, end_time, accounts: list[Account] | None) -> dict[UUID, list[Click]]:
         click_table = self.tables["clicks"]
@@ -101,11 +208,12 @@ class DbClicksRepository(DatabaseRepository):
             click_table.c.created_at,
         ).where(
             and_(
-                click_table.c.account_id.in_([acct.account_id for acct in accounts]),
                 click_table.c.created_at >= start_time,
                 click_table.c.created_at <= end_time,
             )
         )
+        if accounts is not None:
+            click_query = click_query.where(click_table.c.account_id.in_([acct.account_id for acct in accounts]))
         click_result = self.conn.execute(click_query).fetchall()
 
         return self._organize_clicks_by_account(click_result, accounts)
@@ -155,7 +263,8 @@ class DbClicksRepository(DatabaseRepository):
         clicked_articles = defaultdict(list)
         for row in click_result:
             clicked_articles[row.account_id].append(
-                Click(
+                hydrate(
+                    Click,
                     newsletter_id=row.newsletter_id,
                     impression_id=row.impression_id,
                     article_id=row.article_id,
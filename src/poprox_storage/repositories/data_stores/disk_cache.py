@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import time
+from pathlib import Path
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+CACHE_DIR_VAR = "POPROX_S3_CACHE_DIR"
+CACHE_MAX_BYTES_VAR = "POPROX_S3_CACHE_MAX_BYTES"
+CACHE_ETAG_TTL_VAR = "POPROX_S3_CACHE_ETAG_TTL"
+DEFAULT_MAX_BYTES = 1024**3
+DEFAULT_ETAG_TTL_SECONDS = 60.0
+MMAP_THRESHOLD_BYTES = 1024**2
+
+
+class S3DiskCache:
+    """
+    A size-bounded on-disk cache of S3 object bodies
+
+    Entries are keyed by a hash of bucket, key and ETag, so a changed object is
+    simply a new entry and stale ones age out. Reading an entry bumps its mtime,
+    and when the cache grows past `max_bytes` the least recently used entries
+    are deleted. Entries larger than `mmap_threshold` are returned as a memoryview
+    of a memory-mapped file rather than read into memory.
+
+    Looking up an entry needs the object's current ETag, which costs a HEAD request.
+    The ETags seen in the last `etag_ttl` seconds are remembered, so repeat reads
+    within that window skip the request (and may serve a version that's that stale).
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        *,
+        mmap_threshold: int = MMAP_THRESHOLD_BYTES,
+        etag_ttl: float = DEFAULT_ETAG_TTL_SECONDS,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self.etag_ttl = etag_ttl
+        self._etags: dict[tuple[str, str], tuple[str, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_served = 0
+        self._lock = Lock()
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    def recent_etag(self, bucket_name: str, key: str) -> str | None:
+        """Return the ETag of an object if it was seen in the last `etag_ttl` seconds"""
+        with self._lock:
+            seen = self._etags.get((bucket_name, key))
+        if seen is None or time.monotonic() - seen[1] >= self.etag_ttl:
+            return None
+        return seen[0]
+
+    def remember_etag(self, bucket_name: str, key: str, etag: str):
+        with self._lock:
+            self._etags[(bucket_name, key)] = (etag, time.monotonic())
+
+    def get(self, bucket_name: str, key: str, etag: str) -> bytes | memoryview | None:
+        """
+        Return the cached body of an object version, or None if it isn't cached
+
+        A memory-mapped body is unmapped once the returned memoryview (and anything
+        sliced from it) is no longer referenced.
+        """
+        path = self._path(bucket_name, key, etag)
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= self.mmap_threshold:
+                    data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                else:
+                    data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.bytes_served += size
+        return data
+
+    def put(self, bucket_name: str, key: str, etag: str, body: bytes):
+        path = self._path(bucket_name, key, etag)
+        path.parent.mkdir(exist_ok=True)
+
+        # Write to a temporary file and rename it so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(body)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for path in self._entries():
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "bytes_served": self.bytes_served,
+            "size": self._size,
+        }
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+            self.evictions += 1
+
+    def _entries(self):
+        return (path for path in self.directory.glob("*/*") if path.suffix != ".tmp")
+
+    def _path(self, bucket_name: str, key: str, etag: str) -> Path:
+        digest = hashlib.sha256(f"{bucket_name}/{key}/{etag}".encode()).hexdigest()
+        return self.directory / digest[:2] / digest
+
+
+def cache_from_environment() -> S3DiskCache | None:
+    """
+    Build the cache configured by `POPROX_S3_CACHE_DIR` (and optionally
+    `POPROX_S3_CACHE_MAX_BYTES` and `POPROX_S3_CACHE_ETAG_TTL`), if any
+    """
+    directory = os.environ.get(CACHE_DIR_VAR)
+    if not directory:
+        return None
+
+    max_bytes = int(os.environ.get(CACHE_MAX_BYTES_VAR, DEFAULT_MAX_BYTES))
+    etag_ttl = float(os.environ.get(CACHE_ETAG_TTL_VAR, DEFAULT_ETAG_TTL_SECONDS))
+    logger.info(f"Caching S3 reads in {directory} (up to {max_bytes} bytes, rechecking ETags after {etag_ttl}s)")
+    return S3DiskCache(directory, max_bytes, etag_ttl=etag_ttl)
@@ -0,0 +1,117 @@
+import logging
+import os
+import random
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cache
+from typing import Callable, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+@dataclass(frozen=True)
+class HydrationMode:
+    trusted: bool = False
+    sample_rate: float = 0.0
+
+
+# The process-wide default, which `trusted_hydration` overrides for the current context
+_default_mode = HydrationMode(
+    trusted=os.environ.get("POPROX_TRUSTED_HYDRATION", "").lower() in ("1", "true", "yes"),
+    sample_rate=float(os.environ.get("POPROX_TRUSTED_HYDRATION_SAMPLE_RATE", 0.0)),
+)
+_mode: ContextVar[HydrationMode | None] = ContextVar("hydration_mode", default=None)
+
+
+def set_trusted_hydration(enabled: bool, *, sample_rate: float = 0.0):
+    """Turn trusted hydration on or off for the whole process"""
+    global _default_mode
+    _default_mode = HydrationMode(trusted=enabled, sample_rate=sample_rate)
+
+
+@contextmanager
+def trusted_hydration(enabled: bool = True, *, sample_rate: float = 0.0) -> Iterator[None]:
+    """
+    Build models from database rows without pydantic validation inside this block
+
+    Rows have already passed the database's constraints, so validating them again
+    mostly costs time. `sample_rate` validates that fraction of objects anyway,
+    to catch drift between the schema and the models.
+    """
+    token = _mode.set(HydrationMode(trusted=enabled, sample_rate=sample_rate))
+    try:
+        yield
+    finally:
+        _mode.reset(token)
+
+
+def hydrate(model_cls: type[ModelT], /, **fields) -> ModelT:
+    """
+    Build a model from database values, skipping validation in trusted mode
+
+    In trusted mode values are stored as given, so nested models must already be
+    model instances and values aren't coerced (e.g. enum fields keep the raw
+    database value). Defaults are still filled in for fields that aren't given,
+    but model validators don't run.
+    """
+    mode = _mode.get() or _default_mode
+    if not mode.trusted:
+        return model_cls(**fields)
+
+    if mode.sample_rate and random.random() < mode.sample_rate:
+        try:
+            return model_cls(**fields)
+        except ValidationError as exc:
+            logger.error(f"Sampled validation of trusted {model_cls.__name__} failed: {exc}")
+            raise
+
+    return _constructor(model_cls)(fields)
+
+
+_object_setattr = object.__setattr__
+
+
+@cache
+def _constructor(model_cls: type[ModelT]) -> Callable[[dict], ModelT]:
+    """
+    Build a function that fills in a model's attributes directly
+
+    `model_construct` is pure Python and in practice is slower than pydantic's
+    compiled validation for flat models, so this does the minimum it would do.
+    """
+    if model_cls.__private_attributes__ or model_cls.model_config.get("extra") == "allow":
+        return lambda fields: model_cls.model_construct(**fields)
+
+    # Plain immutable defaults can be shared; factories and mutable defaults (which
+    # pydantic copies) have to be produced fresh for each instance
+    shared_defaults = {}
+    fresh_defaults = []
+    for name, field in model_cls.model_fields.items():
+        if field.is_required():
+            continue
+        if field.default_factory is None and isinstance(field.default, (str, int, float, bool, type(None))):
+            shared_defaults[name] = field.default
+        else:
+            fresh_defaults.append((name, field))
+
+    def construct(fields: dict) -> ModelT:
+        values = {**shared_defaults, **fields}
+        for name, field in fresh_defaults:
+            if name not in fields:
+                values[name] = field.get_default(call_default_factory=True)
+
+        model = model_cls.__new__(model_cls)
+        _object_setattr(model, "__dict__", values)
+        _object_setattr(model, "__pydantic_fields_set__", set(fields))
+        _object_setattr(model, "__pydantic_extra__", None)
+        _object_setattr(model, "__pydantic_private__", None)
+        return model
+
+    return construct
@@ -0,0 +1,82 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# How far behind the current time an export stops, so rows in transactions that
+# were still open when it ran (stamped with times in the past) aren't skipped
+DEFAULT_EXPORT_LAG = timedelta(minutes=5)
+# How many delta files accumulate before they're compacted into a new snapshot
+DEFAULT_COMPACT_EVERY = 7
+
+
+@dataclass
+class ExportCheckpoint:
+    """
+    How far an incremental export has gotten, and the files that hold what it's exported
+
+    An export's full contents are the rows of the snapshot, followed by the rows
+    of each delta in order, where later rows replace earlier ones with the same key.
+
+    Each run exports the rows stamped before its high-water mark, which trails the
+    time it ran by `DEFAULT_EXPORT_LAG`. The stamps are set by the database when a
+    row is written (`updated_at` by a trigger, `ingested_at` by a column default,
+    both using `clock_timestamp()`), never taken from the data. So every row is
+    exported exactly once, as long as the transaction that wrote it commits within
+    the lag of writing it. A row committed later than that is never exported.
+    """
+
+    high_water_mark: datetime | None = None
+    snapshot_key: str | None = None
+    delta_keys: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "high_water_mark": self.high_water_mark.isoformat() if self.high_water_mark else None,
+            "snapshot_key": self.snapshot_key,
+            "delta_keys": self.delta_keys,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExportCheckpoint":
+        high_water_mark = data.get("high_water_mark")
+        return cls(
+            high_water_mark=datetime.fromisoformat(high_water_mark) if high_water_mark else None,
+            snapshot_key=data.get("snapshot_key"),
+            delta_keys=list(data.get("delta_keys") or []),
+        )
+
+
+@dataclass
+class IncrementalExportResult:
+    """What one run of an incremental export wrote"""
+
+    name: str
+    checkpoint: ExportCheckpoint
+    num_rows: int = 0
+    written_keys: list[str] = field(default_factory=list)
+    compacted: bool = False
+
+
+def load_export_checkpoint(s3_client, bucket_name: str, key: str) -> ExportCheckpoint:
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return ExportCheckpoint()
+        raise
+    return ExportCheckpoint.from_dict(json.loads(response["Body"].read()))
+
+
+def save_export_checkpoint(s3_client, bucket_name: str, key: str, checkpoint: ExportCheckpoint):
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=json.dumps(checkpoint.to_dict()).encode("utf-8"),
+        ContentType="application/json",
+    )
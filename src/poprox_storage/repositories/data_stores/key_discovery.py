@@ -0,0 +1,168 @@
+import json
+import logging
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+@dataclass
+class KeyCheckpoint:
+    """
+    The newest object seen under a prefix by a previous ingest run
+
+    `LastModified` only has one-second resolution, so more objects can turn up
+    with the same time as `last_modified` after a run has listed the prefix.
+    `recent_keys` holds the keys (and modification times) already seen within the
+    listing overlap of `last_modified`, so those can be listed again without being
+    returned twice.
+    """
+
+    last_key: str | None = None
+    last_modified: datetime | None = None
+    recent_keys: dict[str, datetime] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "last_key": self.last_key,
+            "last_modified": self.last_modified.isoformat() if self.last_modified else None,
+            "recent_keys": {key: modified.isoformat() for key, modified in self.recent_keys.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KeyCheckpoint":
+        last_modified = data.get("last_modified")
+        return cls(
+            last_key=data.get("last_key"),
+            last_modified=datetime.fromisoformat(last_modified) if last_modified else None,
+            recent_keys={
+                key: datetime.fromisoformat(modified) for key, modified in (data.get("recent_keys") or {}).items()
+            },
+        )
+
+
+class S3KeyDiscovery:
+    """
+    Lists S3 objects under a prefix, following continuation tokens past the
+    1000-key page limit of `list_objects_v2`
+
+    High-water marks can be persisted as small JSON objects under `checkpoint_prefix`
+    so that each ingest run only lists objects that arrived since the last one.
+    When keys sort in arrival order (e.g. they're named with timestamps or live
+    under date-partitioned prefixes), pass `ordered_keys=True` and listing resumes
+    with `StartAfter`, so S3 skips the old keys entirely. Otherwise the whole
+    prefix is still listed, but only objects modified since the mark (less the
+    `overlap`) that weren't already returned are.
+    """
+
+    def __init__(self, s3_client, bucket_name: str, *, checkpoint_prefix: str = "ingest-checkpoints"):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.checkpoint_prefix = checkpoint_prefix
+
+    def list_objects(self, prefix: str, *, start_after: str | None = None) -> Iterator[dict]:
+        """Yield every object under `prefix` (in key order), optionally starting after the key `start_after`"""
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+
+        while True:
+            response = self.s3_client.list_objects_v2(**kwargs)
+            yield from response.get("Contents", [])
+
+            if not response.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def list_date_partitioned_objects(
+        self, prefix: str, start: date, end: date, *, date_format: str = "%Y/%m/%d/"
+    ) -> Iterator[dict]:
+        """Yield objects under `prefix` + `date_format` for each day from `start` through `end`"""
+        day = start
+        while day <= end:
+            yield from self.list_objects(f"{prefix}{day.strftime(date_format)}")
+            day += timedelta(days=1)
+
+    def list_new_objects(
+        self, prefix: str, checkpoint_name: str, *, ordered_keys: bool = False, overlap: timedelta = timedelta(0)
+    ) -> tuple[list[dict], KeyCheckpoint]:
+        """
+        List objects under `prefix` that are newer than the stored checkpoint
+
+        Without `ordered_keys`, objects modified in the same second as the mark are
+        listed again and skipped if they were already returned. A positive `overlap`
+        re-lists further back than that, for objects whose `LastModified` is earlier
+        than when they appeared (multipart uploads are stamped with the time they
+        started). Every key seen in the overlap is kept in the checkpoint.
+
+        Returns the new objects and the checkpoint covering them. The checkpoint
+        is not saved; call `save_checkpoint` once the objects have been ingested.
+        """
+        checkpoint = self.load_checkpoint(checkpoint_name)
+
+        if ordered_keys:
+            objects = list(self.list_objects(prefix, start_after=checkpoint.last_key))
+        elif checkpoint.last_modified is None:
+            objects = list(self.list_objects(prefix))
+        else:
+            since = checkpoint.last_modified - overlap
+            objects = [
+                obj
+                for obj in self.list_objects(prefix)
+                if obj["LastModified"] >= since and obj["Key"] not in checkpoint.recent_keys
+            ]
+
+        logger.info(f"Found {len(objects)} new objects under s3://{self.bucket_name}/{prefix}")
+        return objects, advance_checkpoint(checkpoint, objects, overlap=overlap)
+
+    def load_checkpoint(self, checkpoint_name: str) -> KeyCheckpoint:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._checkpoint_key(checkpoint_name))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return KeyCheckpoint()
+            raise
+        return KeyCheckpoint.from_dict(json.loads(response["Body"].read()))
+
+    def save_checkpoint(self, checkpoint_name: str, checkpoint: KeyCheckpoint):
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=self._checkpoint_key(checkpoint_name),
+            Body=json.dumps(checkpoint.to_dict()).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def _checkpoint_key(self, checkpoint_name: str) -> str:
+        return f"{self.checkpoint_prefix}/{checkpoint_name}.json"
+
+
+def advance_checkpoint(
+    checkpoint: KeyCheckpoint, objects: list[dict], *, overlap: timedelta = timedelta(0)
+) -> KeyCheckpoint:
+    """Move a checkpoint forward past the given objects, remembering the keys seen within `overlap` of the new mark"""
+    if not objects:
+        return checkpoint
+
+    last_key = max(obj["Key"] for obj in objects)
+    last_modified = max(obj["LastModified"] for obj in objects)
+    if checkpoint.last_key is not None:
+        last_key = max(last_key, checkpoint.last_key)
+    if checkpoint.last_modified is not None:
+        last_modified = max(last_modified, checkpoint.last_modified)
+
+    seen = {**checkpoint.recent_keys, **{obj["Key"]: obj["LastModified"] for obj in objects}}
+    recent_keys = {key: modified for key, modified in seen.items() if modified >= last_modified - overlap}
+
+    return KeyCheckpoint(last_key=last_key, last_modified=last_modified, recent_keys=recent_keys)
+
+
+def most_recent_keys(objects: list[dict], limit: int | None = None) -> list[str]:
+    """Sort objects by `LastModified` (newest first) and return up to `limit` of their keys"""
+    files = sorted(objects, key=lambda d: d["LastModified"], reverse=True)
+    if limit:
+        files = files[:limit]
+    return [f["Key"] for f in files]
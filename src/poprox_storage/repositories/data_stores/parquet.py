@@ -0,0 +1,251 @@
+import json
+from collections import defaultdict
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from urllib.parse import quote
+from uuid import UUID
+
+# Partition directory name for records without a value, as Hive and Spark name it
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+# The partition key that's derived from a record's timestamp rather than read from it
+DATE_PARTITION = "date"
+DEFAULT_TARGET_FILE_BYTES = 128 * 1024**2
+DEFAULT_ROW_GROUP_ROWS = 128 * 1024
+MANIFEST_NAME = "_manifest.json"
+SCHEMA_METADATA_KEY = b"poprox.schema"
+
+
+@dataclass
+class ExportSchema:
+    """
+    The declared columns of a Parquet export, and how to encode them
+
+    `fields` maps column names to Arrow type names (see `_arrow_type`) and fixes
+    the columns' types and order from run to run. Records can still carry columns
+    that aren't declared (e.g. an impression's `extra` values), which are inferred
+    and written after the declared ones. Changing a declared type or removing a
+    column should come with a new `version`, which is stored in the file metadata.
+    """
+
+    name: str
+    version: int
+    fields: dict[str, str]
+    # Low-cardinality columns, where dictionary encoding pays off
+    dictionary: tuple[str, ...] = ()
+    # Columns to keep min/max statistics for, or None for all of them
+    statistics: tuple[str, ...] | None = None
+    compression: str = "zstd"
+    row_group_rows: int = DEFAULT_ROW_GROUP_ROWS
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}/v{self.version}"
+
+    def arrow_schema(self, records: list[dict] = ()):
+        import pyarrow as pa
+
+        declared = [pa.field(name, _arrow_type(type_name)) for name, type_name in self.fields.items()]
+        extra = [field for field in infer_schema(records) if field.name not in self.fields]
+        return pa.schema(declared + extra, metadata={SCHEMA_METADATA_KEY: self.label})
+
+    def to_table(self, records: list[dict], schema=None):
+        """Convert flattened records to an Arrow table, parsing timestamps that were serialized as ISO strings"""
+        import pyarrow as pa
+
+        timestamps = [name for name, type_name in self.fields.items() if type_name == "timestamp"]
+        if timestamps:
+            records = [_parse_timestamps(record, timestamps) for record in records]
+        return pa.Table.from_pylist(records, schema=schema or self.arrow_schema(records))
+
+    def write_options(self, schema) -> dict:
+        """Keyword arguments for `pyarrow.parquet.write_table`"""
+        names = set(schema.names)
+        return {
+            "compression": self.compression,
+            "use_dictionary": [name for name in self.dictionary if name in names],
+            "write_statistics": True
+            if self.statistics is None
+            else [name for name in self.statistics if name in names],
+            "row_group_size": self.row_group_rows,
+        }
+
+
+@dataclass
+class DatasetFile:
+    key: str
+    partition: dict[str, str]
+    num_rows: int
+    num_bytes: int
+
+
+@dataclass
+class DatasetManifest:
+    """A description of a partitioned Parquet dataset, written alongside it as `_manifest.json`"""
+
+    bucket_name: str
+    root: str
+    partition_by: list[str]
+    created_at: datetime
+    schema: dict[str, str] = field(default_factory=dict)
+    files: list[DatasetFile] = field(default_factory=list)
+    schema_version: str | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.root}/{MANIFEST_NAME}"
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket_name}/{self.root}"
+
+    @property
+    def num_rows(self) -> int:
+        return sum(f.num_rows for f in self.files)
+
+    def to_dict(self) -> dict:
+        return {
+            "uri": self.uri,
+            "partition_by": self.partition_by,
+            "created_at": self.created_at.isoformat(),
+            "num_rows": self.num_rows,
+            "schema_version": self.schema_version,
+            "schema": self.schema,
+            "files": [asdict(f) for f in sorted(self.files, key=lambda f: f.key)],
+        }
+
+
+def flatten_records(records: list[dict]) -> list[dict]:
+    """
+    Flatten records for writing as Parquet, converting:
+    - UUIDs in keys to strings
+    - nested dicts in values to JSON strings
+    """
+    flattened_records = []
+    for record in records:
+        flattened_record = {}
+        for key, value in record.items():
+            if isinstance(key, UUID):
+                record_key = str(key)
+            else:
+                record_key = key
+
+            if isinstance(value, dict):
+                nested_dict = {}
+                for nested_key, nested_value in value.items():
+                    if isinstance(nested_key, UUID):
+                        nested_dict[str(nested_key)] = nested_value
+                    else:
+                        nested_dict[nested_key] = nested_value
+                flattened_record[record_key] = json.dumps(nested_dict)  # Convert dict to JSON string
+            else:
+                flattened_record[record_key] = value
+        flattened_records.append(flattened_record)
+    return flattened_records
+
+
+def infer_schema(records: list[dict]):
+    """Build an Arrow schema from the first non-null value of each field"""
+    import pyarrow as pa
+
+    all_fields = {}
+    for record in records:
+        for key, value in record.items():
+            if value is None:
+                continue
+            if key not in all_fields:
+                if isinstance(value, str):
+                    all_fields[key] = pa.string()
+                elif isinstance(value, int):
+                    all_fields[key] = pa.int64()
+                elif isinstance(value, float):
+                    all_fields[key] = pa.float64()
+                elif isinstance(value, bool):
+                    all_fields[key] = pa.bool_()
+                elif isinstance(value, datetime):
+                    all_fields[key] = pa.timestamp("us")
+                else:
+                    all_fields[key] = pa.string()  # fallback as string
+
+    # Define a schema that includes all possible fields
+    return pa.schema([pa.field(key, all_fields.get(key, pa.string())) for key in all_fields])
+
+
+def merge_tables(tables: list, key_columns: Sequence[str] = ()):
+    """
+    Concatenate Arrow tables in order, keeping only the last row for each key
+
+    Columns missing from some of the tables are filled with nulls. Without
+    `key_columns`, every row is kept.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = pa.concat_tables(tables, promote_options="default")
+    if not key_columns or table.num_rows == 0:
+        return table
+
+    row_numbers = table.append_column("_row", pa.array(range(table.num_rows), pa.int64()))
+    last_rows = row_numbers.group_by(list(key_columns)).aggregate([("_row", "max")])["_row_max"]
+    # Keep the surviving rows in their original order
+    return table.take(pc.take(last_rows, pc.sort_indices(last_rows)))
+
+
+def partition_records(
+    records: list[dict], partition_by: Sequence[str], date_column: str | None = None
+) -> dict[tuple[str, ...], list[dict]]:
+    """
+    Group records by their (escaped) partition values
+
+    Partition columns are removed from the records, since readers recover them
+    from the file paths. The `date` partition is derived from `date_column`
+    instead, which is kept.
+    """
+    partitions = defaultdict(list)
+    for record in records:
+        record = dict(record)
+        values = []
+        for name in partition_by:
+            if name == DATE_PARTITION and date_column:
+                value = _partition_date(record.get(date_column))
+            else:
+                value = record.pop(name, None)
+            values.append(NULL_PARTITION if value in (None, "") else quote(str(value), safe=""))
+        partitions[tuple(values)].append(record)
+    return partitions
+
+
+def partition_path(partition_by: Sequence[str], values: Sequence[str]) -> str:
+    return "/".join(f"{name}={value}" for name, value in zip(partition_by, values))
+
+
+def _partition_date(value) -> str | None:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str) and value:
+        return datetime.fromisoformat(value).date().isoformat()
+    return None
+
+
+def _arrow_type(type_name: str):
+    import pyarrow as pa
+
+    if type_name == "timestamp":
+        return pa.timestamp("us")
+    if type_name == "json":
+        # Nested values are serialized to JSON strings by `flatten_records`
+        return pa.string()
+    return getattr(pa, type_name)()
+
+
+def _parse_timestamps(record: dict, columns: list[str]) -> dict:
+    if not any(isinstance(record.get(column), str) for column in columns):
+        return record
+    record = dict(record)
+    for column in columns:
+        value = record.get(column)
+        if isinstance(value, str):
+            record[column] = datetime.fromisoformat(value) if value else None
+    return record
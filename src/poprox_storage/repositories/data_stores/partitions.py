@@ -0,0 +1,52 @@
+import logging
+
+from sqlalchemy import Connection, text
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Tables partitioned by month on `created_at` (see the 16b0a5d29280 migration)
+PARTITIONED_TABLES = ("clicks", "web_logins")
+DEFAULT_MONTHS_AHEAD = 3
+
+
+def ensure_future_partitions(
+    conn: Connection, months_ahead: int = DEFAULT_MONTHS_AHEAD, *, commit: bool = True
+) -> list[str]:
+    """
+    Create any missing monthly partitions through `months_ahead` months from now
+
+    Meant to be run on a schedule (it's idempotent and cheap when there's nothing
+    to do). Rows that arrive before their partition exists land in the table's
+    default partition, which has to be emptied before that month's partition can
+    be created, so this should run well ahead of the months it covers.
+
+    Returns the names of the partitions created
+    """
+    created = []
+    for table in PARTITIONED_TABLES:
+        result = conn.execute(
+            text("SELECT ensure_monthly_partitions(:parent, :months_ahead)"),
+            {"parent": table, "months_ahead": months_ahead},
+        )
+        created.extend(row[0] for row in result)
+
+    if commit:
+        conn.commit()
+
+    if created:
+        logger.info(f"Created partitions {', '.join(created)}")
+    return created
+
+
+def create_monthly_partitions(conn: Connection, table: str, from_month, to_month, *, commit: bool = True) -> list[str]:
+    """Create any missing monthly partitions of `table` covering `from_month` through `to_month`"""
+    result = conn.execute(
+        text("SELECT create_monthly_partitions(:parent, :from_month, :to_month)"),
+        {"parent": table, "from_month": from_month, "to_month": to_month},
+    )
+    created = [row[0] for row in result]
+
+    if commit:
+        conn.commit()
+    return created
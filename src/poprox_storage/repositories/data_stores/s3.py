@@ -1,9 +1,35 @@
+import io
+import json
+import logging
+import random
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
 from functools import wraps
-from typing import get_type_hints
-from uuid import UUID
+from typing import Any, get_type_hints
 
+import boto3
 from smart_open import open as smart_open
+from smart_open.compression import compression_wrapper, get_supported_extensions
+
+from poprox_storage.repositories.data_stores.disk_cache import S3DiskCache, cache_from_environment
+from poprox_storage.repositories.data_stores.parquet import (
+    DATE_PARTITION,
+    DEFAULT_TARGET_FILE_BYTES,
+    DatasetFile,
+    DatasetManifest,
+    ExportSchema,
+    flatten_records,
+    infer_schema,
+    merge_tables,
+    partition_path,
+    partition_records,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
 
 
 def inject_s3_repos(handler):
@@ -25,9 +51,27 @@ def inject_s3_repos(handler):
     return wrapper
 
 
+@dataclass
+class FetchResult:
+    """The outcome of fetching (and optionally parsing) one S3 object"""
+
+    key: str
+    value: Any = None
+    error: Exception | None = None
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
 class S3Repository:
     _repository_types = set()
 
+    # Shared by all repositories unless one is given its own; only enabled when
+    # POPROX_S3_CACHE_DIR is set, since Lambdas have little (and ephemeral) disk
+    disk_cache: S3DiskCache | None = cache_from_environment()
+
     def __init__(self, bucket_name):
         self.bucket_name: str = bucket_name
 
@@ -39,77 +83,293 @@ class S3Repository:
         cls._repository_types.add(cls)
 
     def fetch_file_contents(self, key):
+        if self.disk_cache is not None:
+            return _decode_cached_body(key, self._fetch_cached_file_bytes(key))
+
         load_path = f"s3://{self.bucket_name}/{key}"
 
-        with smart_open(load_path, "r") as f:
+        with smart_open(load_path, "r", transport_params=self._transport_params()) as f:
             return f.read()
 
+    def fetch_many(
+        self,
+        keys: Iterable[str],
+        parse: Callable[[str], Any] | None = None,
+        *,
+        max_workers: int = 16,
+        max_attempts: int = 3,
+        backoff_seconds: float = 0.5,
+    ) -> Iterator[FetchResult]:
+        """
+        Download (and optionally parse) many objects concurrently, yielding results as they complete
+
+        Each key is retried up to `max_attempts` times with jittered exponential
+        backoff. A key that still fails is yielded with its `error` set rather than
+        raised, so one bad file doesn't stop the rest of the batch.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._fetch_with_retries, key, parse, max_attempts, backoff_seconds) for key in keys
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _fetch_with_retries(
+        self, key: str, parse: Callable[[str], Any] | None, max_attempts: int, backoff_seconds: float
+    ) -> FetchResult:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                contents = self.fetch_file_contents(key)
+                value = parse(contents) if parse else contents
+                return FetchResult(key=key, value=value, attempts=attempt)
+            except Exception as exc:
+                if attempt == max_attempts:
+                    logger.error(f"Failed to fetch s3://{self.bucket_name}/{key} after {attempt} attempts: {exc}")
+                    return FetchResult(key=key, error=exc, attempts=attempt)
+                time.sleep(backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    def fetch_file_bytes(self, key) -> bytes | memoryview:
+        """
+        Fetch an object's raw body, without decoding it
+
+        With the disk cache enabled, large cached objects come back as a memoryview
+        of a memory-mapped file, so parsers that accept bytes-like input can read
+        them without copying them into memory first.
+        """
+        if self.disk_cache is not None:
+            return self._fetch_cached_file_bytes(key)
+        return self._client().get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+
+    def _fetch_cached_file_bytes(self, key) -> bytes | memoryview:
+        client = self._client()
+        etag = self.disk_cache.recent_etag(self.bucket_name, key)
+        if etag is None:
+            etag = client.head_object(Bucket=self.bucket_name, Key=key)["ETag"]
+            self.disk_cache.remember_etag(self.bucket_name, key, etag)
+
+        cached = self.disk_cache.get(self.bucket_name, key, etag)
+        if cached is not None:
+            return cached
+
+        # Cache the body under the ETag it came with, which is newer than the one
+        # looked up if the object changed in between
+        response = client.get_object(Bucket=self.bucket_name, Key=key)
+        body = response["Body"].read()
+        self.disk_cache.remember_etag(self.bucket_name, key, response["ETag"])
+        self.disk_cache.put(self.bucket_name, key, response["ETag"], body)
+        return body
+
+    def _client(self):
+        client = getattr(self, "s3_client", None)
+        if client is None:
+            client = self.s3_client = boto3.client("s3")
+        return client
+
+    def _transport_params(self) -> dict:
+        # boto3 clients are thread-safe, so share the repository's client (when it
+        # has one) instead of letting smart_open build a new one for every file
+        client = getattr(self, "s3_client", None)
+        return {"client": client} if client is not None else {}
+
+    def _parquet_filesystem(self):
+        from pyarrow import fs
+
+        return fs.S3FileSystem(region="us-east-1")
+
+    def _store_records_as_parquet(
+        self,
+        records: list[dict],
+        bucket_name: str,
+        file_prefix: str,
+        start_time: datetime = None,
+        *,
+        partition_by: Sequence[str] | None = None,
+        date_column: str | None = "created_at",
+        schema: ExportSchema | None = None,
+    ) -> str | DatasetManifest:
+        """Write records as a single Parquet file, or as a partitioned dataset when `partition_by` is given"""
+        if partition_by is None:
+            return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time, schema=schema)
+        return self._write_records_as_parquet_dataset(
+            records,
+            bucket_name,
+            file_prefix,
+            start_time,
+            partition_by=partition_by,
+            date_column=date_column,
+            schema=schema,
+        )
+
     def _write_records_as_parquet(
         self,
         records: list[dict],
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        schema: ExportSchema | None = None,
     ):
-        import json
+        """
+        Write records as a single Parquet file
 
+        With an export `schema`, its declared types and encoding are used. Without
+        one, the schema is inferred from the records and written with pyarrow's defaults.
+        """
         import pyarrow as pa
         import pyarrow.parquet as pq
-        from pyarrow import fs
 
-        s3 = fs.S3FileSystem(region="us-east-1")
+        s3 = self._parquet_filesystem()
 
         start_time = start_time or datetime.now()
         file_name = f"{file_prefix}_{start_time.strftime('%Y%m%d-%H%M%S')}.parquet"
 
-        # Flatten records, converting:
-        # - UUIDs in keys to strings
-        # - nested dicts in values to JSON strings
-        flattened_records = []
-        for record in records:
-            flattened_record = {}
-            for key, value in record.items():
-                if isinstance(key, UUID):
-                    record_key = str(key)
-                else:
-                    record_key = key
-
-                if isinstance(value, dict):
-                    nested_dict = {}
-                    for nested_key, nested_value in value.items():
-                        if isinstance(nested_key, UUID):
-                            nested_dict[str(nested_key)] = nested_value
-                        else:
-                            nested_dict[nested_key] = nested_value
-                    flattened_record[record_key] = json.dumps(nested_dict)  # Convert dict to JSON string
-                else:
-                    flattened_record[record_key] = value
-            flattened_records.append(flattened_record)
-
-        all_fields = {}
-        for record in flattened_records:
-            for key, value in record.items():
-                if value is None:
-                    continue
-                if key not in all_fields:
-                    if isinstance(value, str):
-                        all_fields[key] = pa.string()
-                    elif isinstance(value, int):
-                        all_fields[key] = pa.int64()
-                    elif isinstance(value, float):
-                        all_fields[key] = pa.float64()
-                    elif isinstance(value, bool):
-                        all_fields[key] = pa.bool_()
-                    elif isinstance(value, datetime):
-                        all_fields[key] = pa.timestamp("us")
-                    else:
-                        all_fields[key] = pa.string()  # fallback as string
-
-        # Define a schema that includes all possible fields
-        schema = pa.schema([pa.field(key, all_fields.get(key, pa.string())) for key in all_fields])
-        arrow_table = pa.Table.from_pylist(flattened_records, schema=schema)
+        flattened_records = flatten_records(records)
+        if schema is not None:
+            arrow_table = schema.to_table(flattened_records)
+            write_options = schema.write_options(arrow_table.schema)
+        else:
+            arrow_table = pa.Table.from_pylist(flattened_records, schema=infer_schema(flattened_records))
+            write_options = {}
+
+        with s3.open_output_stream(f"{bucket_name}/{file_name}") as file_:
+            pq.write_table(arrow_table, file_, **write_options)
+
+        return file_name
+
+    def _compact_parquet_files(
+        self,
+        keys: list[str],
+        bucket_name: str,
+        file_prefix: str,
+        start_time: datetime = None,
+        *,
+        key_columns: Sequence[str] = (),
+        schema: ExportSchema | None = None,
+    ) -> str:
+        """
+        Merge Parquet files (in the order given) into a single new file
+
+        With `key_columns`, rows from later files replace rows from earlier ones
+        that have the same key, so a snapshot followed by its deltas compacts to
+        a new snapshot. Returns the new file's key; the old files are left in place.
+        """
+        import pyarrow.parquet as pq
+
+        s3 = self._parquet_filesystem()
+
+        start_time = start_time or datetime.now()
+        file_name = f"{file_prefix}_{start_time.strftime('%Y%m%d-%H%M%S')}.parquet"
+
+        tables = []
+        for key in keys:
+            with s3.open_input_file(f"{bucket_name}/{key}") as file_:
+                tables.append(pq.read_table(file_))
+        arrow_table = merge_tables(tables, key_columns)
+        write_options = schema.write_options(arrow_table.schema) if schema is not None else {}
 
         with s3.open_output_stream(f"{bucket_name}/{file_name}") as file_:
-            pq.write_table(arrow_table, file_)
+            pq.write_table(arrow_table, file_, **write_options)
 
+        logger.info(f"Compacted {len(keys)} files ({arrow_table.num_rows} rows) into s3://{bucket_name}/{file_name}")
         return file_name
+
+    def _write_records_as_parquet_dataset(
+        self,
+        records: list[dict],
+        bucket_name: str,
+        file_prefix: str,
+        start_time: datetime = None,
+        *,
+        partition_by: Sequence[str] = (),
+        date_column: str | None = "created_at",
+        target_file_bytes: int = DEFAULT_TARGET_FILE_BYTES,
+        max_workers: int = 8,
+        schema: ExportSchema | None = None,
+    ) -> DatasetManifest:
+        """
+        Write records as a Hive-partitioned dataset of Parquet files, plus a manifest
+
+        Files are written under `{file_prefix}_{timestamp}/`, in one directory per
+        combination of `partition_by` values (e.g. `date=2024-06-01/group_id=.../part-00000.parquet`),
+        so readers can skip the partitions they don't need. The `date` partition is
+        taken from each record's `date_column`; without one, the records need a `date`
+        of their own, or a `ValueError` is raised. Partitions bigger than roughly
+        `target_file_bytes` (measured in memory, so files come out smaller) are split
+        across several files, and files are written concurrently. An export `schema`
+        is applied to every file, as in `_write_records_as_parquet`.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        s3 = self._parquet_filesystem()
+
+        partition_by = list(partition_by)
+        if DATE_PARTITION in partition_by and not date_column and not any(DATE_PARTITION in r for r in records):
+            msg = f"Can't partition {file_prefix} by {DATE_PARTITION!r} without a date_column to take it from"
+            raise ValueError(msg)
+
+        start_time = start_time or datetime.now()
+        root = f"{file_prefix}_{start_time.strftime('%Y%m%d-%H%M%S')}"
+
+        flattened_records = flatten_records(records)
+        if schema is not None:
+            arrow_schema = schema.arrow_schema(flattened_records)
+        else:
+            arrow_schema = infer_schema(flattened_records)
+
+        # Partition columns aren't stored in the files themselves, except for `date`, which is derived
+        stored_in_path = {name for name in partition_by if not (name == DATE_PARTITION and date_column)}
+        file_schema = pa.schema(
+            [f for f in arrow_schema if f.name not in stored_in_path], metadata=arrow_schema.metadata
+        )
+        write_options = schema.write_options(file_schema) if schema is not None else {}
+
+        manifest = DatasetManifest(
+            bucket_name=bucket_name,
+            root=root,
+            partition_by=partition_by,
+            created_at=start_time,
+            schema={name: str(arrow_schema.field(name).type) for name in arrow_schema.names},
+            schema_version=schema.label if schema is not None else None,
+        )
+
+        def write_file(key: str, partition: dict[str, str], table) -> DatasetFile:
+            with s3.open_output_stream(f"{bucket_name}/{key}") as file_:
+                pq.write_table(table, file_, **write_options)
+                num_bytes = file_.tell()
+            return DatasetFile(key=key, partition=partition, num_rows=table.num_rows, num_bytes=num_bytes)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for values, rows in partition_records(flattened_records, partition_by, date_column).items():
+                if schema is not None:
+                    table = schema.to_table(rows, schema=file_schema)
+                else:
+                    table = pa.Table.from_pylist(rows, schema=file_schema)
+                directory = "/".join(filter(None, [root, partition_path(partition_by, values)]))
+
+                row_bytes = max(1, table.nbytes // max(1, table.num_rows))
+                rows_per_file = max(1, target_file_bytes // row_bytes)
+                for part, offset in enumerate(range(0, table.num_rows, rows_per_file)):
+                    key = f"{directory}/part-{part:05d}.parquet"
+                    partition = dict(zip(partition_by, values))
+                    futures.append(executor.submit(write_file, key, partition, table.slice(offset, rows_per_file)))
+
+            for future in as_completed(futures):
+                manifest.files.append(future.result())
+
+        # Written last, so a dataset with a manifest is known to be complete
+        with s3.open_output_stream(f"{bucket_name}/{manifest.key}") as file_:
+            file_.write(json.dumps(manifest.to_dict(), indent=2).encode("utf-8"))
+
+        logger.info(f"Wrote {manifest.num_rows} records in {len(manifest.files)} files to {manifest.uri}")
+        return manifest
+
+
+def _decode_cached_body(key: str, body: bytes | memoryview) -> str:
+    # smart_open decompresses objects based on their extension when it reads them
+    # from S3, so cached bodies are decompressed the same way to match
+    for extension in get_supported_extensions():
+        if key.endswith(extension):
+            with compression_wrapper(io.BytesIO(body), "rb", extension) as f:
+                return f.read().decode("utf-8")
+    return str(body, "utf-8")
@@ -10,12 +10,28 @@ from sqlalchemy import (
 
 from poprox_concepts.domain import Demographics
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.parquet import ExportSchema
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
+DEMOGRAPHICS_SCHEMA = ExportSchema(
+    "demographics",
+    version=1,
+    fields={
+        "account_id": "string",
+        "birth_year": "int64",
+        "education": "string",
+        "gender": "string",
+        "race": "string",
+        "zip3": "string",
+    },
+    dictionary=("birth_year", "education", "gender", "race", "zip3"),
+)
+
+
 class DbDemographicsRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
         super().__init__(connection)
@@ -95,7 +111,7 @@ class S3DemographicsRepository(S3Repository):
         start_time: datetime = None,
     ):
         records = convert_to_records(demographics)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time, schema=DEMOGRAPHICS_SCHEMA)
 
 
 def convert_to_records(demographics: list[Demographics]) -> list[dict]:
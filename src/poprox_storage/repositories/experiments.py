@@ -1,4 +1,5 @@
 import datetime
+from collections.abc import Sequence
 from uuid import UUID
 
 from sqlalchemy import Connection, Table, and_, select, update
@@ -15,8 +16,16 @@ from poprox_storage.concepts.experiment import (
 )
 from poprox_storage.concepts.manifest import ManifestFile, parse_manifest_toml
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.parquet import DatasetManifest, ExportSchema
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
+ASSIGNMENTS_SCHEMA = ExportSchema(
+    "assignments",
+    version=1,
+    fields={"account_id": "string", "group_id": "string", "opted_out": "int64"},
+    dictionary=("group_id", "opted_out"),
+)
+
 
 class DbExperimentRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
@@ -578,9 +587,19 @@ class S3AssignmentsRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
-    ) -> str:
+        partition_by: Sequence[str] | None = None,
+    ) -> str | DatasetManifest:
+        # Assignments aren't timestamped, so they can't be partitioned by date
         records = self._extract_and_flatten(assignments)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records,
+            bucket_name,
+            file_prefix,
+            start_time,
+            partition_by=partition_by,
+            date_column=None,
+            schema=ASSIGNMENTS_SCHEMA,
+        )
 
     def _extract_and_flatten(self, assignments: list[Assignment]) -> list[dict]:
         records = []
@@ -1,23 +1,32 @@
 import json
 import logging
+from collections.abc import Iterable, Iterator
 from datetime import datetime
+from itertools import islice
 from uuid import UUID
 
 import boto3
+from smart_open import open as smart_open
 from sqlalchemy import (
     Connection,
     select,
+    tuple_,
 )
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError, InternalError
 from tqdm import tqdm
 
 from poprox_concepts.domain import Image
 from poprox_storage.aws import DEV_BUCKET_NAME
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.key_discovery import KeyCheckpoint, S3KeyDiscovery, most_recent_keys
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+IMAGE_CONTENT_FIELDS = ("url", "caption", "raw_data")
+
 
 class DbImageRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
@@ -42,6 +51,96 @@ class DbImageRepository(DatabaseRepository):
 
         return failed
 
+    def store_images_in_batches(self, images: Iterable[Image], *, batch_size: int = 1000) -> dict[str, int]:
+        """
+        Store images from an iterable (e.g. `S3ImageRepository.iter_images_from_files`)
+        without holding more than `batch_size` of them in memory at once
+
+        Returns counts of inserted, updated, skipped and failed images (see `store_images_bulk`)
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0, "failed": 0}
+        images = iter(images)
+        while batch := list(islice(images, batch_size)):
+            for name, count in self.store_images_bulk(batch, chunk_size=batch_size).items():
+                counts[name] += count
+            logger.debug(f"Stored images so far: {counts}")
+
+        return counts
+
+    def store_images_bulk(self, images: list[Image], *, chunk_size: int = 500) -> dict[str, int]:
+        """
+        Store images with one lookup and one multi-row upsert per chunk
+
+        Images whose (source, external_id) already exist with the same url, caption
+        and raw data are skipped without being written. Each chunk is committed on
+        its own; a chunk that fails is rolled back and counted as failed.
+
+        Returns counts of inserted, updated, skipped and failed images
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0, "failed": 0}
+
+        for start in range(0, len(images), chunk_size):
+            chunk = images[start : start + chunk_size]
+            try:
+                chunk_counts = self._store_image_chunk(chunk)
+                self.conn.commit()
+            except (IntegrityError, InternalError) as exc:
+                logger.error(f"Failed to store {len(chunk)} images: {exc}")
+                self.conn.rollback()
+                chunk_counts = {"failed": len(chunk)}
+
+            for name, count in chunk_counts.items():
+                counts[name] += count
+
+        logger.info(f"Stored {len(images)} images: {counts}")
+        return counts
+
+    def _store_image_chunk(self, images: list[Image]) -> dict[str, int]:
+        image_table = self.tables["images"]
+
+        # Later copies of an image win, and Postgres won't let one upsert touch a row twice
+        rows = {}
+        unkeyed = []
+        for image in images:
+            row = image.model_dump(exclude={"image_id"})
+            if "created_at" in row:
+                row["created_at"] = row["created_at"] or datetime.now()
+            if row.get("external_id") is None:
+                unkeyed.append(row)
+            else:
+                rows[(row["source"], row["external_id"])] = row
+
+        existing = {}
+        if rows:
+            existing_query = select(
+                image_table.c.source, image_table.c.external_id, *(image_table.c[f] for f in IMAGE_CONTENT_FIELDS)
+            ).where(tuple_(image_table.c.source, image_table.c.external_id).in_(list(rows)))
+            for result in self.conn.execute(existing_query):
+                existing[(result.source, result.external_id)] = result
+
+        to_write = list(unkeyed)
+        inserted = len(unkeyed)
+        updated = 0
+        for key, row in rows.items():
+            current = existing.get(key)
+            if current is None:
+                inserted += 1
+            elif any(getattr(current, f) != row.get(f) for f in IMAGE_CONTENT_FIELDS):
+                updated += 1
+            else:
+                continue
+            to_write.append(row)
+
+        if to_write:
+            insert_stmt = insert(image_table).values(to_write)
+            insert_stmt = insert_stmt.on_conflict_do_update(
+                constraint="uq_images",
+                set_={f: insert_stmt.excluded[f] for f in IMAGE_CONTENT_FIELDS},
+            )
+            self.conn.execute(insert_stmt)
+
+        return {"inserted": inserted, "updated": updated, "skipped": len(images) - len(to_write)}
+
     def store_image(self, image: Image) -> UUID | None:
         return self._insert_model("images", image, exclude={"image_id"}, constraint="uq_images")
 
@@ -63,6 +162,27 @@ class DbImageRepository(DatabaseRepository):
                 caption=result.caption,
             )
 
+    def fetch_images_by_ids(self, image_ids: list[UUID | str]) -> dict[UUID, Image]:
+        """Fetch many images with a single query, keyed by image id (missing ids are left out)"""
+        if not image_ids:
+            return {}
+
+        image_table = self.tables["images"]
+
+        image_query = select(image_table).where(image_table.c.image_id.in_(set(image_ids)))
+
+        return {
+            result.image_id: Image(
+                image_id=result.image_id,
+                url=result.url,
+                source=result.source,
+                external_id=result.external_id,
+                raw_data=result.raw_data,
+                caption=result.caption,
+            )
+            for result in self.conn.execute(image_query)
+        }
+
     def fetch_image_by_id(self, image_id: str) -> Image | None:
         image_table = self.tables["images"]
 
@@ -95,6 +215,7 @@ class S3ImageRepository(S3Repository):
     def __init__(self, bucket_name):
         super().__init__(bucket_name)
         self.s3_client = boto3.client("s3")
+        self.key_discovery = S3KeyDiscovery(self.s3_client, DEV_BUCKET_NAME)
 
     def fetch_image_file_keys(self, prefix, days_back=None):
         """
@@ -113,25 +234,60 @@ class S3ImageRepository(S3Repository):
             A list of the names of each retrieved file
             in reverse chronological order
         """
-        response = self.s3_client.list_objects_v2(Bucket=DEV_BUCKET_NAME, Prefix=prefix)
-
-        files = sorted(response.get("Contents", []), key=lambda d: d["LastModified"], reverse=True)
+        return most_recent_keys(list(self.key_discovery.list_objects(prefix)), days_back)
 
-        if days_back:
-            files = files[:days_back]
+    def fetch_new_image_file_keys(
+        self, prefix, checkpoint_name, *, ordered_keys=False
+    ) -> tuple[list[str], KeyCheckpoint]:
+        """
+        Retrieve the names of AP image files added since the last saved checkpoint
 
-        return [f["Key"] for f in files]
+        Returns the file names (newest first) and the advanced checkpoint, which
+        should be saved with `key_discovery.save_checkpoint` once they're ingested.
+        """
+        objects, checkpoint = self.key_discovery.list_new_objects(prefix, checkpoint_name, ordered_keys=ordered_keys)
+        return most_recent_keys(objects), checkpoint
 
     def fetch_images_from_file(self, file_key):
         file_contents = self.fetch_file_contents(file_key)
         return extract_images(file_contents)
 
-    def fetch_images_from_files(self, file_keys):
-        images = []
+    def iter_images_from_file(self, file_key) -> Iterator[Image]:
+        """Stream the images in an AP JSONL file without reading the whole file into memory"""
+        load_path = f"s3://{self.bucket_name}/{file_key}"
+
+        with smart_open(load_path, "r", transport_params=self._transport_params()) as f:
+            yield from iter_images(f)
 
+    def iter_images_from_files(self, file_keys) -> Iterator[Image]:
         for key in file_keys:
-            extracted = self.fetch_images_from_file(key)
-            images.extend(extracted)
+            yield from self.iter_images_from_file(key)
+
+    def fetch_images_from_files(self, file_keys, *, max_workers=16):
+        """
+        Fetch and extract the images from many AP JSONL files concurrently
+
+        Images come back in the order of `file_keys`. Every file is fetched before
+        any failure is raised, so the error covers all of the files that failed.
+        """
+        file_keys = list(file_keys)
+
+        extracted = {}
+        failed = []
+        for result in self.fetch_many(file_keys, extract_images, max_workers=max_workers):
+            if result.ok:
+                extracted[result.key] = result.value
+            else:
+                failed.append(result)
+
+        if failed:
+            failed_keys = ", ".join(sorted(result.key for result in failed))
+            msg = f"Failed to fetch {len(failed)} of {len(file_keys)} image files: {failed_keys}"
+            raise RuntimeError(msg) from failed[0].error
+
+        images = []
+        for key in file_keys:
+            images.extend(extracted[key])
 
         return images
 
@@ -147,17 +303,20 @@ class S3ImageRepository(S3Repository):
 
 
 def extract_images(img_file_content) -> list[Image]:
-    lines = img_file_content.splitlines()
-    images = []
+    return list(iter_images(img_file_content.splitlines()))
 
+
+def iter_images(lines: Iterable[str]) -> Iterator[Image]:
     for line in lines:
+        # Most items in the AP feed aren't pictures, and a substring check is far
+        # cheaper than parsing them; lines that pass are still checked properly
+        if '"picture"' not in line:
+            continue
+
         line_obj = json.loads(line)
         ap_item = line_obj["data"]["item"]
         if ap_item["type"] == "picture":
-            extracted_image = create_ap_image(ap_item)
-            images.append(extracted_image)
-
-    return images
+            yield create_ap_image(ap_item)
 
 
 def create_ap_image(ap_item):
@@ -1,4 +1,7 @@
+import logging
+import os
 from collections import defaultdict
+from collections.abc import Sequence
 from datetime import datetime, timedelta
 from uuid import UUID, uuid4
 
@@ -6,17 +9,86 @@ from sqlalchemy import (
     Connection,
     Table,
     and_,
+    func,
     insert,
     null,
     select,
     update,
 )
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
 
 from poprox_concepts.domain import Account, Article, Impression, Newsletter, RecommenderInfo
 from poprox_concepts.domain.newsletter import ImpressedSection
+from poprox_storage.aws import s3
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.hydration import hydrate
+from poprox_storage.repositories.data_stores.parquet import DatasetManifest, ExportSchema
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# When a bucket is configured, rendered newsletter HTML is stored there (compressed
+# and content-addressed) and the newsletters table only keeps a reference to it
+NEWSLETTER_HTML_BUCKET = os.getenv("NEWSLETTER_HTML_BUCKET")
+NEWSLETTER_HTML_PREFIX = os.getenv("NEWSLETTER_HTML_PREFIX", "newsletter-html")
+NEWSLETTER_HTML_COMPRESSION = os.getenv("NEWSLETTER_HTML_COMPRESSION", "gzip")
+
+# Above this many newsletters, callers switch from building every newsletter's
+# sections and impressions as JSON in Postgres to three set-based queries. The
+# JSON is built by correlated subqueries, run once per newsletter and section, so
+# its cost grows faster than the queries'. At ~20 impressions per newsletter, 500
+# newsletters is a ~10k-impression response, which is still small next to the two
+# round-trips it saves. It's an estimate until it's benchmarked against a real
+# database, so it can be overridden per call (or with the environment variable).
+JSON_HYDRATION_MAX_NEWSLETTERS = int(os.getenv("JSON_HYDRATION_MAX_NEWSLETTERS", "500"))
+
+
+# One row per impression, so newsletter and section values repeat across rows
+NEWSLETTER_IMPRESSIONS_SCHEMA = ExportSchema(
+    "newsletter_impressions",
+    version=1,
+    fields={
+        "account_id": "string",
+        "newsletter_id": "string",
+        "created_at": "timestamp",
+        "newsletter_feedback": "string",
+        "treatment_id": "string",
+        "recommender_name": "string",
+        "recommender_version": "string",
+        "recommender_hash": "string",
+        "section_id": "string",
+        "section_title": "string",
+        "section_flavor": "string",
+        "section_personalized": "string",
+        "section_seed_entity_id": "string",
+        "section_position": "int64",
+        "article_id": "string",
+        "label": "string",
+        "headline": "string",
+        "subhead": "string",
+        "article_preview_image_id": "string",
+        "position": "int64",
+        "impression_feedback": "string",
+    },
+    dictionary=(
+        "account_id",
+        "newsletter_id",
+        "newsletter_feedback",
+        "treatment_id",
+        "recommender_name",
+        "recommender_version",
+        "recommender_hash",
+        "section_id",
+        "section_title",
+        "section_flavor",
+        "section_personalized",
+        "section_seed_entity_id",
+        "label",
+        "impression_feedback",
+    ),
+)
+
 
 class DbNewsletterRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
@@ -54,6 +126,10 @@ class DbNewsletterRepository(DatabaseRepository):
 
         self.renumber_impressions(newsletter)
 
+        # Uploaded before the transaction so it isn't held open during the upload;
+        # a failed insert leaves behind an unreferenced object, which is harmless
+        html, html_ref = _externalize_html(newsletter.body_html)
+
         self.conn.commit()  # End any transaction already in progress
         with self.conn.begin():
             stmt = insert(newsletter_table).values(
@@ -63,7 +139,8 @@ class DbNewsletterRepository(DatabaseRepository):
                 experience_id=str(newsletter.experience_id) if newsletter.experience_id else None,
                 content=[rec.model_dump_json() for rec in newsletter.articles],
                 email_subject=newsletter.subject,
-                html=newsletter.body_html,
+                html=html,
+                html_ref=html_ref,
                 recommender_name=newsletter.recommender_info.name if newsletter.recommender_info else None,
                 recommender_version=newsletter.recommender_info.version if newsletter.recommender_info else None,
                 recommender_hash=newsletter.recommender_info.hash if newsletter.recommender_info else None,
@@ -155,7 +232,9 @@ class DbNewsletterRepository(DatabaseRepository):
         )
         self.conn.execute(stmt)
 
-    def fetch_newsletters_by_id(self, newsletter_ids: list[UUID]):
+    def fetch_newsletters_by_id(
+        self, newsletter_ids: list[UUID], json_max_newsletters: int = JSON_HYDRATION_MAX_NEWSLETTERS
+    ):
         newsletters_table = self.tables["newsletters"]
         section_types_table = self.tables["section_types"]
         impressed_sections_table = self.tables["impressed_sections"]
@@ -170,6 +249,7 @@ class DbNewsletterRepository(DatabaseRepository):
             articles_table,
             newsletters_table.c.newsletter_id.in_(newsletter_ids),
             excluded_columns=["content", "html"],
+            strategy="json" if len(newsletter_ids) <= json_max_newsletters else "queries",
         )
 
     def fetch_newsletters(self, accounts: list[Account]) -> list[Newsletter]:
@@ -278,6 +358,7 @@ class DbNewsletterRepository(DatabaseRepository):
             articles_table,
             where_clause=newsletters_table.c.newsletter_id == newsletter_id,
             excluded_columns=["content", "html"],
+            strategy="json",
         )
         if not results:
             return None
@@ -328,7 +409,9 @@ class DbNewsletterRepository(DatabaseRepository):
         impressions = [self._convert_to_impression_obj(row) for row in rows]
         return sorted(impressions, key=lambda i: i.created_at)
 
-    def fetch_most_recent_newsletter(self, account_id, since: datetime, exclude_experiences=True) -> Newsletter | None:
+    def fetch_most_recent_newsletter(
+        self, account_id, since: datetime, exclude_experiences=True, *, include_html=False
+    ) -> Newsletter | None:
         # XXX - this does not currently fetch sections/impressions due to this feature not being needed.
         newsletters_table = self.tables["newsletters"]
 
@@ -336,7 +419,8 @@ class DbNewsletterRepository(DatabaseRepository):
         if exclude_experiences:
             clauses.append(newsletters_table.c.experience_id.is_(None))
 
-        query = select(newsletters_table).where(and_(*clauses)).order_by(newsletters_table.c.created_at.desc()).limit(1)
+        columns = [col for col in newsletters_table.columns if col.name not in ("content", "html")]
+        query = select(*columns).where(and_(*clauses)).order_by(newsletters_table.c.created_at.desc()).limit(1)
 
         row = self.conn.execute(query).fetchone()
 
@@ -348,7 +432,7 @@ class DbNewsletterRepository(DatabaseRepository):
             treatment_id=row.treatment_id,
             sections=[],
             subject=row.email_subject,
-            body_html=row.html,
+            body_html=(self.fetch_newsletter_html(row.newsletter_id) or "") if include_html else "",
             created_at=row.created_at,
             recommender_info=RecommenderInfo(
                 name=row.recommender_name,
@@ -357,6 +441,114 @@ class DbNewsletterRepository(DatabaseRepository):
             ),
         )
 
+    def fetch_newsletter_html(self, newsletter_id: UUID) -> str | None:
+        """Fetch a newsletter's rendered HTML, whether it's stored inline or in S3"""
+        newsletters_table = self.tables["newsletters"]
+
+        query = select(newsletters_table.c.html, newsletters_table.c.html_ref).where(
+            newsletters_table.c.newsletter_id == newsletter_id
+        )
+        row = self.conn.execute(query).fetchone()
+
+        if row is None:
+            return None
+        if row.html_ref:
+            bucket_name, key = _parse_s3_uri(row.html_ref)
+            return s3.get_decompressed(bucket_name, key).decode("utf-8")
+        return row.html
+
+    def backfill_newsletter_html(self, *, batch_size: int = 100, max_batches: int | None = None) -> int:
+        """
+        Move inline newsletter HTML into S3, replacing it with a reference
+
+        Each batch is committed separately, so this can be stopped and resumed.
+        Newsletters with empty HTML have nothing to move and are left as they are.
+        Returns the number of newsletters moved.
+        """
+        if not NEWSLETTER_HTML_BUCKET:
+            msg = "NEWSLETTER_HTML_BUCKET must be set to move newsletter HTML to S3"
+            raise RuntimeError(msg)
+
+        newsletters_table = self.tables["newsletters"]
+
+        moved = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            query = (
+                select(newsletters_table.c.newsletter_id, newsletters_table.c.html)
+                .where(
+                    newsletters_table.c.html.is_not(None),
+                    newsletters_table.c.html != "",
+                    newsletters_table.c.html_ref.is_(None),
+                )
+                .limit(batch_size)
+            )
+            rows = self.conn.execute(query).fetchall()
+            if not rows:
+                break
+
+            for row in rows:
+                html, html_ref = _externalize_html(row.html)
+                if html_ref is None:
+                    continue
+                self.conn.execute(
+                    update(newsletters_table)
+                    .where(newsletters_table.c.newsletter_id == row.newsletter_id)
+                    .values(html=html, html_ref=html_ref)
+                )
+                moved += 1
+            self.conn.commit()
+
+            batches += 1
+            logger.info(f"Moved HTML for {moved} newsletters to s3://{NEWSLETTER_HTML_BUCKET}")
+
+        return moved
+
+    def fetch_most_recent_newsletters(
+        self,
+        account_ids: list[UUID],
+        since: datetime,
+        exclude_experiences=True,
+        json_max_newsletters: int = JSON_HYDRATION_MAX_NEWSLETTERS,
+    ) -> dict[UUID, Newsletter]:
+        """
+        Fetch the latest newsletter (with its sections and impressions) sent to each
+        account since `since`, keyed by account id
+
+        Accounts without a newsletter in that window are left out. Unlike
+        `fetch_most_recent_newsletter`, the HTML body isn't loaded. There's at most
+        one newsletter per account, so up to `json_max_newsletters` accounts are
+        fetched in a single query, and larger batches in three.
+        """
+        if not account_ids:
+            return {}
+
+        newsletters_table = self.tables["newsletters"]
+
+        clauses = [newsletters_table.c.account_id.in_(account_ids), newsletters_table.c.created_at >= since]
+        if exclude_experiences:
+            clauses.append(newsletters_table.c.experience_id.is_(None))
+
+        # Served by the (account_id, created_at DESC) index
+        latest_ids = (
+            select(newsletters_table.c.newsletter_id)
+            .distinct(newsletters_table.c.account_id)
+            .where(and_(*clauses))
+            .order_by(newsletters_table.c.account_id, newsletters_table.c.created_at.desc())
+        )
+
+        newsletters = self._fetch_newsletters(
+            newsletters_table,
+            self.tables["section_types"],
+            self.tables["impressed_sections"],
+            self.tables["impressions"],
+            self.tables["articles"],
+            newsletters_table.c.newsletter_id.in_(latest_ids),
+            excluded_columns=["content", "html"],
+            strategy="json" if len(account_ids) <= json_max_newsletters else "queries",
+        )
+        return {newsletter.account_id: newsletter for newsletter in newsletters}
+
     def _fetch_newsletters(
         self,
         newsletters_table,
@@ -367,11 +559,32 @@ class DbNewsletterRepository(DatabaseRepository):
         where_clause=None,
         excluded_columns=None,
         shallow=False,
+        strategy="queries",
     ):
+        """
+        Fetch newsletters matching `where_clause` along with their sections and impressions
+
+        With `strategy="queries"` the newsletters, sections and impressions are each
+        fetched with a set-based query and assembled in Python, which scales well to
+        many newsletters. With `strategy="json"` Postgres builds each newsletter's
+        sections and impressions as JSON, which takes a single round-trip and suits
+        fetching a handful of newsletters.
+        """
         excluded_columns = excluded_columns or []
 
         columns_to_select = [col for col in newsletters_table.columns if col.name not in excluded_columns]
 
+        if strategy == "json" and not shallow:
+            return self._fetch_newsletters_as_json(
+                columns_to_select,
+                newsletters_table,
+                section_types_table,
+                impressed_sections_table,
+                impressions_table,
+                articles_table,
+                where_clause,
+            )
+
         newsletter_query = select(*columns_to_select).select_from(newsletters_table)
 
         if where_clause is not None:
@@ -415,6 +628,120 @@ class DbNewsletterRepository(DatabaseRepository):
             impressions_result = self.conn.execute(impressions_query).fetchall()
         return self._convert_to_newsletter_objs(newsletter_result, sections_result, impressions_result)
 
+    def _fetch_newsletters_as_json(
+        self,
+        columns_to_select,
+        newsletters_table,
+        section_types_table,
+        impressed_sections_table,
+        impressions_table,
+        articles_table,
+        where_clause=None,
+    ):
+        impression_json = func.json_build_object(
+            "impression_id",
+            impressions_table.c.impression_id,
+            "newsletter_id",
+            impressions_table.c.newsletter_id,
+            "label",
+            impressions_table.c.label,
+            "headline",
+            impressions_table.c.headline,
+            "subhead",
+            impressions_table.c.subhead,
+            "position",
+            impressions_table.c.position,
+            "position_in_section",
+            impressions_table.c.position_in_section,
+            "extra",
+            impressions_table.c.extra,
+            "feedback",
+            impressions_table.c.feedback,
+            "created_at",
+            _json_timestamp_column(impressions_table.c.created_at),
+            "article",
+            func.json_build_object(
+                "article_id",
+                articles_table.c.article_id,
+                "headline",
+                articles_table.c.headline,
+                "subhead",
+                articles_table.c.subhead,
+                "url",
+                articles_table.c.url,
+                "preview_image_id",
+                articles_table.c.preview_image_id,
+                "published_at",
+                _json_timestamp_column(articles_table.c.published_at),
+                "source",
+                articles_table.c.source,
+                "external_id",
+                articles_table.c.external_id,
+            ),
+        )
+        impressions_json = (
+            select(
+                func.coalesce(
+                    func.json_agg(aggregate_order_by(impression_json, impressions_table.c.position)),
+                    func.json_build_array(),
+                )
+            )
+            .select_from(
+                impressions_table.join(articles_table, articles_table.c.article_id == impressions_table.c.article_id)
+            )
+            .where(impressions_table.c.impressed_section_id == impressed_sections_table.c.section_id)
+            .scalar_subquery()
+        )
+
+        section_json = func.json_build_object(
+            "section_id",
+            impressed_sections_table.c.section_id,
+            "title",
+            section_types_table.c.title,
+            "flavor",
+            section_types_table.c.flavor,
+            "personalized",
+            section_types_table.c.personalized,
+            "seed",
+            section_types_table.c.seed,
+            "position",
+            impressed_sections_table.c.position,
+            "impressions",
+            impressions_json,
+        )
+        sections_json = (
+            select(
+                func.coalesce(
+                    func.json_agg(aggregate_order_by(section_json, impressed_sections_table.c.position)),
+                    func.json_build_array(),
+                    type_=JSON,
+                )
+            )
+            .select_from(
+                impressed_sections_table.join(
+                    section_types_table,
+                    impressed_sections_table.c.section_type_id == section_types_table.c.section_type_id,
+                )
+            )
+            .where(impressed_sections_table.c.newsletter_id == newsletters_table.c.newsletter_id)
+            .scalar_subquery()
+        )
+
+        newsletter_query = select(*columns_to_select, sections_json.label("sections_json")).select_from(
+            newsletters_table
+        )
+        if where_clause is not None:
+            newsletter_query = newsletter_query.where(where_clause)
+
+        newsletter_result = self.conn.execute(newsletter_query).fetchall()
+
+        return [
+            self._convert_to_newsletter_obj(
+                row, [_convert_json_to_section_obj(section) for section in row.sections_json]
+            )
+            for row in newsletter_result
+        ]
+
     def select_impressions_with_articles(self, impressions_table, articles_table):
         return select(
             impressions_table,
@@ -437,7 +764,8 @@ class DbNewsletterRepository(DatabaseRepository):
         sections_by_newsletter = defaultdict(list)
         for row in sections_result:
             sections_by_newsletter[row.newsletter_id].append(
-                ImpressedSection(
+                hydrate(
+                    ImpressedSection,
                     section_id=row.section_id,
                     title=row.title,
                     flavor=row.flavor,
@@ -449,25 +777,33 @@ class DbNewsletterRepository(DatabaseRepository):
             )
 
         return [
-            Newsletter(
-                newsletter_id=row.newsletter_id,
-                account_id=row.account_id,
-                treatment_id=row.treatment_id,
-                sections=sorted(sections_by_newsletter[row.newsletter_id], key=lambda x: x.position),
-                subject=row.email_subject,
-                body_html=row.html if hasattr(row, "html") else "",
-                created_at=row.created_at,
-                recommender_info=RecommenderInfo(
-                    name=row.recommender_name,
-                    version=row.recommender_version,
-                    hash=row.recommender_hash,
-                ),
+            self._convert_to_newsletter_obj(
+                row, sorted(sections_by_newsletter[row.newsletter_id], key=lambda x: x.position)
             )
             for row in newsletter_result
         ]
 
+    def _convert_to_newsletter_obj(self, row, sections: list[ImpressedSection]) -> Newsletter:
+        return hydrate(
+            Newsletter,
+            newsletter_id=row.newsletter_id,
+            account_id=row.account_id,
+            treatment_id=row.treatment_id,
+            sections=sections,
+            subject=row.email_subject,
+            body_html=(row.html or "") if hasattr(row, "html") else "",
+            created_at=row.created_at,
+            recommender_info=hydrate(
+                RecommenderInfo,
+                name=row.recommender_name,
+                version=row.recommender_version,
+                hash=row.recommender_hash,
+            ),
+        )
+
     def _convert_to_impression_obj(self, row):
-        return Impression(
+        return hydrate(
+            Impression,
             impression_id=row.impression_id,
             newsletter_id=row.newsletter_id,
             label=row.label,
@@ -476,7 +812,8 @@ class DbNewsletterRepository(DatabaseRepository):
             position=row.position,
             extra=getattr(row, "extra", None),
             feedback=row.feedback,
-            article=Article(
+            article=hydrate(
+                Article,
                 article_id=row.articles_article_id,
                 headline=row.articles_headline,
                 subhead=row.articles_subhead,
@@ -491,6 +828,83 @@ class DbNewsletterRepository(DatabaseRepository):
         )
 
 
+def _externalize_html(html: str | None) -> tuple[str | None, str | None]:
+    """Store HTML in S3 if a bucket is configured, returning the (inline html, reference) to save"""
+    if not NEWSLETTER_HTML_BUCKET or not html:
+        return html, None
+
+    stored = s3.put_content_addressed(
+        NEWSLETTER_HTML_BUCKET,
+        NEWSLETTER_HTML_PREFIX,
+        html.encode("utf-8"),
+        compression=NEWSLETTER_HTML_COMPRESSION,
+        suffix=".html",
+    )
+    return None, stored.uri
+
+
+def _parse_s3_uri(uri: str) -> tuple[str, str]:
+    bucket_name, _, key = uri.removeprefix("s3://").partition("/")
+    return bucket_name, key
+
+
+def _convert_json_to_section_obj(section: dict) -> ImpressedSection:
+    # JSON built by Postgres carries ids and timestamps as strings
+    return hydrate(
+        ImpressedSection,
+        section_id=_json_uuid(section["section_id"]),
+        title=section["title"],
+        flavor=section["flavor"],
+        personalized=section["personalized"],
+        seed_entity_id=_json_uuid(section["seed"]),
+        position=section["position"],
+        impressions=[_convert_json_to_impression_obj(impression) for impression in section["impressions"]],
+    )
+
+
+def _convert_json_to_impression_obj(impression: dict) -> Impression:
+    article = impression["article"]
+    return hydrate(
+        Impression,
+        impression_id=_json_uuid(impression["impression_id"]),
+        newsletter_id=_json_uuid(impression["newsletter_id"]),
+        label=impression["label"],
+        headline=impression["headline"],
+        subhead=impression["subhead"],
+        position=impression["position"],
+        extra=impression["extra"],
+        feedback=impression["feedback"],
+        article=hydrate(
+            Article,
+            article_id=_json_uuid(article["article_id"]),
+            headline=article["headline"],
+            subhead=article["subhead"],
+            url=article["url"],
+            preview_image_id=_json_uuid(article["preview_image_id"]),
+            published_at=_json_timestamp(article["published_at"]),
+            source=article["source"],
+            external_id=article["external_id"],
+        ),
+        created_at=_json_timestamp(impression["created_at"]),
+        position_in_section=impression["position_in_section"],
+    )
+
+
+def _json_uuid(value: str | None) -> UUID | None:
+    return UUID(value) if value is not None else None
+
+
+def _json_timestamp_column(column):
+    # Postgres trims trailing zeros from fractional seconds when it converts timestamps
+    # to JSON (e.g. "12:00:05.12"), which `datetime.fromisoformat` rejects before
+    # Python 3.11, so they're formatted with all six digits instead
+    return func.to_char(column, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+
+
+def _json_timestamp(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
 class S3NewsletterRepository(S3Repository):
     def store_as_parquet(
         self,
@@ -499,9 +913,17 @@ class S3NewsletterRepository(S3Repository):
         file_prefix: str,
         start_time: datetime = None,
         include_treatment: bool = False,
-    ) -> str:
+        partition_by: Sequence[str] | None = None,
+    ) -> str | DatasetManifest:
         records = extract_and_flatten(newsletters, include_treatment=include_treatment)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records,
+            bucket_name,
+            file_prefix,
+            start_time,
+            partition_by=partition_by,
+            schema=NEWSLETTER_IMPRESSIONS_SCHEMA,
+        )
 
 
 def extract_and_flatten(newsletters: list[Newsletter], include_treatment: bool = False) -> list[dict]:
@@ -1,22 +1,316 @@
+import logging
+from collections import defaultdict
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import Any, List
 from uuid import UUID
 
+from sqlalchemy import Connection, and_, select
+
 from poprox_concepts.domain import Account, Click, ConsentLog, Newsletter, Subscription, WebLogin
 from poprox_storage.concepts.experiment import Assignment
+from poprox_storage.repositories.data_stores.db import DatabaseRepository
+from poprox_storage.repositories.data_stores.hydration import hydrate
+from poprox_storage.repositories.data_stores.incremental import (
+    DEFAULT_COMPACT_EVERY,
+    DEFAULT_EXPORT_LAG,
+    ExportCheckpoint,
+    IncrementalExportResult,
+    load_export_checkpoint,
+    save_export_checkpoint,
+)
+from poprox_storage.repositories.data_stores.parquet import ExportSchema
 from poprox_storage.repositories.data_stores.s3 import S3Repository
 
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ACCOUNTS_SCHEMA = ExportSchema(
+    "panel_accounts",
+    version=1,
+    fields={
+        "account_id": "string",
+        "internal": "int64",
+        "external": "int64",
+        "status": "string",
+        "source": "string",
+        "subsource": "string",
+        "created_at": "timestamp",
+    },
+    dictionary=("internal", "external", "status", "source", "subsource"),
+)
+NEWSLETTERS_SCHEMA = ExportSchema(
+    "panel_newsletters",
+    version=1,
+    fields={"newsletter_id": "string", "account_id": "string", "created_at": "timestamp"},
+)
+WEB_LOGINS_SCHEMA = ExportSchema(
+    "panel_web_logins",
+    version=1,
+    fields={"account_id": "string", "newsletter_id": "string", "endpoint": "string", "created_at": "timestamp"},
+    dictionary=("endpoint",),
+)
+CLICKS_SCHEMA = ExportSchema(
+    "panel_clicks",
+    version=1,
+    fields={"account_id": "string", "newsletter_id": "string", "created_at": "timestamp"},
+)
+ASSIGNMENTS_SCHEMA = ExportSchema(
+    "panel_assignments",
+    version=1,
+    fields={"assignment_id": "string", "account_id": "string", "group_id": "string", "opted_out": "int64"},
+    dictionary=("group_id", "opted_out"),
+)
+SUBSCRIPTIONS_SCHEMA = ExportSchema(
+    "panel_subscriptions",
+    version=1,
+    fields={"subscription_id": "string", "account_id": "string", "started": "timestamp", "ended": "timestamp"},
+)
+CONSENT_LOGS_SCHEMA = ExportSchema(
+    "panel_consent_logs",
+    version=1,
+    fields={
+        "consent_log_id": "string",
+        "account_id": "string",
+        "document_name": "string",
+        "created_at": "timestamp",
+        "ended": "timestamp",
+    },
+    dictionary=("document_name",),
+)
+
+
+class DbPanelManagementRepository(DatabaseRepository):
+    """
+    Fetches the rows covered by each panel export that changed in a time window
+
+    Windows are half-open (`since` <= t < `until`), so consecutive windows never
+    return a row twice, and `since=None` fetches everything before `until`. Tables
+    whose rows are updated after they're created are windowed on `updated_at` (kept
+    current by a trigger). Clicks and web logins are windowed on `ingested_at`, since
+    their `created_at` is when the event happened, and they're often stored later.
+    Newsletters are written when they're created, so they're windowed on `created_at`.
+    """
+
+    def __init__(self, connection: Connection):
+        super().__init__(connection)
+        self.tables = self._load_tables(
+            "accounts",
+            "newsletters",
+            "web_logins",
+            "clicks",
+            "expt_assignments",
+            "subscriptions",
+            "account_consent_log",
+        )
+
+    def fetch_accounts_changed_between(self, since: datetime | None, until: datetime) -> list[Account]:
+        account_tbl = self.tables["accounts"]
+        query = select(account_tbl).where(_window(account_tbl.c.updated_at, since, until))
+        return [
+            hydrate(
+                Account,
+                account_id=row.account_id,
+                email=row.email,
+                status=row.status,
+                source=row.source,
+                subsource=row.subsource,
+                compensation=row.compensation,
+                created_at=row.created_at,
+            )
+            for row in self.conn.execute(query)
+        ]
+
+    def fetch_newsletters_changed_between(self, since: datetime | None, until: datetime) -> list[Newsletter]:
+        # Only the columns the export needs, leaving out the content and the impressions
+        newsletters_tbl = self.tables["newsletters"]
+        query = select(
+            newsletters_tbl.c.newsletter_id,
+            newsletters_tbl.c.account_id,
+            newsletters_tbl.c.treatment_id,
+            newsletters_tbl.c.email_subject,
+            newsletters_tbl.c.created_at,
+        ).where(_window(newsletters_tbl.c.created_at, since, until))
+        return [
+            hydrate(
+                Newsletter,
+                newsletter_id=row.newsletter_id,
+                account_id=row.account_id,
+                treatment_id=row.treatment_id,
+                sections=[],
+                subject=row.email_subject,
+                body_html="",
+                created_at=row.created_at,
+            )
+            for row in self.conn.execute(query)
+        ]
+
+    def fetch_web_logins_changed_between(self, since: datetime | None, until: datetime) -> list[WebLogin]:
+        web_login_tbl = self.tables["web_logins"]
+        query = select(
+            web_login_tbl.c.account_id,
+            web_login_tbl.c.newsletter_id,
+            web_login_tbl.c.endpoint,
+            web_login_tbl.c.created_at,
+        ).where(_window(web_login_tbl.c.ingested_at, since, until))
+        return [
+            WebLogin(
+                account_id=row.account_id,
+                newsletter_id=row.newsletter_id,
+                endpoint=row.endpoint,
+                created_at=row.created_at,
+            )
+            for row in self.conn.execute(query)
+        ]
+
+    def fetch_clicks_changed_between(self, since: datetime | None, until: datetime) -> dict[UUID, list[Click]]:
+        click_tbl = self.tables["clicks"]
+        query = select(
+            click_tbl.c.account_id,
+            click_tbl.c.newsletter_id,
+            click_tbl.c.impression_id,
+            click_tbl.c.article_id,
+            click_tbl.c.created_at,
+        ).where(_window(click_tbl.c.ingested_at, since, until))
+
+        clicks_by_account = defaultdict(list)
+        for row in self.conn.execute(query):
+            clicks_by_account[row.account_id].append(
+                hydrate(
+                    Click,
+                    newsletter_id=row.newsletter_id,
+                    impression_id=row.impression_id,
+                    article_id=row.article_id,
+                    timestamp=row.created_at,
+                )
+            )
+        return clicks_by_account
+
+    def fetch_assignments_changed_between(self, since: datetime | None, until: datetime) -> list[Assignment]:
+        assign_tbl = self.tables["expt_assignments"]
+        query = select(assign_tbl).where(_window(assign_tbl.c.updated_at, since, until))
+        return [
+            Assignment(
+                assignment_id=row.assignment_id,
+                account_id=row.account_id,
+                group_id=row.group_id,
+                opted_out=row.opted_out,
+            )
+            for row in self.conn.execute(query)
+        ]
+
+    def fetch_subscriptions_changed_between(self, since: datetime | None, until: datetime) -> list[Subscription]:
+        subscription_tbl = self.tables["subscriptions"]
+        query = select(subscription_tbl).where(_window(subscription_tbl.c.updated_at, since, until))
+        return [
+            Subscription(
+                subscription_id=row.subscription_id, account_id=row.account_id, started=row.started, ended=row.ended
+            )
+            for row in self.conn.execute(query)
+        ]
+
+    def fetch_consent_logs_changed_between(self, since: datetime | None, until: datetime) -> list[ConsentLog]:
+        consent_log_tbl = self.tables["account_consent_log"]
+        query = select(consent_log_tbl).where(_window(consent_log_tbl.c.updated_at, since, until))
+        return [
+            ConsentLog(
+                consent_log_id=row.account_consent_log_id,
+                account_id=row.account_id,
+                document_name=row.document_name,
+                created_at=row.created_at,
+                ended_at=row.ended_at,
+            )
+            for row in self.conn.execute(query)
+        ]
+
 
 class S3PanelManagementRepository(S3Repository):
+    def export_incrementally(
+        self,
+        export: str,
+        fetch_changes: Callable[[datetime | None, datetime], Any],
+        bucket_name: str,
+        file_prefix: str,
+        *,
+        until: datetime | None = None,
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        checkpoint_prefix: str = "export-checkpoints",
+    ) -> IncrementalExportResult:
+        """
+        Export the rows of one of the `PANEL_EXPORTS` that changed since its last run
+
+        `fetch_changes(since, until)` fetches the export's rows for a window, e.g.
+        `DbPanelManagementRepository(conn).fetch_accounts_changed_between`. The first
+        run writes a full snapshot. Later runs write a delta file holding only the rows
+        changed since the stored high-water mark, or nothing when there weren't any.
+        Once `compact_every` deltas have built up, they're merged with the snapshot
+        into a new one. The checkpoint (see `ExportCheckpoint`) lists the current
+        files and is saved last, so a run that fails is just redone by the next one.
+        """
+        spec = PANEL_EXPORTS[export]
+        client = self._client()
+        checkpoint_key = f"{checkpoint_prefix}/{file_prefix}.json"
+        checkpoint = load_export_checkpoint(client, bucket_name, checkpoint_key)
+
+        until = until or datetime.now() - DEFAULT_EXPORT_LAG
+        result = IncrementalExportResult(name=export, checkpoint=checkpoint)
+        if checkpoint.high_water_mark is not None and until <= checkpoint.high_water_mark:
+            logger.info(f"Nothing to export for {export}: already exported through {checkpoint.high_water_mark}")
+            return result
+
+        records = spec.to_records(fetch_changes(checkpoint.high_water_mark, until))
+        result.num_rows = len(records)
+
+        if checkpoint.snapshot_key is None:
+            key = self._write_records_as_parquet(
+                records, bucket_name, f"{file_prefix}_snapshot", until, schema=spec.schema
+            )
+            result.written_keys.append(key)
+            checkpoint = ExportCheckpoint(high_water_mark=until, snapshot_key=key)
+        else:
+            delta_keys = list(checkpoint.delta_keys)
+            if records:
+                key = self._write_records_as_parquet(
+                    records, bucket_name, f"{file_prefix}_delta", until, schema=spec.schema
+                )
+                result.written_keys.append(key)
+                delta_keys.append(key)
+            checkpoint = ExportCheckpoint(
+                high_water_mark=until, snapshot_key=checkpoint.snapshot_key, delta_keys=delta_keys
+            )
+
+        if len(checkpoint.delta_keys) >= compact_every:
+            key = self._compact_parquet_files(
+                [checkpoint.snapshot_key, *checkpoint.delta_keys],
+                bucket_name,
+                f"{file_prefix}_snapshot",
+                until,
+                key_columns=spec.key_columns,
+                schema=spec.schema,
+            )
+            result.written_keys.append(key)
+            result.compacted = True
+            checkpoint = ExportCheckpoint(high_water_mark=until, snapshot_key=key)
+
+        save_export_checkpoint(client, bucket_name, checkpoint_key, checkpoint)
+        result.checkpoint = checkpoint
+
+        logger.info(f"Exported {result.num_rows} changed {export} rows through {until}")
+        return result
+
     def store_accounts_as_parquet(
         self,
         accounts: List[Account],
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_accounts_to_records(accounts)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, partition_by=partition_by, schema=ACCOUNTS_SCHEMA
+        )
 
     def store_newsletters_as_parquet(
         self,
@@ -24,9 +318,12 @@ class S3PanelManagementRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_newsletters_to_records(newsletters)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, partition_by=partition_by, schema=NEWSLETTERS_SCHEMA
+        )
 
     def store_web_logins_as_parquet(
         self,
@@ -34,9 +331,12 @@ class S3PanelManagementRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_logins_to_records(logins)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, partition_by=partition_by, schema=WEB_LOGINS_SCHEMA
+        )
 
     def store_clicks_as_parquet(
         self,
@@ -44,9 +344,12 @@ class S3PanelManagementRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_clicks_to_records(clicks_by_account)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, partition_by=partition_by, schema=CLICKS_SCHEMA
+        )
 
     def store_expt_assignments_as_parquet(
         self,
@@ -54,9 +357,18 @@ class S3PanelManagementRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_assignments_to_records(assignments)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records,
+            bucket_name,
+            file_prefix,
+            start_time,
+            partition_by=partition_by,
+            date_column=None,
+            schema=ASSIGNMENTS_SCHEMA,
+        )
 
     def store_subscriptions_as_parquet(
         self,
@@ -64,9 +376,18 @@ class S3PanelManagementRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_subscriptions_to_records(subscriptions)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records,
+            bucket_name,
+            file_prefix,
+            start_time,
+            partition_by=partition_by,
+            date_column="started",
+            schema=SUBSCRIPTIONS_SCHEMA,
+        )
 
     def store_consent_logs_as_parquet(
         self,
@@ -74,9 +395,12 @@ class S3PanelManagementRepository(S3Repository):
         bucket_name: str,
         file_prefix: str,
         start_time: datetime = None,
+        partition_by: Sequence[str] | None = None,
     ):
         records = convert_consent_logs_to_records(consent_logs)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._store_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, partition_by=partition_by, schema=CONSENT_LOGS_SCHEMA
+        )
 
 
 def convert_accounts_to_records(accounts: List[Account]) -> List[dict]:
@@ -178,3 +502,29 @@ def convert_consent_logs_to_records(consent_logs: list[ConsentLog]) -> list[dict
             }
         )
     return records
+
+
+def _window(column, since: datetime | None, until: datetime):
+    if since is None:
+        return column < until
+    return and_(column >= since, column < until)
+
+
+@dataclass(frozen=True)
+class PanelExport:
+    to_records: Callable[[Any], list[dict]]
+    schema: ExportSchema
+    # The columns that identify a row, so that when deltas are compacted, newer
+    # versions of a row replace older ones. Append-only exports don't have any.
+    key_columns: tuple[str, ...] = ()
+
+
+PANEL_EXPORTS = {
+    "accounts": PanelExport(convert_accounts_to_records, ACCOUNTS_SCHEMA, ("account_id",)),
+    "newsletters": PanelExport(convert_newsletters_to_records, NEWSLETTERS_SCHEMA, ("newsletter_id",)),
+    "web_logins": PanelExport(convert_logins_to_records, WEB_LOGINS_SCHEMA),
+    "clicks": PanelExport(convert_clicks_to_records, CLICKS_SCHEMA),
+    "assignments": PanelExport(convert_assignments_to_records, ASSIGNMENTS_SCHEMA, ("assignment_id",)),
+    "subscriptions": PanelExport(convert_subscriptions_to_records, SUBSCRIPTIONS_SCHEMA, ("subscription_id",)),
+    "consent_logs": PanelExport(convert_consent_logs_to_records, CONSENT_LOGS_SCHEMA, ("consent_log_id",)),
+}
@@ -12,7 +12,7 @@ from sqlalchemy import (
 from sqlalchemy.dialects.postgresql import insert
 
 from poprox_concepts.domain import CandidatePool
-from poprox_storage.repositories.articles import _fetch_articles
+from poprox_storage.repositories.articles import ArticleFields, _fetch_articles, article_columns
 from poprox_storage.repositories.data_stores.db import DatabaseRepository
 
 logger = logging.getLogger(__name__)
@@ -56,7 +56,7 @@ class DbCandidatePoolRepository(DatabaseRepository):
 
         return candidate_pool_id
 
-    def fetch_candidate_pool(self, candidate_pool_id: UUID) -> CandidatePool:
+    def fetch_candidate_pool(self, candidate_pool_id: UUID, *, fields: ArticleFields = "full") -> CandidatePool:
         pools_table = self.tables["candidate_pools"]
         candidates_table = self.tables["candidate_articles"]
         articles_table = self.tables["articles"]
@@ -69,7 +69,7 @@ class DbCandidatePoolRepository(DatabaseRepository):
 
         # Then query for the articles and attach to the pool
         query = (
-            select(articles_table)
+            select(*article_columns(articles_table, fields))
             .join(candidates_table, candidates_table.c.article_id == articles_table.c.article_id)
             .where(candidates_table.c.candidate_pool_id == candidate_pool_id)
         )
@@ -77,7 +77,9 @@ class DbCandidatePoolRepository(DatabaseRepository):
 
         return pool
 
-    def fetch_candidate_pools_between(self, start_date: date, end_date: date) -> list[CandidatePool]:
+    def fetch_candidate_pools_between(
+        self, start_date: date, end_date: date, *, fields: ArticleFields = "full"
+    ) -> list[CandidatePool]:
         pools_table = self.tables["candidate_pools"]
         candidates_table = self.tables["candidate_articles"]
         articles_table = self.tables["articles"]
@@ -100,7 +102,7 @@ class DbCandidatePoolRepository(DatabaseRepository):
         # Then loop through and fetch the contents
         for pool in pools:
             query = (
-                select(articles_table)
+                select(*article_columns(articles_table, fields))
                 .join(candidates_table, candidates_table.c.article_id == articles_table.c.article_id)
                 .where(candidates_table.c.candidate_pool_id == pool.pool_id)
             )
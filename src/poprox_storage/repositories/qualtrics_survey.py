@@ -17,12 +17,44 @@ from poprox_storage.concepts.qualtrics_survey import (
     QualtricsSurveyResponse,
 )
 from poprox_storage.repositories.data_stores import DatabaseRepository, S3Repository
+from poprox_storage.repositories.data_stores.parquet import ExportSchema
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 NEWS_FILE_KEY = "mockObjects/ap_scraped_data.json"
 
+# Tall format, one row per answered question. `finished`, `progress` and `recorded_date`
+# come straight from Qualtrics, so their types are inferred
+SURVEY_RESPONSES_SCHEMA = ExportSchema(
+    "survey_responses",
+    version=1,
+    fields={
+        "account_id": "string",
+        "survey_id": "string",
+        "qualtrics_id": "string",
+        "survey_code": "string",
+        "survey_response_id": "string",
+        "qid": "string",
+        "response_value": "string",
+    },
+    dictionary=(
+        "account_id",
+        "survey_id",
+        "qualtrics_id",
+        "survey_code",
+        "survey_response_id",
+        "qid",
+        "response_value",
+    ),
+)
+SURVEY_INSTANCES_SCHEMA = ExportSchema(
+    "survey_instances",
+    version=1,
+    fields={"survey_instance_id": "string", "survey_id": "string", "account_id": "string", "created_at": "timestamp"},
+    dictionary=("survey_id",),
+)
+
 
 class DbQualtricsSurveyRepository(DatabaseRepository):
     def __init__(self, connection: Connection):
@@ -452,7 +484,9 @@ class S3QualtricsSurveyRepository(S3Repository):
         start_time: datetime | None = None,
     ):
         records = extract_and_flatten(responses)
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, schema=SURVEY_RESPONSES_SCHEMA
+        )
 
     def store_instances_as_parquet(
         self,
@@ -470,7 +504,9 @@ class S3QualtricsSurveyRepository(S3Repository):
             }
             for i in instances
         ]
-        return self._write_records_as_parquet(records, bucket_name, file_prefix, start_time)
+        return self._write_records_as_parquet(
+            records, bucket_name, file_prefix, start_time, schema=SURVEY_INSTANCES_SCHEMA
+        )
 
 
 def extract_and_flatten(responses: list[QualtricsCleanResponse]):
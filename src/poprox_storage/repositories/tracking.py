@@ -0,0 +1,161 @@
+import json
+import logging
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy.exc import DataError, IntegrityError, InternalError
+
+from poprox_storage.aws.sqs import SQS
+from poprox_storage.repositories.accounts import DbAccountRepository
+from poprox_storage.repositories.clicks import DbClicksRepository
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class TrackingEventConsumer:
+    """
+    Drains click and login events queued by `enqueue_click`/`enqueue_login`
+    and writes them to the database in bulk
+
+    Messages are only deleted from the queue after the rows they describe have
+    been committed. Since each event carries its own id, which is used as the
+    row's primary key, re-delivered messages are skipped rather than duplicated.
+    """
+
+    def __init__(
+        self,
+        queue: SQS,
+        queue_url: str,
+        clicks_repo: DbClicksRepository,
+        accounts_repo: DbAccountRepository,
+        *,
+        batch_size: int = 100,
+    ):
+        self.queue = queue
+        self.queue_url = queue_url
+        self.clicks_repo = clicks_repo
+        self.accounts_repo = accounts_repo
+        self.batch_size = batch_size
+
+    def drain(self, max_batches: int | None = None) -> dict[str, int]:
+        """
+        Read and store batches of events until the queue is empty (or `max_batches` is reached)
+
+        Returns counts of stored clicks and logins, duplicates skipped, and invalid
+        messages, which are either malformed or rejected by the database. Those are
+        left on the queue for its dead-letter policy to handle.
+        """
+        totals = {"clicks": 0, "logins": 0, "duplicates": 0, "invalid": 0}
+
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            messages = self._receive_batch()
+            if not messages:
+                break
+            self._store_batch(messages, totals)
+            batches += 1
+
+        logger.info(f"Stored tracking events from {batches} batches: {totals}")
+        return totals
+
+    def _receive_batch(self) -> list[dict]:
+        messages = []
+        while len(messages) < self.batch_size:
+            received = self.queue.receive_message(
+                self.queue_url, max_number_of_messages=min(10, self.batch_size - len(messages))
+            )
+            if not received:
+                break
+            messages.extend(received)
+        return messages
+
+    def _store_batch(self, messages: list[dict], totals: dict[str, int]):
+        events = []
+        for message in messages:
+            try:
+                event = json.loads(message["Body"])
+                row = _event_to_row(event)
+            except (KeyError, TypeError, ValueError) as exc:
+                logger.error(f"Skipping invalid tracking event {message.get('MessageId')}: {exc}")
+                totals["invalid"] += 1
+                continue
+            events.append((event["event_type"], row, message))
+
+        try:
+            stored_events = [self._store_events(events)]
+        except (DataError, IntegrityError, InternalError) as exc:
+            # One bad row fails the whole insert, so store the events one at a time
+            # to find it, and leave it on the queue for its dead-letter policy
+            logger.warning(f"Failed to store a batch of {len(events)} tracking events, retrying individually: {exc}")
+            self._rollback()
+            stored_events = []
+            for event in events:
+                try:
+                    stored_events.append(self._store_events([event]))
+                except (DataError, IntegrityError, InternalError) as exc:
+                    logger.error(f"Failed to store tracking event {event[2].get('MessageId')}: {exc}")
+                    self._rollback()
+                    totals["invalid"] += 1
+
+        processed_handles = []
+        for stored, stored_clicks, stored_logins in stored_events:
+            totals["clicks"] += stored_clicks
+            totals["logins"] += stored_logins
+            totals["duplicates"] += len(stored) - stored_clicks - stored_logins
+            processed_handles.extend(message["ReceiptHandle"] for _, _, message in stored)
+
+        if not processed_handles:
+            return
+        response = self.queue.delete_message_batch(self.queue_url, processed_handles)
+        if response["Failed"]:
+            # The rows are already stored, so these will be skipped when they're re-delivered
+            logger.warning(f"Failed to delete {len(response['Failed'])} tracking event messages")
+
+    def _store_events(self, events: list[tuple]) -> tuple[list[tuple], int, int]:
+        clicks = [row for event_type, row, _ in events if event_type == "click"]
+        logins = [row for event_type, row, _ in events if event_type != "click"]
+
+        stored_clicks = self.clicks_repo.store_clicks(clicks, commit=False)
+        stored_logins = self.accounts_repo.store_logins(logins, commit=False)
+
+        self.clicks_repo.conn.commit()
+        if self.accounts_repo.conn is not self.clicks_repo.conn:
+            self.accounts_repo.conn.commit()
+
+        return events, stored_clicks, stored_logins
+
+    def _rollback(self):
+        self.clicks_repo.conn.rollback()
+        if self.accounts_repo.conn is not self.clicks_repo.conn:
+            self.accounts_repo.conn.rollback()
+
+
+def _event_to_row(event: dict) -> dict:
+    data = event["data"]
+    event_id = UUID(event["event_id"])
+    created_at = datetime.fromisoformat(event["created_at"])
+    newsletter_id = UUID(data["newsletter_id"]) if data.get("newsletter_id") else None
+
+    if event["event_type"] == "click":
+        return {
+            "click_id": event_id,
+            "account_id": UUID(data["account_id"]),
+            "newsletter_id": newsletter_id,
+            "impression_id": UUID(data["impression_id"]) if data.get("impression_id") else None,
+            "article_id": UUID(data["article_id"]),
+            "headers": data.get("headers"),
+            "created_at": created_at,
+        }
+    elif event["event_type"] == "login":
+        return {
+            "web_login_id": event_id,
+            "account_id": UUID(data["account_id"]),
+            "newsletter_id": newsletter_id,
+            "endpoint": data["endpoint"],
+            "data": data.get("data") or {},
+            "created_at": created_at,
+        }
+
+    msg = f"Unknown tracking event type {event['event_type']}"
+    raise ValueError(msg)
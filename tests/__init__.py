@@ -1,6 +1,112 @@
-from sqlalchemy import text
+import io
+import json
+import os
+from contextlib import contextmanager
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlalchemy import event, text
+
+from poprox_storage.repositories.data_stores.s3 import S3Repository
+
+# Timing comparisons depend on the machine and what else it's running, so they
+# only run when asked for (POPROX_BENCHMARKS=1), and print what they measure
+benchmark = pytest.mark.skipif(not os.environ.get("POPROX_BENCHMARKS"), reason="set POPROX_BENCHMARKS=1 to run")
 
 
 def clear_tables(conn, *tables):
     for table in tables:
         conn.execute(text(f"delete from {table};"))
+
+
+@contextmanager
+def captured_statements(conn):
+    """Collect the (statement, parameters) of every query run on `conn` inside the block"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(conn, "before_cursor_execute", capture)
+
+
+def explain(conn, statement, parameters=None, *, analyze=False) -> dict:
+    """Return the top-level plan node of `EXPLAIN (FORMAT JSON)` for a captured statement"""
+    options = "ANALYZE, FORMAT JSON" if analyze else "FORMAT JSON"
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN ({options}) {statement}", parameters)
+        [(plan,)] = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def plan_relations(plan: dict) -> set[str]:
+    """The names of every table scanned anywhere in a plan"""
+    relations = set()
+    if "Relation Name" in plan:
+        relations.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        relations |= plan_relations(child)
+    return relations
+
+
+class LocalOutputFileSystem:
+    """Opens files under a local directory, creating parent directories as S3 implicitly would"""
+
+    def __init__(self, root):
+        from pyarrow import fs
+
+        self.root = root
+        self.filesystem = fs.LocalFileSystem()
+
+    def open_output_stream(self, path):
+        path = self.root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return self.filesystem.open_output_stream(str(path))
+
+    def open_input_file(self, path):
+        return self.filesystem.open_input_file(str(self.root / path))
+
+
+class LocalParquetRepository(S3Repository):
+    """Writes Parquet files under a local directory instead of S3"""
+
+    def __init__(self, root):
+        super().__init__("test-bucket")
+        self.root = root
+
+    def _parquet_filesystem(self):
+        return LocalOutputFileSystem(self.root)
+
+
+class InMemoryS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+class StubSession:
+    """A boto3 session that hands out the given client for every service"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def client(self, service_name, region_name=None):
+        return self._client
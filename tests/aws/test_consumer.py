@@ -0,0 +1,63 @@
+import time
+
+from poprox_storage.aws.consumer import SQSConsumer
+from poprox_storage.aws.sqs import LocalSQS
+
+QUEUE_URL = "local://consumer-queue"
+
+
+def test_consumer_deletes_successes_and_leaves_failures():
+    queue = LocalSQS()
+    for n in range(25):
+        queue.send_message(QUEUE_URL, {"n": n})
+
+    handled = []
+
+    def handler(message):
+        if '"n": 3}' in message["Body"]:
+            raise ValueError("bad message")
+        handled.append(message["Body"])
+
+    consumer = SQSConsumer(queue, QUEUE_URL, handler, max_workers=4, wait_time_seconds=0)
+    stats = consumer.run(stop_when_empty=True)
+
+    assert stats.received == 25
+    assert stats.succeeded == 24
+    assert stats.failed == 1
+    assert len(handled) == 24
+    assert stats.max_lag_seconds >= 0
+
+    remaining = queue.queued_messages(QUEUE_URL)
+    assert len(remaining) == 1
+    assert '"n": 3}' in remaining[0]["Body"]
+
+
+def test_consumer_extends_visibility_for_slow_handlers():
+    queue = LocalSQS()
+    queue.send_message(QUEUE_URL, {"slow": True})
+
+    consumer = SQSConsumer(
+        queue, QUEUE_URL, lambda message: time.sleep(0.3), wait_time_seconds=0, visibility_timeout=0.1
+    )
+    stats = consumer.run(max_polls=1)
+
+    assert stats.succeeded == 1
+    assert stats.visibility_extensions >= 1
+    assert queue.queued_messages(QUEUE_URL) == []
+
+
+def test_consumer_can_run_again_after_stopping():
+    queue = LocalSQS()
+    handled = []
+    consumer = SQSConsumer(queue, QUEUE_URL, handled.append, wait_time_seconds=0)
+
+    for batch in range(2):
+        queue.send_message(QUEUE_URL, {"batch": batch})
+        consumer.run(stop_when_empty=True)
+    assert len(handled) == 2
+
+    queue.send_message(QUEUE_URL, {"batch": 2})
+    with consumer:
+        assert consumer.poll_once() == 1
+    assert consumer._executor is None
+    assert consumer.stats.succeeded == 3
@@ -0,0 +1,36 @@
+import sys
+
+import pytest
+
+from poprox_storage.aws.s3 import S3, compress
+from tests import InMemoryS3Client, StubSession
+
+
+def test_content_addressed_objects_are_compressed_and_deduplicated():
+    client = InMemoryS3Client()
+    s3 = S3(StubSession(client))
+    body = ("<html>" + "<p>Today's news</p>" * 5000 + "</html>").encode("utf-8")
+
+    stored = s3.put_content_addressed("bucket", "email-bodies/", body, suffix=".html")
+    stored_again = s3.put_content_addressed("bucket", "email-bodies", body, suffix=".html")
+
+    assert stored.key == stored_again.key
+    assert stored.key.startswith("email-bodies/") and stored.key.endswith(".html.gz")
+    assert len(client.objects) == 1
+    assert stored.bytes_saved > 0.9 * len(body)
+    assert s3.get_decompressed("bucket", stored.key) == body
+
+
+def test_zstd_without_zstandard_explains_how_to_install_it(monkeypatch):
+    # None in sys.modules makes the import fail, as if the package weren't installed
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+
+    with pytest.raises(ImportError, match=r"poprox-storage\[zstd\]"):
+        compress(b"body", "zstd")
+
+
+def test_unknown_compression_lists_the_supported_ones():
+    s3 = S3(StubSession(InMemoryS3Client()))
+
+    with pytest.raises(ValueError, match="expected one of gzip, zstd"):
+        s3.put_content_addressed("bucket", "email-bodies", b"body", compression="brotli")
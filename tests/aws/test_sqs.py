@@ -0,0 +1,81 @@
+from threading import Lock
+
+from poprox_storage.aws.sqs import SQS, LocalSQS
+from tests import StubSession
+
+QUEUE_URL = "local://test-queue"
+
+
+class FlakySQSClient:
+    """Stub boto3 SQS client that fails the first attempt at sending some messages"""
+
+    def __init__(self, transient_failures=(), permanent_failures=()):
+        self.transient_failures = set(transient_failures)
+        self.permanent_failures = set(permanent_failures)
+        self.batch_sizes = []
+        self.received = []
+        self._lock = Lock()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        successful = []
+        failed = []
+        with self._lock:
+            self.batch_sizes.append(len(Entries))
+            for entry in Entries:
+                body = entry["MessageBody"]
+                if body in self.permanent_failures:
+                    failed.append({"Id": entry["Id"], "Code": "InvalidMessageContents", "SenderFault": True})
+                elif body in self.transient_failures:
+                    self.transient_failures.remove(body)
+                    failed.append({"Id": entry["Id"], "Code": "InternalError", "SenderFault": False})
+                else:
+                    self.received.append(body)
+                    successful.append({"Id": entry["Id"], "MessageId": body})
+        return {"Successful": successful, "Failed": failed}
+
+
+def test_local_sqs_hides_received_messages_until_deleted():
+    queue = LocalSQS()
+    for idx in range(15):
+        queue.send_message(QUEUE_URL, {"idx": idx})
+
+    first = queue.receive_message(QUEUE_URL, max_number_of_messages=10)
+    second = queue.receive_message(QUEUE_URL, max_number_of_messages=10)
+    assert len(first) == 10
+    assert len(second) == 5
+    assert queue.receive_message(QUEUE_URL, max_number_of_messages=10) == []
+
+    response = queue.delete_message_batch(QUEUE_URL, [m["ReceiptHandle"] for m in first + second])
+    assert len(response["Successful"]) == 15
+    assert response["Failed"] == []
+    assert queue.queued_messages(QUEUE_URL) == []
+
+
+def test_local_sqs_redelivers_after_visibility_timeout():
+    queue = LocalSQS(visibility_timeout=0)
+    queue.send_message(QUEUE_URL, "hello")
+
+    first = queue.receive_message(QUEUE_URL)
+    second = queue.receive_message(QUEUE_URL)
+    assert first[0]["MessageId"] == second[0]["MessageId"]
+    assert second[0]["Attributes"]["ApproximateReceiveCount"] == "2"
+
+    # Only the latest receipt handle can delete the message
+    response = queue.delete_message_batch(QUEUE_URL, [first[0]["ReceiptHandle"]])
+    assert len(response["Failed"]) == 1
+    response = queue.delete_message_batch(QUEUE_URL, [second[0]["ReceiptHandle"]])
+    assert len(response["Successful"]) == 1
+
+
+def test_send_messages_chunks_and_retries_failures():
+    messages = [f"message-{idx}" for idx in range(95)]
+    client = FlakySQSClient(transient_failures={"message-3", "message-42"}, permanent_failures={"message-7"})
+    queue = SQS(StubSession(client))
+
+    report = queue.send_messages(QUEUE_URL, messages, max_workers=4, backoff_seconds=0)
+
+    assert max(client.batch_sizes) == 10
+    assert report.sent == 94
+    assert sorted(client.received) == sorted(m for m in messages if m != "message-7")
+    assert [entry["MessageBody"] for entry in report.failed] == ["message-7"]
+    assert report.throughput > 0
@@ -0,0 +1,380 @@
+"""
+Query-plan regression checks for repository methods
+
+Repository methods are run against a seeded synthetic database while their SQL is
+captured through SQLAlchemy events, and each captured statement is run through
+`EXPLAIN (ANALYZE, FORMAT JSON)`. The plans are checked against the expectations in
+tests/data/query_plans.toml: no sequential scans of large tables, and every
+expected index in use.
+
+Set POPROX_PLAN_SCALE to seed a bigger (or smaller) database, POPROX_PLAN_BASELINE
+to a JSON file of costs from an earlier run to report cost deltas against it, and
+POPROX_PLAN_WRITE_BASELINE to a path to save this run's costs.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from uuid import uuid4
+
+import tomli
+from sqlalchemy import text
+
+from tests import explain
+
+EXPECTATIONS_PATH = Path(__file__).parent / "data" / "query_plans.toml"
+SCALE = float(os.environ.get("POPROX_PLAN_SCALE", 1))
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO accounts (email, source, status, created_at)
+    SELECT :source || '-' || n || '@example.com', :source, 'subscribed',
+           timestamp '2024-01-01' + n * interval '1 minute'
+    FROM generate_series(1, :accounts) AS n
+    """,
+    """
+    INSERT INTO articles (headline, url, published_at, created_at, source, external_id)
+    SELECT 'headline ' || n, 'https://example.com/' || :source || '/' || n,
+           timestamp '2024-01-01' + (n % 365) * interval '1 day',
+           timestamp '2024-01-01' + (n % 365) * interval '1 day' + interval '1 hour',
+           :source, 'plans-' || n
+    FROM generate_series(1, :articles) AS n
+    """,
+    """
+    INSERT INTO entities (entity_type, name, source, external_id)
+    SELECT 'topic', 'plans topic ' || n, :source, 'plans-topic-' || n
+    FROM generate_series(1, :entities) AS n
+    """,
+    """
+    INSERT INTO mentions (entity_id, article_id, source, relevance)
+    SELECT DISTINCT ON (e.entity_id, a.article_id) e.entity_id, a.article_id, :source, 1.0
+    FROM (SELECT article_id, row_number() OVER () AS n FROM articles WHERE source = :source) AS a
+    JOIN (SELECT entity_id, row_number() OVER () AS n FROM entities WHERE source = :source) AS e
+      ON e.n IN (a.n % :entities + 1, (a.n * 7) % :entities + 1, (a.n * 13) % :entities + 1)
+    """,
+    """
+    INSERT INTO newsletters (account_id, email_subject, html, created_at)
+    SELECT a.account_id, 'plans', '', timestamp '2024-01-01' + (n * 17 % 365) * interval '1 day'
+    FROM accounts AS a, generate_series(1, :newsletters_per_account) AS n
+    WHERE a.source = :source
+    """,
+    """
+    INSERT INTO section_types (flavor, personalized, title)
+    VALUES ('plans', true, 'plans')
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO impressed_sections (section_type_id, newsletter_id, position)
+    SELECT (SELECT section_type_id FROM section_types WHERE flavor = 'plans'), nl.newsletter_id, 1
+    FROM newsletters AS nl JOIN accounts AS a USING (account_id)
+    WHERE a.source = :source
+    """,
+    """
+    WITH seeded_articles AS (
+        SELECT article_id, row_number() OVER (ORDER BY article_id) AS n FROM articles WHERE source = :source
+    ), seeded_sections AS (
+        SELECT s.section_id, s.newsletter_id, nl.created_at, row_number() OVER (ORDER BY s.section_id) AS n
+        FROM impressed_sections AS s
+        JOIN newsletters AS nl USING (newsletter_id)
+        JOIN accounts AS a USING (account_id)
+        WHERE a.source = :source
+    )
+    INSERT INTO impressions (newsletter_id, impressed_section_id, article_id, position, created_at)
+    SELECT s.newsletter_id, s.section_id, art.article_id, p, s.created_at
+    FROM seeded_sections AS s
+    CROSS JOIN generate_series(1, :impressions_per_newsletter) AS p
+    JOIN seeded_articles AS art ON art.n = (s.n * 31 + p) % :articles + 1
+    """,
+    """
+    INSERT INTO clicks (account_id, newsletter_id, impression_id, article_id, created_at)
+    SELECT nl.account_id, imp.newsletter_id, imp.impression_id, imp.article_id, imp.created_at + interval '1 hour'
+    FROM impressions AS imp
+    JOIN newsletters AS nl USING (newsletter_id)
+    JOIN accounts AS a ON a.account_id = nl.account_id
+    WHERE a.source = :source AND imp.position <= 3
+    """,
+    """
+    INSERT INTO web_logins (account_id, endpoint, data, created_at)
+    SELECT a.account_id, 'plans', '{}', timestamp '2024-01-01' + (n * 37 % 365) * interval '1 day'
+    FROM accounts AS a, generate_series(1, :logins_per_account) AS n
+    WHERE a.source = :source
+    """,
+    """
+    WITH seeded_accounts AS (
+        SELECT account_id, row_number() OVER (ORDER BY account_id) AS n FROM accounts WHERE source = :source
+    ), seeded_entities AS (
+        SELECT entity_id, row_number() OVER (ORDER BY entity_id) AS n FROM entities WHERE source = :source
+    )
+    INSERT INTO account_interest_log (account_id, entity_id, preference, frequency, created_at)
+    SELECT a.account_id, e.entity_id, (a.n + i) % 5 + 1, 1, timestamp '2024-01-01' + i * interval '1 day'
+    FROM seeded_accounts AS a
+    CROSS JOIN generate_series(1, :interests_per_account) AS i
+    JOIN seeded_entities AS e ON e.n = (a.n * 7 + i) % :entities + 1
+    """,
+    """
+    INSERT INTO experiments (description, start_date, end_date)
+    VALUES (:source, date '2024-01-01', date '2024-12-31')
+    """,
+    """
+    INSERT INTO expt_groups (group_name, experiment_id)
+    SELECT 'group ' || n, (SELECT experiment_id FROM experiments WHERE description = :source)
+    FROM generate_series(1, :groups) AS n
+    """,
+    """
+    WITH seeded_accounts AS (
+        SELECT account_id, row_number() OVER (ORDER BY account_id) AS n FROM accounts WHERE source = :source
+    ), seeded_groups AS (
+        SELECT g.group_id, row_number() OVER (ORDER BY g.group_id) AS n
+        FROM expt_groups AS g JOIN experiments AS e USING (experiment_id)
+        WHERE e.description = :source
+    )
+    INSERT INTO expt_assignments (group_id, account_id)
+    SELECT g.group_id, a.account_id
+    FROM seeded_accounts AS a
+    CROSS JOIN generate_series(1, :assignments_per_account) AS k
+    JOIN seeded_groups AS g ON g.n = (a.n + k * 10) % :groups + 1
+    """,
+    """
+    INSERT INTO qualtrics_surveys (qualtrics_id, base_url)
+    VALUES (:source, 'https://example.com/survey')
+    """,
+    """
+    INSERT INTO qualtrics_survey_instances (survey_id, account_id)
+    SELECT (SELECT survey_id FROM qualtrics_surveys WHERE qualtrics_id = :source), a.account_id
+    FROM accounts AS a, generate_series(1, :surveys_per_account)
+    WHERE a.source = :source
+    """,
+]
+
+SEEDED_TABLES = [
+    "clicks",
+    "web_logins",
+    "impressions",
+    "impressed_sections",
+    "section_types",
+    "newsletters",
+    "mentions",
+    "entities",
+    "article_placements",
+    "articles",
+]
+
+# Tables that other tests' rows depend on, so only the seeded rows are removed from them
+ANALYZED_TABLES = ["accounts", "account_interest_log", "expt_assignments", "qualtrics_survey_instances"]
+SEEDED_ROW_CLEANUP = [
+    """
+    DELETE FROM qualtrics_survey_instances
+    WHERE survey_id IN (SELECT survey_id FROM qualtrics_surveys WHERE qualtrics_id = :source)
+    """,
+    "DELETE FROM qualtrics_surveys WHERE qualtrics_id = :source",
+    """
+    DELETE FROM expt_assignments
+    WHERE group_id IN (
+        SELECT group_id FROM expt_groups JOIN experiments USING (experiment_id) WHERE description = :source
+    )
+    """,
+    """
+    DELETE FROM expt_groups
+    WHERE experiment_id IN (SELECT experiment_id FROM experiments WHERE description = :source)
+    """,
+    "DELETE FROM experiments WHERE description = :source",
+    """
+    DELETE FROM account_interest_log
+    WHERE account_id IN (SELECT account_id FROM accounts WHERE source = :source)
+    """,
+]
+
+
+def seed_database(conn, scale: float = SCALE) -> str:
+    """
+    Fill the tables repository queries run against with synthetic data, at `scale`
+    times the base size. Seeded rows are tagged with a source unique to this run,
+    which is returned.
+    """
+    source = f"query-plans-{uuid4().hex[:8]}"
+    sizes = {
+        "accounts": int(2_000 * scale),
+        "articles": int(20_000 * scale),
+        "entities": 500,
+        "newsletters_per_account": 20,
+        "impressions_per_newsletter": 10,
+        "logins_per_account": 50,
+        "interests_per_account": 20,
+        "groups": 250,
+        "assignments_per_account": 25,
+        "surveys_per_account": 10,
+    }
+    for table in ("clicks", "web_logins"):
+        conn.execute(
+            text("SELECT create_monthly_partitions(:table, :start, :end)"),
+            {"table": table, "start": "2024-01-01", "end": "2025-01-01"},
+        )
+    for statement in SEED_STATEMENTS:
+        conn.execute(text(statement), {"source": source, **sizes})
+    for table in SEEDED_TABLES + ANALYZED_TABLES:
+        conn.execute(text(f"ANALYZE {table}"))
+    conn.commit()
+    return source
+
+
+def remove_seeded_rows(conn, source: str):
+    """Remove the seeded rows from tables that aren't cleared wholesale"""
+    for statement in SEEDED_ROW_CLEANUP:
+        conn.execute(text(statement), {"source": source})
+    conn.commit()
+
+
+@dataclass
+class PlanReport:
+    case: str
+    estimated_cost: float = 0.0
+    actual_ms: float = 0.0
+    indexes_used: set[str] = field(default_factory=set)
+    seq_scans: set[str] = field(default_factory=set)
+    problems: list[str] = field(default_factory=list)
+
+
+def load_expectations() -> dict:
+    with open(EXPECTATIONS_PATH, "rb") as f:
+        return tomli.load(f)
+
+
+def check_plans(conn, case: str, statements, expectations: dict) -> PlanReport:
+    """Explain the statements captured for a case and compare them against its expectations"""
+    expected = expectations["cases"][case]
+    large_tables = set(expectations["large_tables"]) - set(expected.get("seq_scans", []))
+    parents = _partition_parents(conn)
+
+    report = PlanReport(case)
+    for plan in _explain_all(conn, statements):
+        report.estimated_cost += plan["Total Cost"]
+        report.actual_ms += plan.get("Actual Total Time", 0.0)
+
+        for node in _plan_nodes(plan):
+            if "Index Name" in node:
+                report.indexes_used.add(parents.get(node["Index Name"], node["Index Name"]))
+            if node["Node Type"] in ("Seq Scan", "Parallel Seq Scan"):
+                report.seq_scans.add(parents.get(node["Relation Name"], node["Relation Name"]))
+
+    for table in sorted(report.seq_scans & large_tables):
+        report.problems.append(f"sequential scan of {table}")
+    for index in expected.get("indexes", []):
+        if index not in report.indexes_used:
+            report.problems.append(f"expected index {index} was not used")
+
+    return report
+
+
+@dataclass
+class IndexBenefit:
+    index: str
+    estimated_cost: float
+    actual_ms: float
+    estimated_cost_without: float
+    actual_ms_without: float
+
+    @property
+    def cost_ratio(self) -> float:
+        """How many times more the statements are estimated to cost without the index"""
+        return self.estimated_cost_without / self.estimated_cost if self.estimated_cost else float("inf")
+
+    def __str__(self):
+        return (
+            f"{self.index}: estimated cost {self.estimated_cost_without:.1f} -> {self.estimated_cost:.1f}, "
+            f"actual {self.actual_ms_without:.2f}ms -> {self.actual_ms:.2f}ms"
+        )
+
+
+def measure_index_benefit(conn, statements, index: str) -> IndexBenefit:
+    """
+    Compare the plans for a case's statements with and without `index`
+
+    The index (or the constraint it backs) is dropped inside a savepoint that's
+    rolled back afterwards, so this leaves the schema as it found it.
+    """
+    with_index = _total_costs(_explain_all(conn, statements))
+
+    savepoint = conn.begin_nested()
+    try:
+        constraint = conn.execute(
+            text(
+                "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE conindid = CAST(:index AS regclass)"
+            ),
+            {"index": index},
+        ).first()
+        if constraint:
+            conn.execute(text(f"ALTER TABLE {constraint[0]} DROP CONSTRAINT {constraint[1]}"))
+        else:
+            conn.execute(text(f"DROP INDEX {index}"))
+        without_index = _total_costs(_explain_all(conn, statements))
+    finally:
+        savepoint.rollback()
+
+    return IndexBenefit(index, *with_index, *without_index)
+
+
+def report_cost_deltas(reports: list[PlanReport]) -> str:
+    """Format each case's costs, compared with the POPROX_PLAN_BASELINE run if there is one"""
+    baseline = {}
+    baseline_path = os.environ.get("POPROX_PLAN_BASELINE")
+    if baseline_path and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    lines = []
+    for report in reports:
+        line = f"{report.case}: estimated cost {report.estimated_cost:.1f}, actual {report.actual_ms:.2f}ms"
+        if report.case in baseline:
+            before = baseline[report.case]
+            line += (
+                f" (estimated {report.estimated_cost - before['estimated_cost']:+.1f}, "
+                f"actual {report.actual_ms - before['actual_ms']:+.2f}ms)"
+            )
+        lines.append(line)
+
+    write_path = os.environ.get("POPROX_PLAN_WRITE_BASELINE")
+    if write_path:
+        with open(write_path, "w") as f:
+            json.dump(
+                {r.case: {"estimated_cost": r.estimated_cost, "actual_ms": r.actual_ms} for r in reports}, f, indent=2
+            )
+
+    return "\n".join(lines)
+
+
+def _explain_all(conn, statements) -> list[dict]:
+    plans = []
+    for statement, parameters in statements:
+        # Only reads are actually run, so writes captured along the way aren't repeated
+        analyze = statement.lstrip().upper().startswith(("SELECT", "WITH"))
+        plans.append(explain(conn, statement, parameters, analyze=analyze))
+    return plans
+
+
+def _total_costs(plans: list[dict]) -> tuple[float, float]:
+    return (
+        sum(plan["Total Cost"] for plan in plans),
+        sum(plan.get("Actual Total Time", 0.0) for plan in plans),
+    )
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _partition_parents(conn) -> dict[str, str]:
+    """Map partitions (and their indexes) to the partitioned table (or index) they belong to"""
+    rows = conn.execute(
+        text(
+            """
+            SELECT child.relname, parent.relname
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+            """
+        )
+    )
+    return dict(rows.fetchall())
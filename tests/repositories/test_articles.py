@@ -0,0 +1,238 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from poprox_concepts.domain import Article, Entity, Mention
+from poprox_storage.repositories.articles import ENTITY_ID_CACHE, DbArticleRepository
+from tests import captured_statements, clear_tables
+
+
+def test_fetch_articles_by_external_ids_returns_latest_version(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "candidate_articles",
+            "article_links",
+            "articles",
+        )
+
+        dbArticleRepository = DbArticleRepository(conn)
+
+        dbArticleRepository.store_article(
+            Article(
+                headline="headline-1-original",
+                url="url-1",
+                external_id="external-1",
+                source="tests",
+                created_at=datetime(2024, 6, 1, 12, 0, 0),
+            )
+        )
+        latest_id = dbArticleRepository.store_article(
+            Article(
+                headline="headline-1-updated",
+                url="url-1",
+                external_id="external-1",
+                source="tests",
+                created_at=datetime(2024, 6, 2, 12, 0, 0),
+            )
+        )
+        other_id = dbArticleRepository.store_article(
+            Article(
+                headline="headline-2",
+                url="url-2",
+                external_id="external-2",
+                source="tests",
+                created_at=datetime(2024, 6, 1, 12, 0, 0),
+            )
+        )
+
+        article = dbArticleRepository.fetch_article_by_external_id("external-1")
+        assert article is not None
+        assert article.article_id == latest_id
+        assert article.headline == "headline-1-updated"
+
+        articles = dbArticleRepository.fetch_articles_by_external_ids(["external-1", "external-2", "missing"])
+        assert {a.article_id for a in articles} == {latest_id, other_id}
+
+        assert dbArticleRepository.fetch_article_by_external_id("missing") is None
+        assert dbArticleRepository.fetch_articles_by_external_ids([]) == []
+
+
+def test_reingesting_unchanged_articles_skips_writes(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "candidate_articles",
+            "article_links",
+            "articles",
+        )
+
+        dbArticleRepository = DbArticleRepository(conn)
+        articles = [
+            Article(headline=f"headline-{n}", url=f"url-{n}", external_id=f"external-{n}", source="tests")
+            for n in range(3)
+        ]
+
+        first_ids = [dbArticleRepository.store_article(article) for article in articles]
+        assert dbArticleRepository.article_write_stats == {"written": 3, "skipped": 0}
+
+        # Re-ingested copies get new ingest times, which shouldn't count as a change
+        reingested = [article.model_copy(update={"created_at": datetime(2024, 6, 2)}) for article in articles]
+        reingested[0] = reingested[0].model_copy(update={"subhead": "new subhead"})
+        assert dbArticleRepository.store_articles(reingested) == 0
+        assert dbArticleRepository.article_write_stats == {"written": 4, "skipped": 2}
+
+        assert [dbArticleRepository.store_article(article) for article in reingested] == first_ids
+        assert dbArticleRepository.fetch_article_by_external_id("external-0").subhead == "new subhead"
+
+
+def test_reingesting_stale_articles_refreshes_created_at(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "candidate_articles",
+            "article_links",
+            "articles",
+        )
+
+        dbArticleRepository = DbArticleRepository(conn)
+        article = Article(headline="headline", url="url", external_id="external", source="tests")
+        article_id = dbArticleRepository.store_article(article)
+
+        # An article first ingested two days ago, and still in today's feed
+        conn.execute(
+            text("UPDATE articles SET created_at = created_at - interval '2 days' WHERE article_id = :article_id"),
+            {"article_id": article_id},
+        )
+        conn.commit()
+        assert dbArticleRepository.fetch_articles_ingested_since(days_ago=1) == []
+
+        assert dbArticleRepository.store_article(article) == article_id
+        assert dbArticleRepository.article_write_stats == {"written": 2, "skipped": 0}
+        assert [a.article_id for a in dbArticleRepository.fetch_articles_ingested_since(days_ago=1)] == [article_id]
+
+        # Within the refresh interval, re-ingests are skipped again
+        assert dbArticleRepository.store_article(article) == article_id
+        assert dbArticleRepository.article_write_stats == {"written": 2, "skipped": 1}
+
+
+def test_store_articles_reuses_entity_ids(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "candidate_articles",
+            "article_links",
+            "mentions",
+            "articles",
+        )
+        ENTITY_ID_CACHE.clear()
+
+        dbArticleRepository = DbArticleRepository(conn)
+
+        def make_articles(start, count):
+            return [
+                Article(
+                    headline=f"headline-{n}",
+                    url=f"url-{n}",
+                    mentions=[
+                        Mention(
+                            source="tests",
+                            relevance=1.0,
+                            entity=Entity(name=name, entity_type="subject", source="tests", external_id=name),
+                        )
+                        for name in ("Politics", "Sports")
+                    ],
+                )
+                for n in range(start, start + count)
+            ]
+
+        assert dbArticleRepository.store_articles(make_articles(0, 5), mentions=True) == 0
+        assert dbArticleRepository.entity_write_stats["upserted"] == 2
+
+        assert dbArticleRepository.store_articles(make_articles(5, 5), mentions=True) == 0
+        assert dbArticleRepository.entity_write_stats == {
+            "mentions": 20,
+            "cache_hits": 2,
+            "upserted": 2,
+            "round_trips_saved": 19,
+        }
+
+        with captured_statements(conn) as statements:
+            mentions = dbArticleRepository.fetch_mentions()
+        assert len(mentions) == 20
+        # The entities are looked up by id, without scanning mentions a second time
+        assert [str(statement).count("FROM mentions") for statement, _ in statements] == [1, 0]
+        assert len({mention.entity.entity_id for mention in mentions}) == 2
+
+        # Mentions of the same entity share a single Entity object
+        assert len({id(mention.entity) for mention in mentions}) == 2
+
+        first_article_id = dbArticleRepository.fetch_article_by_url("url-0")
+        assert len(dbArticleRepository.fetch_mentions_by_article_ids([first_article_id])) == 2
+        assert dbArticleRepository.fetch_mentions_by_article_ids([]) == []
+
+        window = dbArticleRepository.fetch_mentions_ingested_between(datetime(2000, 1, 1), datetime(2000, 2, 1))
+        assert window == []
+
+
+def test_summary_fetch_leaves_out_body_until_loaded(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "candidate_articles",
+            "article_links",
+            "mentions",
+            "articles",
+        )
+
+        dbArticleRepository = DbArticleRepository(conn)
+        article_id = dbArticleRepository.store_article(
+            Article(headline="headline-1", url="url-1", body="body " * 1000, raw_data={"id": "raw-1"})
+        )
+
+        [summary] = dbArticleRepository.fetch_articles_by_id([article_id], fields="summary")
+        assert summary.headline == "headline-1"
+        assert summary.body is None
+        assert summary.raw_data is None
+
+        dbArticleRepository.load_article_bodies([summary])
+        assert summary.body == "body " * 1000
+        assert summary.raw_data == {"id": "raw-1"}
+
+        [projected] = dbArticleRepository.fetch_articles_by_id([article_id], fields=["subhead"])
+        assert projected.article_id == article_id
+        assert projected.url == "url-1"
+
+        with pytest.raises(ValueError, match="Unknown article"):
+            dbArticleRepository.fetch_articles_by_id([article_id], fields="minimal")
@@ -1,9 +1,9 @@
 from uuid import uuid4
 
-from poprox_concepts.domain import Account, Article, Newsletter
+from poprox_concepts.domain import Account, Article, ImpressedSection, Impression, Newsletter
 from poprox_storage.repositories.accounts import DbAccountRepository
 from poprox_storage.repositories.articles import DbArticleRepository
-from poprox_storage.repositories.clicks import DbClicksRepository
+from poprox_storage.repositories.clicks import ARTICLE_ID_BY_URL, DbClicksRepository
 from poprox_storage.repositories.newsletters import DbNewsletterRepository
 from tests import clear_tables
 
@@ -62,3 +62,54 @@ def test_get_click_between(db_engine):
 
         assert 1 == len(valid_click)
         assert article_id_2 == valid_click[0].article_id
+
+
+def test_store_click_by_url(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "clicks",
+            "impressions",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "articles",
+        )
+        ARTICLE_ID_BY_URL.clear()
+
+        dbAccountRepository = DbAccountRepository(conn)
+        dbArticleRepository = DbArticleRepository(conn)
+        dbNewsletterRepository = DbNewsletterRepository(conn)
+        dbClicksRepository = DbClicksRepository(conn)
+
+        user_account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        article_id = dbArticleRepository.store_article(Article(headline="headline-1", url="url-1"))
+        article = dbArticleRepository.fetch_articles_by_id([article_id])[0]
+
+        newsletter_id = uuid4()
+        impression = Impression(newsletter_id=newsletter_id, position=1, article=article)
+        newsletter = Newsletter(
+            newsletter_id=newsletter_id,
+            account_id=user_account.account_id,
+            sections=[ImpressedSection(impressions=[impression])],
+            subject="",
+            body_html="",
+        )
+        dbNewsletterRepository.store_newsletter(newsletter)
+
+        # Unknown URLs and articles that weren't in the newsletter don't record clicks
+        assert dbClicksRepository.store_click_by_url("missing-url", user_account.account_id) is None
+        assert dbClicksRepository.store_click_by_url("url-1", user_account.account_id, uuid4()) is None
+
+        # The first click resolves the URL in the database, the second from the cache
+        for _ in range(2):
+            clicked_id = dbClicksRepository.store_click_by_url(
+                "url-1", user_account.account_id, newsletter_id, headers={"User-Agent": "test"}
+            )
+            assert clicked_id == article_id
+        assert ARTICLE_ID_BY_URL.hits == 1
+
+        clicks = dbClicksRepository.fetch_clicks_by_newsletter_ids([newsletter_id])[user_account.account_id]
+        assert len(clicks) == 2
+        assert all(click.impression_id == impression.impression_id for click in clicks)
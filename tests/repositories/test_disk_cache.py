@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import io
+import mmap
+import os
+
+from poprox_storage.repositories.data_stores.disk_cache import S3DiskCache
+from poprox_storage.repositories.data_stores.s3 import S3Repository
+
+
+class CountingS3Client:
+    def __init__(self, objects):
+        self.objects = objects
+        self.heads = 0
+        self.gets = 0
+
+    def _etag(self, key):
+        return '"' + hashlib.md5(self.objects[key]).hexdigest() + '"'
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        return {"ETag": self._etag(Key)}
+
+    def get_object(self, Bucket, Key):
+        self.gets += 1
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": self._etag(Key)}
+
+
+def test_repeat_reads_are_served_from_disk(tmp_path):
+    client = CountingS3Client({"manifest.toml": b"title = 'test'"})
+    repo = S3Repository("test-bucket")
+    repo.s3_client = client
+    repo.disk_cache = S3DiskCache(tmp_path, etag_ttl=0)
+
+    for _ in range(3):
+        assert repo.fetch_file_contents("manifest.toml") == "title = 'test'"
+    assert client.gets == 1
+
+    # A new version of the object has a new ETag, so it's fetched again
+    client.objects["manifest.toml"] = b"title = 'updated'"
+    assert repo.fetch_file_contents("manifest.toml") == "title = 'updated'"
+    assert client.gets == 2
+
+    assert repo.disk_cache.stats()["hits"] == 2
+    assert repo.disk_cache.stats()["misses"] == 2
+
+
+def test_recently_seen_etags_are_trusted(tmp_path):
+    client = CountingS3Client({"manifest.toml": b"title = 'test'"})
+    repo = S3Repository("test-bucket")
+    repo.s3_client = client
+    repo.disk_cache = S3DiskCache(tmp_path, etag_ttl=3600)
+
+    for _ in range(3):
+        assert repo.fetch_file_contents("manifest.toml") == "title = 'test'"
+    assert client.heads == 1
+    assert client.gets == 1
+
+    # Within the TTL, a new version isn't noticed
+    client.objects["manifest.toml"] = b"title = 'updated'"
+    assert repo.fetch_file_contents("manifest.toml") == "title = 'test'"
+
+    repo.disk_cache.etag_ttl = 0
+    assert repo.fetch_file_contents("manifest.toml") == "title = 'updated'"
+    assert client.heads == 2
+
+
+def test_compressed_objects_are_decompressed_like_smart_open(tmp_path):
+    client = CountingS3Client({"feed.jsonl.gz": gzip.compress(b'{"id": 1}')})
+    repo = S3Repository("test-bucket")
+    repo.s3_client = client
+    repo.disk_cache = S3DiskCache(tmp_path, etag_ttl=0)
+
+    for _ in range(2):
+        assert repo.fetch_file_contents("feed.jsonl.gz") == '{"id": 1}'
+    assert client.gets == 1
+
+    # The raw body is still cached (and returned) as stored
+    assert gzip.decompress(repo.fetch_file_bytes("feed.jsonl.gz")) == b'{"id": 1}'
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = S3DiskCache(tmp_path, max_bytes=250)
+
+    cache.put("bucket", "a", "1", b"a" * 100)
+    cache.put("bucket", "b", "1", b"b" * 100)
+    os.utime(cache._path("bucket", "a", "1"), (0, 0))
+    os.utime(cache._path("bucket", "b", "1"), (1, 1))
+    assert cache.get("bucket", "a", "1") == b"a" * 100
+
+    cache.put("bucket", "c", "1", b"c" * 100)
+
+    assert cache.get("bucket", "b", "1") is None
+    assert cache.get("bucket", "a", "1") is not None
+    assert cache.get("bucket", "c", "1") is not None
+    assert cache.evictions == 1
+    assert cache.size == 200
+
+
+def test_large_entries_are_memory_mapped(tmp_path):
+    cache = S3DiskCache(tmp_path, mmap_threshold=1024)
+    body = b"x" * 4096
+    cache.put("bucket", "large", "1", body)
+
+    data = cache.get("bucket", "large", "1")
+    assert isinstance(data, memoryview)
+    assert isinstance(data.obj, mmap.mmap)
+    assert data == body
+
+    # Decoding reads straight from the mapping
+    repo = S3Repository("bucket")
+    repo.s3_client = CountingS3Client({})
+    repo.disk_cache = cache
+    repo.disk_cache.remember_etag("bucket", "large", "1")
+    assert repo.fetch_file_bytes("large") == body
+    assert repo.fetch_file_contents("large") == body.decode()
@@ -0,0 +1,93 @@
+import time
+from datetime import datetime
+from typing import ClassVar
+from uuid import uuid4
+
+import pytest
+from pydantic import BaseModel, ValidationError, model_validator
+
+from poprox_concepts.domain import Article
+from poprox_storage.repositories.data_stores.hydration import hydrate, trusted_hydration
+from tests import benchmark
+
+
+def _article_fields(n):
+    return {
+        "article_id": uuid4(),
+        "headline": f"headline-{n}",
+        "subhead": f"subhead-{n}",
+        "url": f"https://example.com/{n}",
+        "source": "AP",
+        "external_id": f"external-{n}",
+        "published_at": datetime(2024, 6, 1),
+        "created_at": datetime(2024, 6, 1),
+    }
+
+
+def test_trusted_hydration_skips_validation_only_inside_the_block():
+    bad_fields = {**_article_fields(0), "headline": None}
+
+    with pytest.raises(ValidationError):
+        hydrate(Article, **bad_fields)
+
+    with trusted_hydration():
+        article = hydrate(Article, **bad_fields)
+        assert article.headline is None
+
+        with trusted_hydration(sample_rate=1.0), pytest.raises(ValidationError):
+            hydrate(Article, **bad_fields)
+
+    with pytest.raises(ValidationError):
+        hydrate(Article, **bad_fields)
+
+
+def test_trusted_hydration_builds_equal_models():
+    fields = _article_fields(1)
+    with trusted_hydration():
+        trusted = hydrate(Article, **fields)
+    assert trusted == hydrate(Article, **fields)
+
+
+class CountedModel(BaseModel):
+    """Counts how many times pydantic validates it"""
+
+    validations: ClassVar[int] = 0
+    name: str
+
+    @model_validator(mode="before")
+    @classmethod
+    def count(cls, data):
+        CountedModel.validations += 1
+        return data
+
+
+def test_trusted_hydration_never_runs_validation(monkeypatch):
+    monkeypatch.setattr(CountedModel, "validations", 0)
+
+    with trusted_hydration():
+        for n in range(100):
+            hydrate(CountedModel, name=f"name-{n}")
+    assert CountedModel.validations == 0
+
+    with trusted_hydration(sample_rate=1.0):
+        hydrate(CountedModel, name="sampled")
+    hydrate(CountedModel, name="validated")
+    assert CountedModel.validations == 2
+
+
+@benchmark
+def test_benchmark_trusted_hydration():
+    rows = [_article_fields(n) for n in range(20_000)]
+
+    start = time.perf_counter()
+    for row in rows:
+        hydrate(Article, **row)
+    validated_rate = len(rows) / (time.perf_counter() - start)
+
+    with trusted_hydration():
+        start = time.perf_counter()
+        for row in rows:
+            hydrate(Article, **row)
+        trusted_rate = len(rows) / (time.perf_counter() - start)
+
+    print(f"validated: {validated_rate:,.0f} articles/s; trusted: {trusted_rate:,.0f} articles/s")
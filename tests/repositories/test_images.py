@@ -0,0 +1,125 @@
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from poprox_concepts.domain import Image
+from poprox_storage.repositories.images import DbImageRepository, S3ImageRepository, extract_images, iter_images
+from tests import benchmark, clear_tables
+
+
+def _feed_lines(count, picture_every=10):
+    for n in range(count):
+        item_type = "picture" if n % picture_every == 0 else "text"
+        item = {
+            "type": item_type,
+            "altids": {"itemid": f"item-{n}"},
+            "renditions": {"preview": {"href": f"https://example.com/{n}.jpg"}},
+            "description_caption": f"Caption {n}",
+            "body": "x" * 500,
+        }
+        yield json.dumps({"data": {"item": item}})
+
+
+def test_streaming_extraction_matches_batch_extraction():
+    content = "\n".join(_feed_lines(200))
+
+    streamed = list(iter_images(content.splitlines()))
+    extracted = extract_images(content)
+
+    assert [image.external_id for image in streamed] == [image.external_id for image in extracted]
+    assert len(streamed) == 20
+    assert streamed[0].url == "https://example.com/0.jpg"
+
+
+class LocalImageRepository(S3ImageRepository):
+    """Serves AP image files from memory, raising for any key it doesn't have"""
+
+    def __init__(self, files):
+        self.bucket_name = "test-bucket"
+        self.files = files
+
+    def fetch_file_contents(self, key):
+        return self.files[key]
+
+
+def test_fetch_images_from_files_accepts_a_generator_of_keys():
+    files = {f"file-{n}": "\n".join(_feed_lines(20)) for n in range(3)}
+    repo = LocalImageRepository(files)
+
+    images = repo.fetch_images_from_files(key for key in files)
+
+    assert len(images) == 6
+
+
+def test_fetch_images_from_files_raises_after_fetching_every_file():
+    repo = LocalImageRepository({"file-0": "\n".join(_feed_lines(20))})
+
+    with pytest.raises(RuntimeError, match="1 of 2 image files: missing") as exc_info:
+        repo.fetch_images_from_files(["file-0", "missing"], max_workers=1)
+
+    assert isinstance(exc_info.value.__cause__, KeyError)
+
+
+@benchmark
+def test_benchmark_streaming_extraction():
+    count = 20_000
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    content = "\n".join(_feed_lines(count))
+    batch_count = len(extract_images(content))
+    del content
+    batch_seconds = time.perf_counter() - start
+    _, batch_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    streamed_count = sum(1 for _ in iter_images(_feed_lines(count)))
+    streamed_seconds = time.perf_counter() - start
+    _, streamed_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"extract_images: {batch_seconds:.3f}s, peak {batch_peak / 1e6:.1f} MB; "
+        f"iter_images: {streamed_seconds:.3f}s, peak {streamed_peak / 1e6:.1f} MB"
+    )
+    assert streamed_count == batch_count == count // 10
+    assert streamed_peak < batch_peak / 10
+
+
+def test_store_images_bulk_skips_unchanged_images(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(conn, "clicks", "impressions", "article_image_associations", "images")
+        dbImageRepository = DbImageRepository(conn)
+
+        images = [
+            Image(url=f"https://example.com/{n}.jpg", source="AP", external_id=f"item-{n}", raw_data={"n": n})
+            for n in range(5)
+        ]
+        assert dbImageRepository.store_images_bulk(images, chunk_size=2) == {
+            "inserted": 5,
+            "updated": 0,
+            "skipped": 0,
+            "failed": 0,
+        }
+
+        redelivered = images[:3] + [
+            Image(url="https://example.com/new.jpg", source="AP", external_id="item-3", raw_data={"n": 3}),
+            Image(url="https://example.com/5.jpg", source="AP", external_id="item-5", raw_data={"n": 5}),
+        ]
+        assert dbImageRepository.store_images_bulk(redelivered) == {
+            "inserted": 1,
+            "updated": 1,
+            "skipped": 3,
+            "failed": 0,
+        }
+
+        stored = dbImageRepository.fetch_image_by_external_id("item-3")
+        assert stored.url == "https://example.com/new.jpg"
+
+        by_id = dbImageRepository.fetch_images_by_ids([stored.image_id])
+        assert by_id[stored.image_id].external_id == "item-3"
+        assert dbImageRepository.fetch_images_by_ids([]) == {}
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+
+from poprox_storage.repositories.accounts import DbAccountRepository
+from poprox_storage.repositories.panel_management import DbPanelManagementRepository, S3PanelManagementRepository
+from tests import InMemoryS3Client, LocalOutputFileSystem
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+class LocalPanelManagementRepository(S3PanelManagementRepository):
+    """Writes exports under a local directory, and checkpoints to an in-memory S3 client"""
+
+    def __init__(self, root):
+        super().__init__("test-bucket")
+        self.root = root
+        self.s3_client = InMemoryS3Client()
+
+    def _parquet_filesystem(self):
+        return LocalOutputFileSystem(self.root)
+
+
+class FakeSubscriptions:
+    """Stands in for the subscriptions table, recording the windows it's asked for"""
+
+    def __init__(self):
+        self.rows = {}
+        self.windows = []
+
+    def upsert(self, subscription_id, updated_at, ended=None):
+        self.rows[subscription_id] = SimpleNamespace(
+            subscription_id=subscription_id,
+            account_id=uuid4(),
+            started=datetime(2024, 1, 1),
+            ended=ended,
+            updated_at=updated_at,
+        )
+
+    def fetch_changed_between(self, since, until):
+        self.windows.append((since, until))
+        return [
+            row for row in self.rows.values() if (since is None or row.updated_at >= since) and row.updated_at < until
+        ]
+
+
+def _read(root, key):
+    return pq.read_table(str(root / "bucket" / key)).to_pylist()
+
+
+def test_incremental_exports_write_deltas_and_compact(tmp_path):
+    repo = LocalPanelManagementRepository(tmp_path)
+    table = FakeSubscriptions()
+    day = datetime(2024, 6, 1)
+
+    def export(until):
+        return repo.export_incrementally(
+            "subscriptions", table.fetch_changed_between, "bucket", "subscriptions", until=until, compact_every=2
+        )
+
+    for n in range(3):
+        table.upsert(f"sub-{n}", day - timedelta(days=30))
+    first = export(day)
+    assert first.num_rows == 3
+    assert first.checkpoint.snapshot_key == "subscriptions_snapshot_20240601-000000.parquet"
+    assert len(_read(tmp_path, first.checkpoint.snapshot_key)) == 3
+
+    # One subscription ends and another starts
+    table.upsert("sub-0", day + timedelta(hours=3), ended=day + timedelta(hours=3))
+    table.upsert("sub-3", day + timedelta(hours=5))
+    second = export(day + timedelta(days=1))
+    assert second.num_rows == 2
+    assert second.checkpoint.delta_keys == ["subscriptions_delta_20240602-000000.parquet"]
+
+    # Nothing changed, so nothing is written, but the high-water mark still moves
+    third = export(day + timedelta(days=2))
+    assert third.written_keys == []
+    assert third.checkpoint.high_water_mark == day + timedelta(days=2)
+
+    # A second delta reaches `compact_every`, so the deltas are folded into a new snapshot
+    table.upsert("sub-1", day + timedelta(days=2, hours=1), ended=day + timedelta(days=2, hours=1))
+    fourth = export(day + timedelta(days=3))
+    assert fourth.compacted
+    assert fourth.checkpoint.delta_keys == []
+    snapshot = {row["subscription_id"]: row for row in _read(tmp_path, fourth.checkpoint.snapshot_key)}
+    assert sorted(snapshot) == ["sub-0", "sub-1", "sub-2", "sub-3"]
+    assert snapshot["sub-0"]["ended"] == day + timedelta(hours=3)
+    assert snapshot["sub-1"]["ended"] == day + timedelta(days=2, hours=1)
+    assert snapshot["sub-2"]["ended"] is None
+
+    # Each run only fetched what changed since the previous one
+    assert table.windows == [
+        (None, day),
+        (day, day + timedelta(days=1)),
+        (day + timedelta(days=1), day + timedelta(days=2)),
+        (day + timedelta(days=2), day + timedelta(days=3)),
+    ]
+
+    # The checkpoint was saved, so a new repository picks up where this one left off
+    rerun = LocalPanelManagementRepository(tmp_path)
+    rerun.s3_client = repo.s3_client
+    repeated = rerun.export_incrementally(
+        "subscriptions", table.fetch_changed_between, "bucket", "subscriptions", until=day + timedelta(days=3)
+    )
+    assert repeated.written_keys == []
+
+
+def test_changed_accounts_are_fetched_by_update_time(db_engine):
+    with db_engine.connect() as conn:
+        dbAccountRepository = DbAccountRepository(conn)
+        dbPanelManagementRepository = DbPanelManagementRepository(conn)
+
+        account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        conn.commit()
+        first_mark = conn.execute(text("SELECT clock_timestamp()::timestamp")).scalar() + timedelta(microseconds=1)
+
+        changed = dbPanelManagementRepository.fetch_accounts_changed_between(None, first_mark)
+        assert account.account_id in {a.account_id for a in changed}
+        assert dbPanelManagementRepository.fetch_accounts_changed_between(first_mark, first_mark) == []
+        conn.commit()
+
+        # Updating the account moves it into the next window
+        dbAccountRepository.update_status(account.account_id, "unsubscribed")
+        conn.commit()
+        second_mark = conn.execute(text("SELECT clock_timestamp()::timestamp")).scalar() + timedelta(microseconds=1)
+
+        changed = dbPanelManagementRepository.fetch_accounts_changed_between(first_mark, second_mark)
+        assert [a.status for a in changed if a.account_id == account.account_id] == ["unsubscribed"]
+
+
+def test_late_logins_are_fetched_by_ingestion_time(db_engine):
+    with db_engine.connect() as conn:
+        dbAccountRepository = DbAccountRepository(conn)
+        dbPanelManagementRepository = DbPanelManagementRepository(conn)
+
+        account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        conn.commit()
+        mark = conn.execute(text("SELECT clock_timestamp()::timestamp")).scalar()
+        conn.commit()
+
+        # A queued login event stored long after it happened, with a `created_at` behind the mark
+        login_id = uuid4()
+        dbAccountRepository.store_logins(
+            [
+                {
+                    "web_login_id": login_id,
+                    "account_id": account.account_id,
+                    "newsletter_id": None,
+                    "endpoint": "test",
+                    "data": {},
+                    "created_at": mark - timedelta(days=2),
+                }
+            ]
+        )
+        until = conn.execute(text("SELECT clock_timestamp()::timestamp")).scalar()
+
+        changed = dbPanelManagementRepository.fetch_web_logins_changed_between(mark, until)
+        assert [login.created_at for login in changed if login.account_id == account.account_id] == [
+            mark - timedelta(days=2)
+        ]
@@ -0,0 +1,138 @@
+import io
+import json
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from poprox_storage.repositories.data_stores.key_discovery import S3KeyDiscovery
+from tests import benchmark
+
+BUCKET = "test-bucket"
+
+
+class LocalS3ListingClient:
+    """Stand-in for the boto3 S3 client that pages through sorted keys like `list_objects_v2`"""
+
+    def __init__(self, objects: dict[str, datetime], page_size=1000):
+        self.objects = objects
+        self.page_size = page_size
+        self.list_calls = 0
+        self.stored = {}
+
+    def list_objects_v2(self, Bucket, Prefix, StartAfter=None, ContinuationToken=None):
+        self.list_calls += 1
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        after = ContinuationToken or StartAfter
+        start = bisect_right(keys, after) if after else 0
+        page = keys[start : start + self.page_size]
+
+        response = {
+            "Contents": [{"Key": k, "LastModified": self.objects[k]} for k in page],
+            "IsTruncated": start + self.page_size < len(keys),
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.stored:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.stored[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.stored[Key] = Body
+
+
+def _make_objects(count, start=0):
+    base = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    return {f"news/{n:08d}.json": base + timedelta(seconds=n) for n in range(start, start + count)}
+
+
+def test_listing_follows_continuation_tokens():
+    client = LocalS3ListingClient(_make_objects(2500))
+    discovery = S3KeyDiscovery(client, BUCKET)
+
+    keys = [obj["Key"] for obj in discovery.list_objects("news/")]
+
+    assert len(keys) == 2500
+    assert client.list_calls == 3
+
+
+def test_incremental_listing_only_returns_new_objects():
+    client = LocalS3ListingClient(_make_objects(2500))
+    discovery = S3KeyDiscovery(client, BUCKET)
+
+    objects, checkpoint = discovery.list_new_objects("news/", "news", ordered_keys=True)
+    assert len(objects) == 2500
+    discovery.save_checkpoint("news", checkpoint)
+    assert json.loads(client.stored["ingest-checkpoints/news.json"])["last_key"] == "news/00002499.json"
+
+    client.objects.update(_make_objects(10, start=2500))
+
+    for ordered_keys in (True, False):
+        objects, _ = discovery.list_new_objects("news/", "news", ordered_keys=ordered_keys)
+        assert [obj["Key"] for obj in objects] == [f"news/{n:08d}.json" for n in range(2500, 2510)]
+
+
+def test_objects_modified_in_the_same_second_are_listed_once():
+    second = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    client = LocalS3ListingClient({"news/a.json": second})
+    discovery = S3KeyDiscovery(client, BUCKET)
+
+    objects, checkpoint = discovery.list_new_objects("news/", "news")
+    assert [obj["Key"] for obj in objects] == ["news/a.json"]
+    discovery.save_checkpoint("news", checkpoint)
+
+    # Written later in the same second, after the first listing ran
+    client.objects["news/b.json"] = second
+    objects, checkpoint = discovery.list_new_objects("news/", "news")
+    assert [obj["Key"] for obj in objects] == ["news/b.json"]
+    discovery.save_checkpoint("news", checkpoint)
+
+    objects, _ = discovery.list_new_objects("news/", "news")
+    assert objects == []
+
+
+def test_overlap_catches_objects_stamped_before_the_mark():
+    mark = datetime(2024, 6, 1, 12, tzinfo=timezone.utc)
+    client = LocalS3ListingClient({"news/a.json": mark})
+    discovery = S3KeyDiscovery(client, BUCKET)
+    overlap = timedelta(hours=1)
+
+    objects, checkpoint = discovery.list_new_objects("news/", "news", overlap=overlap)
+    discovery.save_checkpoint("news", checkpoint)
+
+    # A multipart upload that started before the mark, but finished after the listing
+    client.objects["news/upload.json"] = mark - timedelta(minutes=10)
+    objects, _ = discovery.list_new_objects("news/", "news", overlap=overlap)
+    assert [obj["Key"] for obj in objects] == ["news/upload.json"]
+
+
+@benchmark
+def test_benchmark_incremental_listing_of_100k_keys():
+    client = LocalS3ListingClient(_make_objects(100_000))
+    discovery = S3KeyDiscovery(client, BUCKET)
+
+    start = time.perf_counter()
+    objects, checkpoint = discovery.list_new_objects("news/", "news", ordered_keys=True)
+    full_seconds = time.perf_counter() - start
+    full_calls = client.list_calls
+    discovery.save_checkpoint("news", checkpoint)
+
+    client.objects.update(_make_objects(50, start=100_000))
+    client.list_calls = 0
+
+    start = time.perf_counter()
+    new_objects, _ = discovery.list_new_objects("news/", "news", ordered_keys=True)
+    incremental_seconds = time.perf_counter() - start
+
+    print(
+        f"full listing: {len(objects)} keys, {full_calls} requests, {full_seconds:.3f}s; "
+        f"incremental: {len(new_objects)} keys, {client.list_calls} requests, {incremental_seconds:.3f}s"
+    )
+    assert len(objects) == 100_000
+    assert full_calls == 100
+    assert len(new_objects) == 50
+    assert client.list_calls == 1
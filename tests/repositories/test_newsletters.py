@@ -1,10 +1,13 @@
+from datetime import datetime, timedelta
 from uuid import UUID, uuid4, uuid5
 
 from poprox_concepts.domain import Article, ImpressedSection, Impression, Newsletter
+from poprox_storage.aws.s3 import S3
+from poprox_storage.repositories import newsletters
 from poprox_storage.repositories.accounts import DbAccountRepository
 from poprox_storage.repositories.articles import DbArticleRepository
 from poprox_storage.repositories.newsletters import DbNewsletterRepository
-from tests import clear_tables
+from tests import InMemoryS3Client, StubSession, captured_statements, clear_tables
 
 
 def generate_impression_id(newsletter_id: UUID, position: int, article_id: UUID):
@@ -197,3 +200,187 @@ def test_fetch_newsletter_by_id(db_engine):
 
         # Test invalid ID
         assert dbNewsletterRepository.fetch_newsletter(uuid4()) is None
+
+
+def test_json_and_query_hydration_agree(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "articles",
+        )
+
+        dbAccountRepository = DbAccountRepository(conn)
+        dbArticleRepository = DbArticleRepository(conn)
+        dbNewsletterRepository = DbNewsletterRepository(conn)
+
+        user_account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        article_ids = [
+            dbArticleRepository.store_article(Article(headline=f"headline-{n}", url=f"url-{n}")) for n in range(4)
+        ]
+        articles = dbArticleRepository.fetch_articles_by_id(article_ids)
+
+        newsletter_id = uuid4()
+        newsletter = Newsletter(
+            newsletter_id=newsletter_id,
+            account_id=user_account.account_id,
+            sections=[
+                ImpressedSection(
+                    title=f"section-{section}",
+                    impressions=[
+                        Impression(newsletter_id=newsletter_id, article=article)
+                        for article in articles[section * 2 : section * 2 + 2]
+                    ],
+                )
+                for section in range(2)
+            ]
+            # A section that didn't get any impressions
+            + [ImpressedSection(title="section-2", impressions=[])],
+            subject="fake-subject",
+            body_html="fake-html",
+        )
+        dbNewsletterRepository.store_newsletter(newsletter)
+
+        # A newsletter without any sections
+        empty = Newsletter(account_id=user_account.account_id, sections=[], subject="empty", body_html="")
+        dbNewsletterRepository.store_newsletter(empty)
+
+        from_queries = {n.newsletter_id: n for n in dbNewsletterRepository.fetch_newsletters([user_account])}
+        from_json = {
+            n.newsletter_id: n
+            for n in dbNewsletterRepository.fetch_newsletters_by_id([newsletter_id, empty.newsletter_id])
+        }
+
+        assert [section.title for section in from_json[newsletter_id].sections] == [
+            "section-0",
+            "section-1",
+            "section-2",
+        ]
+        assert from_json[newsletter_id].sections[2].impressions == []
+        assert [i.position for i in from_json[newsletter_id].impressions] == [1, 2, 3, 4]
+        assert from_json[empty.newsletter_id].sections == []
+        assert {k: v.model_dump() for k, v in from_json.items()} == {k: v.model_dump() for k, v in from_queries.items()}
+
+
+def test_fetch_most_recent_newsletters(db_engine):
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "articles",
+        )
+
+        dbAccountRepository = DbAccountRepository(conn)
+        dbArticleRepository = DbArticleRepository(conn)
+        dbNewsletterRepository = DbNewsletterRepository(conn)
+
+        article_id = dbArticleRepository.store_article(Article(headline="headline", url="url"))
+        [article] = dbArticleRepository.fetch_articles_by_id([article_id])
+
+        accounts = [
+            dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test") for _ in range(3)
+        ]
+
+        latest_ids = {}
+        for account in accounts[:2]:
+            for _ in range(2):
+                newsletter_id = uuid4()
+                dbNewsletterRepository.store_newsletter(
+                    Newsletter(
+                        newsletter_id=newsletter_id,
+                        account_id=account.account_id,
+                        sections=[
+                            ImpressedSection(impressions=[Impression(newsletter_id=newsletter_id, article=article)])
+                        ],
+                        subject="fake-subject",
+                        body_html="fake-html",
+                    )
+                )
+                latest_ids[account.account_id] = newsletter_id
+
+        since = datetime.now() - timedelta(days=1)
+        account_ids = [a.account_id for a in accounts]
+        with captured_statements(conn) as statements:
+            latest = dbNewsletterRepository.fetch_most_recent_newsletters(account_ids, since)
+        assert len(statements) == 1
+
+        # Past the JSON threshold, the same newsletters come from set-based queries
+        from_queries = dbNewsletterRepository.fetch_most_recent_newsletters(account_ids, since, json_max_newsletters=0)
+        assert {k: v.model_dump() for k, v in from_queries.items()} == {k: v.model_dump() for k, v in latest.items()}
+
+        assert set(latest) == {accounts[0].account_id, accounts[1].account_id}
+        for account_id, newsletter in latest.items():
+            assert newsletter.newsletter_id == latest_ids[account_id]
+            assert (
+                newsletter.newsletter_id
+                == dbNewsletterRepository.fetch_most_recent_newsletter(account_id, since).newsletter_id
+            )
+            assert len(newsletter.impressions) == 1
+
+        assert dbNewsletterRepository.fetch_most_recent_newsletters([], since) == {}
+
+
+def test_newsletter_html_stored_in_s3(db_engine, monkeypatch):
+    client = InMemoryS3Client()
+    monkeypatch.setattr(newsletters, "s3", S3(StubSession(client)))
+
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "impressions",
+            "clicks",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+        )
+
+        dbAccountRepository = DbAccountRepository(conn)
+        dbNewsletterRepository = DbNewsletterRepository(conn)
+        newsletters_table = dbNewsletterRepository.tables["newsletters"]
+
+        account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        html = "<html>" + "<p>Today's news</p>" * 1000 + "</html>"
+
+        inline = Newsletter(account_id=account.account_id, sections=[], subject="inline", body_html=html)
+        dbNewsletterRepository.store_newsletter(inline)
+        assert client.objects == {}
+
+        monkeypatch.setattr(newsletters, "NEWSLETTER_HTML_BUCKET", "bucket")
+        external = Newsletter(account_id=account.account_id, sections=[], subject="external", body_html=html)
+        dbNewsletterRepository.store_newsletter(external)
+        assert len(client.objects) == 1
+
+        row = conn.execute(
+            newsletters_table.select().where(newsletters_table.c.newsletter_id == external.newsletter_id)
+        ).fetchone()
+        assert row.html is None
+        assert row.html_ref.startswith("s3://bucket/newsletter-html/")
+
+        for newsletter in (inline, external):
+            assert dbNewsletterRepository.fetch_newsletter_html(newsletter.newsletter_id) == html
+
+        since = datetime.now() - timedelta(days=1)
+        assert dbNewsletterRepository.fetch_most_recent_newsletter(account.account_id, since).body_html == ""
+        assert (
+            dbNewsletterRepository.fetch_most_recent_newsletter(account.account_id, since, include_html=True).body_html
+            == html
+        )
+
+        # Empty HTML has nothing to move, so it's skipped rather than picked up by every batch
+        empty = Newsletter(account_id=account.account_id, sections=[], subject="empty", body_html="")
+        dbNewsletterRepository.store_newsletter(empty)
+
+        # Identical HTML is stored once, so the backfill reuses the existing object
+        assert dbNewsletterRepository.backfill_newsletter_html(batch_size=1) == 1
+        assert len(client.objects) == 1
+        assert dbNewsletterRepository.fetch_newsletter_html(inline.newsletter_id) == html
@@ -0,0 +1,101 @@
+import json
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from poprox_storage.repositories.data_stores.parquet import NULL_PARTITION
+from tests import LocalParquetRepository
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+ds = pytest.importorskip("pyarrow.dataset")
+
+
+def _click_records(days=3, clicks_per_day=50, groups=("a", "b")):
+    start = datetime(2024, 6, 1, 9)
+    records = []
+    for day in range(days):
+        for n in range(clicks_per_day):
+            records.append(
+                {
+                    "account_id": str(uuid4()),
+                    "group_id": groups[n % len(groups)],
+                    "created_at": start + timedelta(days=day, minutes=n),
+                    "context": {"section": "top"},
+                }
+            )
+    return records
+
+
+def test_dataset_is_hive_partitioned(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = _click_records()
+
+    manifest = repo._write_records_as_parquet_dataset(
+        records, "bucket", "clicks", datetime(2024, 6, 4), partition_by=["date", "group_id"]
+    )
+
+    assert manifest.root == "clicks_20240604-000000"
+    assert manifest.num_rows == len(records)
+    assert len(manifest.files) == 6
+    assert {f.key.split("/")[1] for f in manifest.files} == {"date=2024-06-01", "date=2024-06-02", "date=2024-06-03"}
+
+    written = json.loads((tmp_path / "bucket" / manifest.key).read_text())
+    assert written["num_rows"] == len(records)
+    assert len(written["files"]) == 6
+
+    dataset = ds.dataset(
+        str(tmp_path / "bucket" / manifest.root),
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("date", pa.string()), ("group_id", pa.string())]), flavor="hive"),
+        exclude_invalid_files=True,
+    )
+    table = dataset.to_table(filter=(ds.field("date") == "2024-06-02") & (ds.field("group_id") == "a"))
+    assert table.num_rows == 25
+    assert json.loads(table.column("context")[0].as_py()) == {"section": "top"}
+
+
+def test_large_partitions_are_split_across_files(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = _click_records(days=1, clicks_per_day=1000, groups=("a",))
+
+    manifest = repo._write_records_as_parquet_dataset(
+        records, "bucket", "clicks", partition_by=["group_id"], target_file_bytes=16 * 1024, max_workers=4
+    )
+
+    assert len(manifest.files) > 1
+    assert sum(f.num_rows for f in manifest.files) == 1000
+    assert all(f.partition == {"group_id": "a"} for f in manifest.files)
+    assert all((tmp_path / "bucket" / f.key).stat().st_size == f.num_bytes for f in manifest.files)
+
+
+def test_missing_partition_values_use_default_partition(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = [{"account_id": "1", "group_id": None}, {"account_id": "2", "group_id": "a"}]
+
+    manifest = repo._write_records_as_parquet_dataset(
+        records, "bucket", "assignments", partition_by=["group_id"], date_column=None
+    )
+
+    assert sorted(f.partition["group_id"] for f in manifest.files) == [NULL_PARTITION, "a"]
+
+
+def test_date_partition_needs_a_date_column(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = [{"account_id": "1", "group_id": "a"}]
+
+    with pytest.raises(ValueError, match="date_column"):
+        repo._write_records_as_parquet_dataset(
+            records, "bucket", "assignments", partition_by=["date"], date_column=None
+        )
+    assert not (tmp_path / "bucket").exists()
+
+
+def test_single_file_export_is_unchanged_without_partitioning(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+
+    file_name = repo._store_records_as_parquet(_click_records(days=1), "bucket", "clicks", datetime(2024, 6, 4))
+
+    assert file_name == "clicks_20240604-000000.parquet"
+    assert pq.read_table(str(tmp_path / "bucket" / file_name)).num_rows == 50
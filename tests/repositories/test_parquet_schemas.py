@@ -0,0 +1,138 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from poprox_storage.repositories.articles import ARTICLES_SCHEMA, MENTIONS_SCHEMA, PACKAGES_SCHEMA
+from poprox_storage.repositories.clicks import CLICKS_SCHEMA
+from poprox_storage.repositories.data_stores.parquet import SCHEMA_METADATA_KEY
+from poprox_storage.repositories.newsletters import NEWSLETTER_IMPRESSIONS_SCHEMA
+from poprox_storage.repositories.panel_management import ACCOUNTS_SCHEMA
+from poprox_storage.repositories.panel_management import CLICKS_SCHEMA as PANEL_CLICKS_SCHEMA
+from tests import LocalParquetRepository, benchmark
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _impression_records(newsletters=2000, impressions=10):
+    """Rows shaped like `newsletters.extract_and_flatten`, one per impression"""
+    accounts = [str(uuid4()) for _ in range(newsletters // 10)]
+    records = []
+    for n in range(newsletters):
+        newsletter = {
+            "account_id": accounts[n % len(accounts)],
+            "newsletter_id": str(uuid4()),
+            "created_at": datetime(2024, 6, 1) + timedelta(minutes=n),
+            "newsletter_feedback": "None",
+            "recommender_name": "nrms",
+            "recommender_version": "1.2.0",
+            "recommender_hash": "4f7d2a9c",
+        }
+        for position in range(impressions):
+            records.append(
+                {
+                    **newsletter,
+                    "section_id": "",
+                    "section_title": "Top Stories" if position < 3 else "For You",
+                    "section_flavor": "",
+                    "section_personalized": str(position >= 3),
+                    "section_seed_entity_id": "",
+                    "section_position": 0 if position < 3 else 1,
+                    "article_id": str(uuid4()),
+                    "label": ["U.S. News", "Politics", "Sports", "Business", "Science"][position % 5],
+                    "headline": f"Headline for article {n}-{position}",
+                    "subhead": f"A somewhat longer subhead describing article {n}-{position} in a sentence",
+                    "article_preview_image_id": str(uuid4()),
+                    "position": position,
+                    "impression_feedback": "None",
+                }
+            )
+    return records
+
+
+def test_declared_schemas_build_without_records():
+    for schema in (ARTICLES_SCHEMA, MENTIONS_SCHEMA, PACKAGES_SCHEMA, CLICKS_SCHEMA, NEWSLETTER_IMPRESSIONS_SCHEMA):
+        arrow_schema = schema.arrow_schema()
+        assert arrow_schema.names == list(schema.fields)
+        assert set(schema.dictionary) <= set(schema.fields)
+        assert arrow_schema.metadata[SCHEMA_METADATA_KEY] == schema.label.encode()
+
+
+def test_declared_types_are_stable_across_runs(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+
+    # Nothing but nulls in `subsource`, which inference would leave out entirely
+    records = [
+        {
+            "account_id": str(uuid4()),
+            "internal": 0,
+            "external": 1,
+            "status": "subscribed",
+            "source": "web",
+            "subsource": None,
+            "created_at": datetime(2024, 6, 1),
+        }
+    ]
+    file_name = repo._write_records_as_parquet(records, "bucket", "accounts", schema=ACCOUNTS_SCHEMA)
+
+    table = pq.read_table(str(tmp_path / "bucket" / file_name))
+    assert table.schema.names == list(ACCOUNTS_SCHEMA.fields)
+    assert table.schema.field("subsource").type == pa.string()
+    assert table.schema.metadata[SCHEMA_METADATA_KEY] == b"panel_accounts/v1"
+
+    metadata = pq.ParquetFile(str(tmp_path / "bucket" / file_name)).metadata
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+
+def test_iso_timestamps_are_parsed_and_extra_columns_inferred(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = [
+        {"account_id": "a", "newsletter_id": "n", "created_at": "2024-06-01T09:30:00", "experiment_arm": 2},
+        {"account_id": "b", "newsletter_id": "", "created_at": "2024-06-02T10:00:00"},
+    ]
+
+    file_name = repo._write_records_as_parquet(records, "bucket", "clicks", schema=PANEL_CLICKS_SCHEMA)
+
+    table = pq.read_table(str(tmp_path / "bucket" / file_name))
+    assert table.schema.field("created_at").type == pa.timestamp("us")
+    assert table.column("created_at")[0].as_py() == datetime(2024, 6, 1, 9, 30)
+    assert table.schema.names[-1] == "experiment_arm"
+    assert table.column("experiment_arm").to_pylist() == [2, None]
+
+
+def test_declared_schema_writes_smaller_files(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = _impression_records(newsletters=100)
+
+    sizes = {}
+    for label, schema in (("inferred", None), ("declared", NEWSLETTER_IMPRESSIONS_SCHEMA)):
+        file_name = repo._write_records_as_parquet(records, "bucket", label, datetime(2024, 6, 1), schema=schema)
+        sizes[label] = (tmp_path / "bucket" / file_name).stat().st_size
+
+    assert sizes["declared"] < sizes["inferred"]
+
+
+@benchmark
+def test_benchmark_declared_schema_against_inferred(tmp_path):
+    repo = LocalParquetRepository(tmp_path)
+    records = _impression_records()
+
+    results = {}
+    for label, schema in (("inferred", None), ("declared", NEWSLETTER_IMPRESSIONS_SCHEMA)):
+        timings = []
+        for run in range(3):
+            start = time.perf_counter()
+            file_name = repo._write_records_as_parquet(
+                records, "bucket", f"{label}-{run}", datetime(2024, 6, 1), schema=schema
+            )
+            timings.append(time.perf_counter() - start)
+        results[label] = ((tmp_path / "bucket" / file_name).stat().st_size, statistics.median(timings))
+
+    summaries = [
+        f"{label} {size / 1024:.0f}KiB in {seconds * 1000:.0f}ms" for label, (size, seconds) in results.items()
+    ]
+    print(f"{len(records)} impression rows: {'; '.join(summaries)}")
+    assert results["declared"][0] < results["inferred"][0]
@@ -0,0 +1,122 @@
+import statistics
+import time
+from datetime import date, datetime
+from uuid import uuid4
+
+from sqlalchemy import text
+
+from poprox_concepts.domain import Account, Article
+from poprox_storage.repositories.accounts import DbAccountRepository
+from poprox_storage.repositories.articles import DbArticleRepository
+from poprox_storage.repositories.clicks import DbClicksRepository
+from poprox_storage.repositories.data_stores.partitions import create_monthly_partitions, ensure_future_partitions
+from tests import benchmark, captured_statements, clear_tables, explain, plan_relations
+
+
+def _setup(conn):
+    clear_tables(conn, "clicks", "web_logins")
+    for table in ("clicks", "web_logins"):
+        create_monthly_partitions(conn, table, date(2020, 1, 1), date(2024, 12, 1))
+
+    account = DbAccountRepository(conn).store_new_account(email=f"{uuid4()}@example.com", source="test")
+    article_id = DbArticleRepository(conn).store_article(Article(headline="headline", url=f"url-{uuid4()}"))
+    conn.commit()
+    return Account(account_id=account.account_id, email=account.email, status="", source="test"), article_id
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    year, index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return month.replace(year=year, month=index + 1)
+
+
+def _store_monthly_clicks(conn, account_id, article_id, first_month: datetime, months: int, clicks_per_month: int):
+    conn.execute(
+        text(
+            """
+            INSERT INTO clicks (account_id, article_id, created_at)
+            SELECT :account_id, :article_id, month + (n % 28) * interval '1 day' + n * interval '1 second'
+            FROM generate_series(:first_month, :last_month, interval '1 month') AS month,
+                 generate_series(1, :clicks_per_month) AS n
+            """
+        ),
+        {
+            "account_id": account_id,
+            "article_id": article_id,
+            "first_month": first_month,
+            "last_month": _add_months(first_month, months - 1),
+            "clicks_per_month": clicks_per_month,
+        },
+    )
+    conn.execute(text("ANALYZE clicks"))
+    conn.commit()
+
+
+def test_ensure_future_partitions_is_idempotent(db_engine):
+    with db_engine.connect() as conn:
+        ensure_future_partitions(conn)
+        assert ensure_future_partitions(conn) == []
+
+        this_month = f"clicks_{datetime.now():%Y_%m}"
+        assert conn.execute(text("SELECT to_regclass(:name)"), {"name": this_month}).scalar() == this_month
+
+
+def test_date_window_queries_only_scan_matching_partitions(db_engine):
+    with db_engine.connect() as conn:
+        account, article_id = _setup(conn)
+        dbAccountRepository = DbAccountRepository(conn)
+        dbClicksRepository = DbClicksRepository(conn)
+
+        dbClicksRepository.store_click(None, account.account_id, article_id, created_at="2024-06-20 09:55:22")
+        start_time, end_time = datetime(2024, 6, 13), datetime(2024, 7, 15)
+
+        with captured_statements(conn) as statements:
+            clicks = dbClicksRepository.fetch_clicks_between(start_time, end_time, [account])
+            dbClicksRepository.fetch_clicks_on_newsletters_between(start_time, end_time, [account])
+            dbAccountRepository.fetch_logins_between(start_time, end_time)
+
+        assert len(clicks[account.account_id]) == 1
+        assert len(statements) == 3
+
+        click_plans = [explain(conn, *statement) for statement in statements[:2]]
+        for plan in click_plans:
+            scanned = {name for name in plan_relations(plan) if name.startswith("clicks")}
+            assert scanned <= {"clicks_2024_06", "clicks_2024_07"}
+
+        login_plan = explain(conn, *statements[2])
+        assert plan_relations(login_plan) <= {"web_logins_2024_06", "web_logins_2024_07"}
+
+
+@benchmark
+def test_benchmark_window_latency_as_history_grows(db_engine):
+    with db_engine.connect() as conn:
+        account, article_id = _setup(conn)
+        dbClicksRepository = DbClicksRepository(conn)
+
+        # Add history backwards from the end of 2024, so the queried week stays the same
+        start_time, end_time = datetime(2024, 12, 1), datetime(2024, 12, 8)
+        stored_months = 0
+        results = []
+        for months in (6, 24, 60):
+            first_month = _add_months(datetime(2024, 12, 1), 1 - months)
+            _store_monthly_clicks(conn, account.account_id, article_id, first_month, months - stored_months, 2000)
+            stored_months = months
+
+            timings = []
+            for _ in range(5):
+                start = time.perf_counter()
+                dbClicksRepository.fetch_clicks_between(start_time, end_time, [account])
+                timings.append(time.perf_counter() - start)
+
+            with captured_statements(conn) as statements:
+                dbClicksRepository.fetch_clicks_between(start_time, end_time, [account])
+            scanned = plan_relations(explain(conn, *statements[0]))
+            results.append((months, statistics.median(timings), scanned))
+
+        print(
+            "; ".join(
+                f"{months} months of history: {seconds * 1000:.1f}ms, scanned {sorted(scanned)}"
+                for months, seconds, scanned in results
+            )
+        )
+        # The same partition is scanned no matter how much history there is
+        assert all(scanned == {"clicks_2024_12"} for _, _, scanned in results)
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from poprox_concepts.domain import Account
+from poprox_storage.repositories.account_interest_log import DbAccountInterestRepository
+from poprox_storage.repositories.accounts import DbAccountRepository
+from poprox_storage.repositories.articles import DbArticleRepository
+from poprox_storage.repositories.clicks import DbClicksRepository
+from poprox_storage.repositories.experiments import DbExperimentRepository
+from poprox_storage.repositories.newsletters import DbNewsletterRepository
+from poprox_storage.repositories.qualtrics_survey import DbQualtricsSurveyRepository
+from tests import captured_statements, clear_tables
+from tests.query_plans import (
+    SEEDED_TABLES,
+    check_plans,
+    load_expectations,
+    measure_index_benefit,
+    remove_seeded_rows,
+    report_cost_deltas,
+    seed_database,
+)
+
+EXPECTATIONS = load_expectations()
+
+
+@pytest.fixture(scope="module")
+def seeded(db_engine):
+    """A connection to the seeded database, along with a sample of the seeded ids"""
+    with db_engine.connect() as conn:
+        clear_tables(conn, *SEEDED_TABLES)
+        source = seed_database(conn)
+
+        sample = {}
+        sample["accounts"] = [
+            Account(account_id=row.account_id, email=row.email, status="", source=source)
+            for row in conn.execute(
+                text("SELECT account_id, email FROM accounts WHERE source = :source LIMIT 10"), {"source": source}
+            )
+        ]
+        articles = conn.execute(
+            text("SELECT article_id, external_id, url FROM articles WHERE source = :source LIMIT 10"),
+            {"source": source},
+        ).fetchall()
+        sample["article_ids"] = [row.article_id for row in articles]
+        sample["external_ids"] = [row.external_id for row in articles]
+        sample["url"] = articles[0].url
+        sample["newsletter_ids"] = (
+            conn.execute(
+                text("SELECT newsletter_id FROM newsletters WHERE account_id = :account_id LIMIT 10"),
+                {"account_id": sample["accounts"][0].account_id},
+            )
+            .scalars()
+            .all()
+        )
+
+        sample["group_id"] = conn.execute(
+            text(
+                "SELECT group_id FROM expt_groups JOIN experiments USING (experiment_id) "
+                "WHERE description = :source LIMIT 1"
+            ),
+            {"source": source},
+        ).scalar()
+
+        yield conn, sample
+        remove_seeded_rows(conn, source)
+        clear_tables(conn, *SEEDED_TABLES)
+        conn.commit()
+
+
+# Each case runs one repository method; its expected plan is in tests/data/query_plans.toml
+CASES = {
+    "fetch_article_by_url": lambda conn, sample: DbArticleRepository(conn).fetch_article_by_url(sample["url"]),
+    "fetch_articles_by_external_ids": lambda conn, sample: DbArticleRepository(conn).fetch_articles_by_external_ids(
+        sample["external_ids"]
+    ),
+    "fetch_mentions_by_article_ids": lambda conn, sample: DbArticleRepository(conn).fetch_mentions_by_article_ids(
+        sample["article_ids"]
+    ),
+    "fetch_newsletter": lambda conn, sample: DbNewsletterRepository(conn).fetch_newsletter(sample["newsletter_ids"][0]),
+    "fetch_newsletters": lambda conn, sample: DbNewsletterRepository(conn).fetch_newsletters(sample["accounts"]),
+    "fetch_most_recent_newsletters": lambda conn, sample: DbNewsletterRepository(conn).fetch_most_recent_newsletters(
+        [account.account_id for account in sample["accounts"]], datetime(2024, 6, 1)
+    ),
+    "fetch_clicks_by_newsletter_ids": lambda conn, sample: DbClicksRepository(conn).fetch_clicks_by_newsletter_ids(
+        sample["newsletter_ids"]
+    ),
+    "fetch_clicks_between": lambda conn, sample: DbClicksRepository(conn).fetch_clicks_between(
+        datetime(2024, 3, 1), datetime(2024, 6, 1), sample["accounts"]
+    ),
+    "fetch_logins_between": lambda conn, sample: DbAccountRepository(conn).fetch_logins_between(
+        datetime(2024, 3, 1), datetime(2024, 6, 1), sample["accounts"]
+    ),
+    "fetch_articles_since": lambda conn, sample: DbArticleRepository(conn).fetch_articles_since(1),
+    "fetch_articles_ingested_between": lambda conn, sample: DbArticleRepository(conn).fetch_articles_ingested_between(
+        datetime(2024, 6, 1), datetime(2024, 6, 2)
+    ),
+    "fetch_account_interests": lambda conn, sample: DbAccountInterestRepository(conn).fetch_account_interests(
+        sample["accounts"][0].account_id
+    ),
+    "fetch_topic_preference_history": lambda conn, sample: DbAccountInterestRepository(
+        conn
+    ).fetch_topic_preference_history(sample["accounts"][0].account_id),
+    # The shared query behind fetch_active_expt_assignments and fetch_assignments_by_experiment_id
+    "fetch_assignments_by_group_ids": lambda conn, sample: DbExperimentRepository(conn)._fetch_assignments_by_group_ids(
+        [sample["group_id"]]
+    ),
+    "fetch_assignments_between": lambda conn, sample: DbExperimentRepository(conn).fetch_assignments_between(
+        datetime(2024, 1, 1), datetime.now() + timedelta(days=1), sample["accounts"]
+    ),
+    "fetch_sent_survey_instances": lambda conn, sample: DbQualtricsSurveyRepository(conn).fetch_sent_survey_instances(
+        sample["accounts"]
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def plan_reports(request):
+    """Collects each case's plan report, and shows (and optionally saves) all of their costs once they've run"""
+    reports = []
+    yield reports
+
+    if reports:
+        terminal = request.config.pluginmanager.get_plugin("terminalreporter")
+        summary = report_cost_deltas(reports)
+        if terminal is not None:
+            terminal.write_sep("-", "query plan costs")
+            terminal.write_line(summary)
+
+
+def test_every_case_has_expectations():
+    assert set(CASES) == set(EXPECTATIONS["cases"])
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_query_plan(seeded, plan_reports, case):
+    conn, sample = seeded
+
+    with captured_statements(conn) as statements:
+        CASES[case](conn, sample)
+    assert statements, f"{case} didn't run any queries"
+
+    report = check_plans(conn, case, statements, EXPECTATIONS)
+    plan_reports.append(report)
+
+    assert report.problems == [], f"{case}: {'; '.join(report.problems)}"
+
+
+@pytest.mark.parametrize("case", sorted(case for case in CASES if EXPECTATIONS["cases"][case].get("indexes")))
+def test_index_benefit(seeded, case):
+    conn, sample = seeded
+
+    with captured_statements(conn) as statements:
+        CASES[case](conn, sample)
+
+    expected = EXPECTATIONS["cases"][case]
+    min_benefit = expected.get("min_index_benefit", EXPECTATIONS["min_index_benefit"])
+    for index in expected["indexes"]:
+        benefit = measure_index_benefit(conn, statements, index)
+        assert benefit.cost_ratio >= min_benefit, f"{case}: {benefit} is less than {min_benefit}x"
@@ -0,0 +1,77 @@
+import time
+from threading import Barrier, Lock
+
+from poprox_storage.repositories.data_stores.s3 import S3Repository
+from tests import benchmark
+
+
+class SlowS3Repository(S3Repository):
+    """Serves objects from memory after a fixed delay, failing some keys a set number of times"""
+
+    def __init__(self, objects, delay=0.05, failures=None, barrier=None):
+        super().__init__("test-bucket")
+        self.objects = objects
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.barrier = barrier
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = Lock()
+
+    def fetch_file_contents(self, key):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.barrier is not None:
+                self.barrier.wait()
+            time.sleep(self.delay)
+            with self._lock:
+                if self.failures.get(key, 0) > 0:
+                    self.failures[key] -= 1
+                    raise ConnectionError(f"transient failure fetching {key}")
+            return self.objects[key]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def test_fetch_many_retries_and_isolates_errors():
+    objects = {f"file-{n}": str(n) for n in range(20)}
+    repo = SlowS3Repository(objects, delay=0, failures={"file-3": 1, "file-7": 5})
+
+    results = {r.key: r for r in repo.fetch_many(objects, int, max_workers=4, backoff_seconds=0)}
+
+    assert len(results) == 20
+    assert results["file-3"].ok
+    assert results["file-3"].value == 3
+    assert results["file-3"].attempts == 2
+    assert not results["file-7"].ok
+    assert isinstance(results["file-7"].error, ConnectionError)
+    assert results["file-7"].attempts == 3
+    assert sum(r.value for r in results.values() if r.ok) == sum(range(20)) - 7
+
+
+def test_fetch_many_runs_max_workers_fetches_at_once():
+    objects = {f"file-{n}": str(n) for n in range(32)}
+    # Each fetch waits until 8 are in flight, so they fail (with BrokenBarrierError) unless they overlap
+    repo = SlowS3Repository(objects, delay=0, barrier=Barrier(8, timeout=5))
+
+    results = list(repo.fetch_many(objects, max_workers=8, max_attempts=1))
+
+    assert all(r.ok for r in results)
+    assert repo.max_in_flight == 8
+
+
+@benchmark
+def test_benchmark_fetch_many_overlaps_downloads():
+    objects = {f"file-{n}": str(n) for n in range(32)}
+
+    timings = {}
+    for workers in (1, 8):
+        repo = SlowS3Repository(objects, delay=0.02)
+        start = time.perf_counter()
+        assert len(list(repo.fetch_many(objects, max_workers=workers))) == 32
+        timings[workers] = time.perf_counter() - start
+
+    print(f"1 worker: {timings[1]:.3f}s; 8 workers: {timings[8]:.3f}s")
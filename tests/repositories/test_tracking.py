@@ -0,0 +1,90 @@
+from uuid import uuid4
+
+from poprox_concepts.api.tracking import LoginLinkData
+from poprox_concepts.domain import Article, Newsletter
+from poprox_storage.aws import queues
+from poprox_storage.aws.sqs import LocalSQS
+from poprox_storage.repositories.accounts import DbAccountRepository
+from poprox_storage.repositories.articles import DbArticleRepository
+from poprox_storage.repositories.clicks import DbClicksRepository
+from poprox_storage.repositories.newsletters import DbNewsletterRepository
+from poprox_storage.repositories.tracking import TrackingEventConsumer
+from tests import clear_tables
+
+QUEUE_URL = "local://tracking-events"
+
+
+def test_queued_clicks_and_logins_are_stored_once(db_engine, monkeypatch):
+    queue = LocalSQS()
+    monkeypatch.setattr(queues, "sqs", queue)
+    monkeypatch.setattr(queues, "TRACKING_EVENTS_QUEUE_URL", QUEUE_URL)
+
+    with db_engine.connect() as conn:
+        clear_tables(
+            conn,
+            "clicks",
+            "web_logins",
+            "impressions",
+            "impressed_sections",
+            "section_types",
+            "newsletters",
+            "article_placements",
+            "articles",
+        )
+
+        dbAccountRepository = DbAccountRepository(conn)
+        dbArticleRepository = DbArticleRepository(conn)
+        dbNewsletterRepository = DbNewsletterRepository(conn)
+        dbClicksRepository = DbClicksRepository(conn)
+
+        user_account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        article_id = dbArticleRepository.store_article(Article(headline="headline-1", url="url-1"))
+        newsletter = Newsletter(account_id=user_account.account_id, sections=[], subject="", body_html="")
+        dbNewsletterRepository.store_newsletter(newsletter)
+
+        for _ in range(12):
+            queues.enqueue_click(newsletter.newsletter_id, user_account.account_id, article_id)
+        queues.enqueue_login(
+            LoginLinkData(account_id=user_account.account_id, endpoint="test", data={"source": "email"})
+        )
+
+        # Simulate SQS delivering one of the clicks a second time
+        duplicate = queue.queued_messages(QUEUE_URL)[0]["Body"]
+        queue.send_message(QUEUE_URL, duplicate)
+
+        consumer = TrackingEventConsumer(queue, QUEUE_URL, dbClicksRepository, dbAccountRepository, batch_size=5)
+        totals = consumer.drain()
+
+        assert totals == {"clicks": 12, "logins": 1, "duplicates": 1, "invalid": 0}
+        assert queue.queued_messages(QUEUE_URL) == []
+
+        clicks = dbClicksRepository.fetch_clicks_by_newsletter_ids([newsletter.newsletter_id])
+        assert len(clicks[user_account.account_id]) == 12
+
+
+def test_poison_events_are_left_on_the_queue(db_engine, monkeypatch):
+    queue = LocalSQS()
+    monkeypatch.setattr(queues, "sqs", queue)
+    monkeypatch.setattr(queues, "TRACKING_EVENTS_QUEUE_URL", QUEUE_URL)
+
+    with db_engine.connect() as conn:
+        clear_tables(conn, "clicks", "web_logins")
+
+        dbAccountRepository = DbAccountRepository(conn)
+        dbClicksRepository = DbClicksRepository(conn)
+
+        user_account = dbAccountRepository.store_new_account(email=f"{uuid4()}@example.com", source="test")
+        for _ in range(3):
+            queues.enqueue_login(LoginLinkData(account_id=user_account.account_id, endpoint="test", data={}))
+        # A click on an article that doesn't exist, which fails the whole batch insert
+        poison_id = queues.enqueue_click(None, user_account.account_id, uuid4())
+        # A message that parses as JSON but isn't an event
+        queue.send_message(QUEUE_URL, "null")
+
+        consumer = TrackingEventConsumer(queue, QUEUE_URL, dbClicksRepository, dbAccountRepository, batch_size=10)
+        totals = consumer.drain(max_batches=1)
+
+        assert totals == {"clicks": 0, "logins": 3, "duplicates": 0, "invalid": 2}
+        remaining = [message["Body"] for message in queue.queued_messages(QUEUE_URL)]
+        assert len(remaining) == 2
+        assert any(str(poison_id) in body for body in remaining)